@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+"""
+Occupancy and revenue analytics for dock rental app
+
+Bookings are rolled up by (slip, month, status, payment status) into booking_rollups.
+A stay's nights are split across the months they fall in, with its revenue pro-rated
+by nights; the booking itself counts once, in its check-in month. Writers refresh
+only the (slip, month) groups they touched, inside their own transaction, so dashboard
+queries aggregate the small rollup table instead of scanning the bookings history.
+Rollups count archived bookings too (see archive.py).
+"""
+
+import calendar
+import threading
+from datetime import date, datetime
+from sqlalchemy import select, delete, insert, func, case, union_all
+from database import Slip, Booking, ArchivedBooking, BookingRollup, INACTIVE_STATUSES
+from availability import booking_nights
+
+# Bookings read per round trip while aggregating
+AGGREGATE_BATCH_SIZE = 5000
+
+# API name -> rollup column for the groupBy parameter
+GROUP_COLUMNS = {
+    'slip': BookingRollup.slip_id,
+    'month': BookingRollup.month,
+    'status': BookingRollup.status,
+    'paymentStatus': BookingRollup.payment_status,
+}
+GROUP_KEYS = {'slip': 'slipId', 'month': 'month', 'status': 'status', 'paymentStatus': 'paymentStatus'}
+
+# Columns of the bookings CSV export
+EXPORT_COLUMNS = (
+    ('id', Booking.id),
+    ('slipId', Booking.slip_id),
+    ('slipName', Slip.name),
+    ('checkIn', Booking.check_in),
+    ('checkOut', Booking.check_out),
+    ('nights', Booking.nights),
+    ('totalCost', Booking.total_cost),
+    ('status', Booking.status),
+    ('paymentStatus', Booking.payment_status),
+    ('userType', Booking.user_type),
+    ('bookingDate', Booking.booking_date),
+)
+
+_seeded = False
+_seed_lock = threading.Lock()
+
+
+def month_start(month):
+    return datetime.strptime(month, '%Y-%m')
+
+
+def next_month(month):
+    start = month_start(month)
+    return datetime(start.year + start.month // 12, start.month % 12 + 1, 1)
+
+
+def check_months(*months):
+    """Raise ValueError unless every given month is 'YYYY-MM'"""
+    for month in months:
+        if month:
+            try:
+                month_start(month)
+            except ValueError:
+                raise ValueError(f'Invalid month {month!r}, expected YYYY-MM') from None
+
+
+def months_between(first, last):
+    """Every 'YYYY-MM' from first to last inclusive"""
+    months = []
+    while first <= last:
+        months.append(first)
+        first = next_month(first).strftime('%Y-%m')
+    return months
+
+
+def month_spans(first, last):
+    """Split nights [first, last) into ('YYYY-MM', nights) pieces"""
+    spans = []
+    while first < last:
+        piece_end = min(last, date(first.year + first.month // 12, first.month % 12 + 1, 1))
+        spans.append((first.strftime('%Y-%m'), (piece_end - first).days))
+        first = piece_end
+    return spans
+
+
+def booking_slip_months(slip_id, check_in, check_out):
+    """The rollup groups a booking's nights fall in, as a {(slip_id, month)} set"""
+    return {(slip_id, month) for month, _ in month_spans(*booking_nights(check_in, check_out))}
+
+
+def _aggregate(db, slip_ids=None, months=None):
+    """Rollup row dicts of live and archived bookings, optionally limited to some slips and months"""
+    sources = []
+    for model in (Booking, ArchivedBooking):
+        source = select(model.slip_id, model.check_in, model.check_out, model.status, model.payment_status,
+                        model.total_cost)
+        if slip_ids is not None:
+            source = source.where(model.slip_id.in_(slip_ids))
+        if months is not None:
+            # Stays overlapping the month range; the slip/dates indexes serve this
+            source = source.where(
+                model.check_in < next_month(max(months)),
+                model.check_out > month_start(min(months))
+            )
+        sources.append(source)
+    groups = {}
+    rows = db.execute(union_all(*sources).execution_options(yield_per=AGGREGATE_BATCH_SIZE))
+    for slip_id, check_in, check_out, status, payment_status, total_cost in rows:
+        spans = month_spans(*booking_nights(check_in, check_out))
+        stay_nights = sum(nights for _, nights in spans)
+        for index, (month, nights) in enumerate(spans):
+            if months is not None and month not in months:
+                continue
+            group = groups.setdefault((slip_id, month, status or '', payment_status or ''), [0, 0, 0.0])
+            # Counted in the check-in month only, so totals over months are real booking counts
+            group[0] += 1 if index == 0 else 0
+            group[1] += nights
+            group[2] += (total_cost or 0.0) * nights / stay_nights
+    now = datetime.utcnow()
+    return [
+        {'slip_id': slip_id, 'month': month, 'status': status, 'payment_status': payment_status,
+         'bookings': bookings, 'nights': nights, 'revenue': revenue, 'updated_at': now}
+        for (slip_id, month, status, payment_status), (bookings, nights, revenue) in groups.items()
+    ]
+
+
+def _insert(db, rows):
+    if rows:
+        db.execute(insert(BookingRollup), rows)
+
+
+def refresh(db, slip_months):
+    """
+    Recompute the rollup rows for (slip_id, month) pairs from bookings.
+
+    Must run inside the writing transaction after the bookings have been flushed.
+    """
+    if not slip_months:
+        return
+    slip_ids = {slip_id for slip_id, _ in slip_months}
+    months = {month for _, month in slip_months}
+    db.execute(delete(BookingRollup).where(BookingRollup.slip_id.in_(slip_ids), BookingRollup.month.in_(months)))
+    _insert(db, _aggregate(db, slip_ids, months))
+
+
+def rebuild(db):
+    """Rebuild booking_rollups from the whole bookings history; returns the number of rows"""
+    try:
+        db.execute(delete(BookingRollup))
+        _insert(db, _aggregate(db))
+        count = db.execute(select(func.count()).select_from(BookingRollup)).scalar_one()
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return count
+
+
+def ensure_rollups(db):
+    """Populate the rollups once per process if bookings exist but were never rolled up"""
+    global _seeded
+    if _seeded:
+        return
+    with _seed_lock:
+        if _seeded:
+            return
+        empty = db.execute(select(BookingRollup.slip_id).limit(1)).first() is None
+        if empty and db.execute(select(Booking.id).limit(1)).first() is not None:
+            rebuild(db)
+        _seeded = True
+
+
+def summary_query(group_by, start_month=None, end_month=None, slip_id=None, status=None, payment_status=None):
+    """Aggregate of the rollup table grouped by the `group_by` names (see GROUP_COLUMNS)"""
+    unknown = [name for name in group_by if name not in GROUP_COLUMNS]
+    if unknown:
+        raise ValueError(f'groupBy must be a subset of {", ".join(GROUP_COLUMNS)}')
+    check_months(start_month, end_month)
+    groups = [GROUP_COLUMNS[name].label(GROUP_KEYS[name]) for name in group_by]
+    active = BookingRollup.status.notin_(INACTIVE_STATUSES)
+    query = select(
+        *groups,
+        func.sum(BookingRollup.bookings).label('bookings'),
+        func.sum(BookingRollup.nights).label('nights'),
+        func.sum(case((active, BookingRollup.nights), else_=0)).label('occupiedNights'),
+        # Cancelled bookings earn nothing, like they occupy nothing
+        func.sum(case((active, BookingRollup.revenue), else_=0.0)).label('revenue')
+    ).group_by(*groups).order_by(*groups)
+    if start_month:
+        query = query.where(BookingRollup.month >= start_month)
+    if end_month:
+        query = query.where(BookingRollup.month <= end_month)
+    if slip_id is not None:
+        query = query.where(BookingRollup.slip_id == int(slip_id))
+    if status:
+        query = query.where(BookingRollup.status == status)
+    if payment_status:
+        query = query.where(BookingRollup.payment_status == payment_status)
+    return query
+
+
+def summary(db, group_by=('month',), start_month=None, end_month=None, slip_id=None, status=None, payment_status=None):
+    """
+    Grouped bookings, nights, occupied nights, revenue and occupancy rate.
+
+    Bookings count in their check-in month; nights are split across the months they
+    fall in. Occupied nights and revenue leave out cancelled bookings.
+
+    The occupancy rate is occupied nights over available slip-nights; it is reported
+    when the period is known, i.e. when grouping by month or both from and to are given.
+    """
+    ensure_rollups(db)
+    query = summary_query(group_by, start_month, end_month, slip_id, status, payment_status)
+    slip_count = 1 if slip_id is not None else db.execute(select(func.count(Slip.id))).scalar_one()
+    period_days = None
+    if start_month and end_month:
+        period_days = sum(
+            calendar.monthrange(*map(int, month.split('-')))[1] for month in months_between(start_month, end_month)
+        )
+
+    rows = []
+    totals = {'bookings': 0, 'nights': 0, 'occupiedNights': 0, 'revenue': 0.0}
+    for row in db.execute(query).mappings():
+        entry = dict(row)
+        entry['revenue'] = round(entry['revenue'] or 0.0, 2)
+        days = calendar.monthrange(*map(int, entry['month'].split('-')))[1] if 'month' in entry else period_days
+        slips = 1 if 'slipId' in entry else slip_count
+        entry['occupancyRate'] = round(entry['occupiedNights'] / (days * slips), 4) if days and slips else None
+        for key in totals:
+            totals[key] += entry[key]
+        rows.append(entry)
+    totals['revenue'] = round(totals['revenue'], 2)
+    totals['occupancyRate'] = (
+        round(totals['occupiedNights'] / (period_days * slip_count), 4) if period_days and slip_count else None
+    )
+    return {'groupBy': list(group_by), 'from': start_month, 'to': end_month, 'rows': rows, 'totals': totals}
+
+
+def _export_select(model, start_month, end_month, slip_id, status, payment_status):
+    """The bookings report columns of `model` (Booking or ArchivedBooking), filtered"""
+    columns = [getattr(model, column.key) if column.class_ is Booking else column for _, column in EXPORT_COLUMNS]
+    query = select(*columns).select_from(model).outerjoin(Slip, model.slip_id == Slip.id)
+    if start_month:
+        query = query.where(model.check_in >= month_start(start_month))
+    if end_month:
+        query = query.where(model.check_in < next_month(end_month))
+    if slip_id is not None:
+        query = query.where(model.slip_id == int(slip_id))
+    if status:
+        query = query.where(model.status == status)
+    if payment_status:
+        query = query.where(model.payment_status == payment_status)
+    return query
+
+
+def export_rows(db, report, batch_size, group_by=('month',), start_month=None, end_month=None, slip_id=None,
+                status=None, payment_status=None, include_archived=False):
+    """
+    (header, rows) for the CSV export: the grouped summary or the matching bookings.
+
+    The bookings report lists live bookings only unless `include_archived`.
+    `rows` is a result executed with yield_per, so it can be written out as it is fetched.
+    """
+    if report == 'summary':
+        ensure_rollups(db)
+        query = summary_query(group_by, start_month, end_month, slip_id, status, payment_status)
+        return [column.name for column in query.selected_columns], db.execute(query)
+    if report != 'bookings':
+        raise ValueError('report must be summary or bookings')
+    check_months(start_month, end_month)
+    query = _export_select(Booking, start_month, end_month, slip_id, status, payment_status)
+    if include_archived:
+        merged = union_all(
+            query, _export_select(ArchivedBooking, start_month, end_month, slip_id, status, payment_status)
+        ).subquery()
+        query = select(merged).order_by(merged.c.id)
+    else:
+        query = query.order_by(Booking.id)
+    query = query.execution_options(yield_per=batch_size)
+    return [name for name, _ in EXPORT_COLUMNS], db.execute(query)
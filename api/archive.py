@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Bookings archival for dock rental app - keeps the live bookings table to recent history
+
+Bookings that ended more than ARCHIVE_RETENTION_DAYS ago and are no longer pending
+move, a batch per transaction, from bookings to bookings_archive. Overlap checks,
+calendars, delta sync and the default booking lists read the live table only, so
+their cost follows the current seasons rather than the total history; list and
+export reads pass include_archived to see the rest. Analytics rollups count both.
+
+On Postgres the archive is partitioned by check-in year. Partitions are created as
+their first year is archived, in ARCHIVE_TABLESPACE when set (e.g. cheaper storage).
+"""
+
+import os
+from datetime import datetime, timedelta
+from sqlalchemy import select, insert, delete, func, literal, text, DateTime
+from database import Booking, ArchivedBooking
+
+ARCHIVE_RETENTION_DAYS = int(os.getenv('ARCHIVE_RETENTION_DAYS', '730'))
+ARCHIVE_BATCH_SIZE = int(os.getenv('ARCHIVE_BATCH_SIZE', '1000'))
+ARCHIVE_TABLESPACE = os.getenv('ARCHIVE_TABLESPACE')
+# A confirmed booking whose stay is over is complete; pending ones stay live until resolved
+ARCHIVED_STATUSES = ('confirmed', 'cancelled')
+
+BOOKING_COLUMNS = [column.name for column in Booking.__table__.columns]
+
+
+def partition_name(year):
+    return f'bookings_archive_{year}'
+
+
+def ensure_partitions(db, years):
+    """Create the yearly archive partitions for `years` if missing (Postgres only)"""
+    dialect = db.get_bind().dialect
+    if dialect.name != 'postgresql':
+        return
+    tablespace = f' TABLESPACE {dialect.identifier_preparer.quote(ARCHIVE_TABLESPACE)}' if ARCHIVE_TABLESPACE else ''
+    for year in sorted(years):
+        db.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {partition_name(year)} PARTITION OF bookings_archive "
+            f"FOR VALUES FROM ('{year}-01-01') TO ('{year + 1}-01-01'){tablespace}"
+        ))
+
+
+def archivable(cutoff):
+    """Select (id, check_in) of live bookings that ended before `cutoff` and are final"""
+    return select(Booking.id, Booking.check_in).where(
+        Booking.check_out < cutoff,
+        Booking.status.in_(ARCHIVED_STATUSES)
+    )
+
+
+def archive_bookings(db, retention_days=ARCHIVE_RETENTION_DAYS, batch_size=ARCHIVE_BATCH_SIZE, dry_run=False):
+    """
+    Move bookings past the retention window into bookings_archive.
+
+    Each batch is copied and deleted in one transaction, so a booking is always in
+    exactly one of the two tables. Rows locked by a concurrent writer are skipped
+    until the next run. Returns a summary dict.
+    """
+    cutoff = datetime.utcnow() - timedelta(days=retention_days)
+    result = {'cutoff': cutoff.isoformat(), 'archived': 0, 'batches': 0, 'dryRun': dry_run}
+    if dry_run:
+        eligible = select(func.count()).select_from(archivable(cutoff).subquery())
+        result['eligible'] = db.execute(eligible).scalar_one()
+        return result
+
+    while True:
+        try:
+            rows = db.execute(
+                archivable(cutoff).order_by(Booking.id).limit(batch_size).with_for_update(skip_locked=True)
+            ).all()
+            if not rows:
+                db.rollback()
+                break
+            ids = [row.id for row in rows]
+            ensure_partitions(db, {row.check_in.year for row in rows})
+            moved = select(*Booking.__table__.columns, literal(datetime.utcnow(), DateTime)).where(Booking.id.in_(ids))
+            db.execute(insert(ArchivedBooking).from_select(BOOKING_COLUMNS + ['archived_at'], moved))
+            db.execute(delete(Booking).where(Booking.id.in_(ids)).execution_options(synchronize_session=False))
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        result['archived'] += len(ids)
+        result['batches'] += 1
+    return result
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+ASGI application for dock rental API - same routes as index.handler, served async
+
+Each request runs the existing handler code inside SQLAlchemy's greenlet bridge with
+an AsyncSession on the asyncpg engine: every query awaits the driver, and Stripe
+calls go to worker threads (see concurrency.run_blocking), so one process keeps
+many requests in flight while Postgres and Stripe round trips are pending.
+index.handler stays the BaseHTTPRequestHandler entry point.
+
+Run from the api/ directory, e.g.:
+    uvicorn asgi:app --workers 2
+"""
+
+import asyncio
+import io
+from http.client import HTTPMessage
+from sqlalchemy.util import await_only, greenlet_spawn
+from database import ensure_schema, session_scope, get_engine, get_async_engine, open_async_session
+import analytics
+import index
+
+# Connection-level headers belong to the ASGI server, not the application
+HOP_BY_HOP_HEADERS = {'connection', 'transfer-encoding'}
+
+_startup = None
+
+
+class ASGIRequest(index.handler):
+    """
+    index.handler driven by one ASGI request instead of a socket.
+
+    The response methods it inherits from BaseHTTPRequestHandler are redirected to
+    ASGI send() events, awaited from inside the greenlet with await_only().
+    """
+
+    # The ASGI server frames the body itself, so _send_chunked must write plain chunks
+    request_version = 'HTTP/1.0'
+
+    def __init__(self, scope, body, send):
+        # BaseHTTPRequestHandler.__init__ would read the request from a socket
+        self.command = scope['method']
+        path = scope.get('raw_path') or scope['path'].encode('utf-8')
+        if scope.get('query_string'):
+            path += b'?' + scope['query_string']
+        self.path = path.decode('latin-1')
+        self.headers = HTTPMessage()
+        for name, value in scope['headers']:
+            self.headers[name.decode('latin-1')] = value.decode('latin-1')
+        # The body is already read, whether or not it came with a Content-Length
+        del self.headers['Content-Length']
+        self.headers['Content-Length'] = str(len(body))
+        self.client_address = scope.get('client')
+        self.rfile = io.BytesIO(body)
+        self.wfile = self
+        self.close_connection = True
+        self._asgi_send = send
+        self._async_db = None
+        self._response_headers = []
+        self._started = False
+
+    def _session(self):
+        if self._async_db is None:
+            self._async_db = open_async_session(read_only=self._reads_from_replica())
+        return self._async_db.sync_session
+
+    def _open_session(self, read_only):
+        # For /api/batch entries; closing the sync facade inside the greenlet awaits the driver
+        return open_async_session(read_only=read_only).sync_session
+
+    def _gather(self, calls):
+        # Each call in its own greenlet, so their queries overlap on the event loop
+        return await_only(asyncio.gather(*(greenlet_spawn(call) for call in calls)))
+
+    def send_response(self, code, message=None):
+        self._status = code
+        self._response_headers = []
+
+    def send_header(self, keyword, value):
+        if keyword.lower() not in HOP_BY_HOP_HEADERS:
+            self._response_headers.append((keyword.lower().encode('latin-1'), str(value).encode('latin-1')))
+
+    def end_headers(self):
+        await_only(self._asgi_send({
+            'type': 'http.response.start',
+            'status': self._status,
+            'headers': self._response_headers
+        }))
+        self._started = True
+
+    def write(self, data):
+        if data:
+            await_only(self._asgi_send({'type': 'http.response.body', 'body': bytes(data), 'more_body': True}))
+
+    def flush(self):
+        pass
+
+    async def respond(self):
+        method = getattr(self, 'do_' + self.command, None)
+        try:
+            if method is None:
+                await greenlet_spawn(self._send_json, 501, {'error': 'Unsupported method', 'method': self.command})
+            else:
+                await greenlet_spawn(method)
+        except Exception as e:
+            print(f"ASGI {self.command} {self.path} failed: {e}")
+            if not self._started:
+                await greenlet_spawn(self._send_json, 500, {'error': 'Internal server error', 'message': str(e)})
+        try:
+            if self._started:
+                await self._asgi_send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+        finally:
+            if self._async_db is not None:
+                await self._async_db.close()
+
+
+def prepare():
+    """Bootstrap the schema and analytics rollups with the sync engine, before serving"""
+    ensure_schema()
+    # ensure_rollups() holds a thread lock across queries, which greenlets sharing one
+    # thread must never contend for; doing it here leaves requests with the fast path
+    with session_scope() as db:
+        analytics.ensure_rollups(db)
+    # Requests use the asyncio engine; don't keep the bootstrap connections open
+    get_engine().dispose()
+
+
+async def ensure_started():
+    """Run prepare() once, on lifespan startup or, without lifespan support, the first request"""
+    global _startup
+    if _startup is None:
+        _startup = asyncio.ensure_future(asyncio.to_thread(prepare))
+    await _startup
+
+
+async def read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            break
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            break
+    return b''.join(chunks)
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            try:
+                await ensure_started()
+            except Exception as e:
+                await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                return
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await get_async_engine().dispose()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+    if scope['type'] != 'http':
+        return
+    await ensure_started()
+    body = await read_body(receive)
+    await ASGIRequest(scope, body, send).respond()
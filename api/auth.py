@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+Session tokens for dock rental API - issued at login, verified without a database query
+
+A token is base64url(JSON claims) '.' base64url(HMAC-SHA256 of the claims), keyed with
+SESSION_SECRET; the claims carry the user id, user_type, expiry and a token id (jti).
+Without SESSION_SECRET no tokens are issued or accepted.
+Checking one costs an HMAC and two in-memory lookups:
+
+- RevocationList mirrors the revoked_tokens table (tokens ended by /api/logout) and
+  reloads recent revocations at most every REVOCATION_REFRESH_SECONDS.
+- UserCache keeps recently used user records, least recently used evicted first, for
+  USER_CACHE_TTL seconds. Users changed through the ORM are dropped when their
+  transaction commits; changes made by other processes show within the TTL. A token
+  whose user was deleted or had their user_type changed stops being accepted.
+"""
+
+import base64
+import hashlib
+import hmac
+import itertools
+import json
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from sqlalchemy import event, select, delete
+from sqlalchemy.orm import Session
+from database import User, RevokedToken
+from serializers import USER
+
+SESSION_SECRET = os.getenv('SESSION_SECRET', '').encode()
+SESSION_TTL_SECONDS = int(os.getenv('SESSION_TTL_SECONDS', str(12 * 3600)))
+USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', '1000'))
+USER_CACHE_TTL = float(os.getenv('USER_CACHE_TTL', '60'))
+REVOCATION_REFRESH_SECONDS = float(os.getenv('REVOCATION_REFRESH_SECONDS', '5'))
+# Each reload re-reads this far back, so revocations stamped by a server with a
+# slightly slow clock are not missed
+REVOCATION_OVERLAP = timedelta(seconds=30)
+# Routes tagged with @requires reject requests without a matching session. Setting
+# AUTH_ENFORCED=false (e.g. while clients move to tokens) relaxes this for GET routes
+# only: tagged routes that write are always checked.
+AUTH_ENFORCED = os.getenv('AUTH_ENFORCED', 'true').lower() not in ('0', 'false')
+
+# Never a generated fallback: tokens signed with a per-process key fail on every other
+# instance, and an empty key would make them forgeable. Without a secret no tokens are
+# issued or accepted, and with AUTH_ENFORCED (the default) the API refuses to start.
+if not SESSION_SECRET:
+    if AUTH_ENFORCED:
+        raise ValueError("SESSION_SECRET environment variable is required unless AUTH_ENFORCED=false")
+    print("SESSION_SECRET is not set; session tokens are disabled")
+SESSIONS_ENABLED = bool(SESSION_SECRET)
+
+
+class InvalidToken(Exception):
+    """The token is malformed, forged, expired or revoked, or its user has changed"""
+
+
+class SessionsDisabled(Exception):
+    """No SESSION_SECRET is configured, so tokens cannot be issued"""
+
+
+def _encode(raw):
+    return base64.urlsafe_b64encode(raw).rstrip(b'=').decode()
+
+
+def _decode(text):
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+def _sign(payload):
+    return hmac.new(SESSION_SECRET, payload.encode(), hashlib.sha256).digest()
+
+
+def issue_token(user_id, user_type, ttl=SESSION_TTL_SECONDS):
+    """(token, claims) for a user who just proved their credentials; raises SessionsDisabled"""
+    if not SESSIONS_ENABLED:
+        raise SessionsDisabled('SESSION_SECRET is not set')
+    claims = {'uid': user_id, 'typ': user_type, 'exp': int(time.time()) + ttl, 'jti': secrets.token_urlsafe(12)}
+    payload = _encode(json.dumps(claims, separators=(',', ':')).encode())
+    return f'{payload}.{_encode(_sign(payload))}', claims
+
+
+def verify_token(token):
+    """Claims of a correctly signed, unexpired token (revocation is not checked here)"""
+    if not SESSIONS_ENABLED:
+        raise InvalidToken('Session tokens are not configured')
+    payload, _, signature = token.partition('.')
+    try:
+        claims = json.loads(_decode(payload)) if hmac.compare_digest(_decode(signature), _sign(payload)) else None
+    except ValueError:
+        claims = None
+    if not isinstance(claims, dict):
+        raise InvalidToken('Invalid session token')
+    if claims.get('exp', 0) < time.time():
+        raise InvalidToken('Session expired')
+    return claims
+
+
+def bearer_token(authorization):
+    """The token of an 'Authorization: Bearer <token>' header value, or None"""
+    scheme, _, token = (authorization or '').partition(' ')
+    if scheme.lower() != 'bearer' or not token.strip():
+        return None
+    return token.strip()
+
+
+def requires(*user_types):
+    """Tag a route with the user types allowed to call it (GET routes only when AUTH_ENFORCED)"""
+    def tag(func):
+        func.user_types = user_types
+        return func
+    return tag
+
+
+class UserCache:
+    """User records (serializers.USER rows) by id, LRU-evicted and expiring after `ttl` seconds"""
+
+    def __init__(self, size=USER_CACHE_SIZE, ttl=USER_CACHE_TTL):
+        self.size = size
+        self.ttl = ttl
+        self._entries = OrderedDict()  # user id -> (row, expires)
+        self._lock = threading.Lock()
+        # Bumped by invalidate(), so a load that raced a change is not cached
+        self._generation = 0
+
+    def get(self, db_factory, user_id):
+        """The user's row, loaded with `db_factory()` on a miss; None if there is no such user"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[1] > now:
+                self._entries.move_to_end(user_id)
+                return entry[0]
+            generation = self._generation
+        row = db_factory().execute(USER.select().where(User.id == user_id)).first()
+        if row is not None:
+            self.put(row, generation)
+        return row
+
+    def put(self, row, generation=None):
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            self._entries[row.id] = (row, time.monotonic() + self.ttl)
+            self._entries.move_to_end(row.id)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._generation += 1
+            self._entries.pop(user_id, None)
+
+
+class RevocationList:
+    """In-memory copy of revoked_tokens: jti -> expiry of every unexpired revoked token"""
+
+    def __init__(self, refresh_seconds=REVOCATION_REFRESH_SECONDS):
+        self.refresh_seconds = refresh_seconds
+        self._revoked = {}
+        self._loaded_at = None  # wall clock time of the last reload, like revoked_at
+        self._next_refresh = 0.0
+        # Never waited on: with greenlets sharing a thread (asgi.py), a blocking acquire
+        # held across the query could deadlock, so a concurrent reload is simply skipped
+        self._lock = threading.Lock()
+
+    def refresh(self, db_factory):
+        """Reload revocations from the database if the last reload is REVOCATION_REFRESH_SECONDS old"""
+        if time.monotonic() < self._next_refresh or not self._lock.acquire(blocking=False):
+            return
+        try:
+            started = datetime.utcnow()
+            query = select(RevokedToken.jti, RevokedToken.expires_at).where(RevokedToken.expires_at > started)
+            if self._loaded_at is not None:
+                query = query.where(RevokedToken.revoked_at > self._loaded_at - REVOCATION_OVERLAP)
+            rows = db_factory().execute(query).all()
+            revoked = {jti: expires for jti, expires in self._revoked.items() if expires > started}
+            revoked.update((row.jti, row.expires_at) for row in rows)
+            self._revoked = revoked
+            self._loaded_at = started
+            self._next_refresh = time.monotonic() + self.refresh_seconds
+        finally:
+            self._lock.release()
+
+    def is_revoked(self, jti):
+        return jti in self._revoked
+
+    def revoke(self, db, claims):
+        """Record a token as revoked (effective here at once, elsewhere after their next reload)"""
+        now = datetime.utcnow()
+        expires_at = datetime.utcfromtimestamp(claims['exp'])
+        try:
+            db.execute(delete(RevokedToken).where(RevokedToken.expires_at <= now))
+            db.merge(RevokedToken(jti=claims['jti'], user_id=claims['uid'], expires_at=expires_at, revoked_at=now))
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        self._revoked = {**self._revoked, claims['jti']: expires_at}
+
+
+users = UserCache()
+revocations = RevocationList()
+
+
+def authenticate(token, db_factory):
+    """
+    (claims, user row) for a session token; raises InvalidToken.
+
+    `db_factory()` returns a session, used only on a user cache miss or a due reload.
+    """
+    claims = verify_token(token)
+    revocations.refresh(db_factory)
+    if revocations.is_revoked(claims['jti']):
+        raise InvalidToken('Session revoked')
+    user = users.get(db_factory, claims['uid'])
+    if user is None or user.user_type != claims['typ']:
+        raise InvalidToken('Session no longer valid')
+    return claims, user
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_changed_users(session, flush_context):
+    changed = {obj.id for obj in itertools.chain(session.dirty, session.deleted) if isinstance(obj, User)}
+    if changed:
+        session.info.setdefault('changed_user_ids', set()).update(changed)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_changed_users(session):
+    for user_id in session.info.pop('changed_user_ids', ()):
+        users.invalidate(user_id)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _forget_changed_users(session, previous_transaction):
+    session.info.pop('changed_user_ids', None)
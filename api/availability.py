@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""
+Per-slip availability calendar for dock rental app
+
+Each slip has one bitmap per season (calendar year) with a bit per night, set when
+the night is booked. Bitmaps are persisted in slip_calendars, updated in the same
+transaction as the booking that changes them, and cached in process as Python ints
+so occupancy and "free for all these nights" checks are plain bitwise operations.
+"""
+
+import os
+import threading
+import time
+from datetime import date, datetime, timedelta
+from sqlalchemy import select, delete, insert, event
+from database import RoutingSession, Slip, Booking, SlipCalendar, INACTIVE_STATUSES
+
+SEASON_BYTES = 46  # 366 nights rounded up to whole bytes
+CALENDAR_CACHE_TTL = float(os.getenv('CALENDAR_CACHE_TTL', '5'))
+REBUILD_BATCH_SIZE = 5000
+
+
+def to_date(value):
+    return value.date() if isinstance(value, datetime) else value
+
+
+def booking_nights(check_in, check_out):
+    """The nights [first, last) a booking occupies; same-day bookings hold one night"""
+    first, last = to_date(check_in), to_date(check_out)
+    return first, max(last, first + timedelta(days=1))
+
+
+def season_spans(first, last):
+    """Split nights [first, last) into (season, start bit, end bit) pieces"""
+    spans = []
+    while first < last:
+        season_end = date(first.year + 1, 1, 1)
+        piece_end = min(last, season_end)
+        offset = date(first.year, 1, 1).toordinal()
+        spans.append((first.year, first.toordinal() - offset, piece_end.toordinal() - offset))
+        first = piece_end
+    return spans
+
+
+def night_masks(first, last):
+    """{season: bitmask} covering nights [first, last)"""
+    masks = {}
+    for season, start, end in season_spans(first, last):
+        masks[season] = masks.get(season, 0) | (((1 << (end - start)) - 1) << start)
+    return masks
+
+
+def bookings_bitmaps(db, keys):
+    """Compute {(slip_id, season): bitmap} for `keys` from the bookings table in one query"""
+    bitmaps = {key: 0 for key in keys}
+    if not keys:
+        return bitmaps
+    slip_ids = {slip_id for slip_id, _ in keys}
+    seasons = {season for _, season in keys}
+    query = select(Booking.slip_id, Booking.check_in, Booking.check_out).where(
+        Booking.slip_id.in_(slip_ids),
+        Booking.check_in < datetime(max(seasons) + 1, 1, 1),
+        Booking.check_out > datetime(min(seasons), 1, 1),
+        Booking.status.notin_(INACTIVE_STATUSES)
+    )
+    for slip_id, check_in, check_out in db.execute(query):
+        for season, mask in night_masks(*booking_nights(check_in, check_out)).items():
+            if (slip_id, season) in bitmaps:
+                bitmaps[(slip_id, season)] |= mask
+    return bitmaps
+
+
+class AvailabilityCalendar:
+    """Process-wide cache of season bitmaps in front of the slip_calendars table"""
+
+    def __init__(self, ttl=CALENDAR_CACHE_TTL):
+        self.ttl = ttl
+        self._entries = {}  # (slip_id, season) -> (loaded_at, bitmap)
+        self._lock = threading.Lock()
+
+    def bitmaps(self, db, keys):
+        """{(slip_id, season): bitmap} for `keys`, reading only stale or missing entries"""
+        now = time.monotonic()
+        result = {}
+        missing = []
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is not None and now - entry[0] < self.ttl:
+                    result[key] = entry[1]
+                else:
+                    missing.append(key)
+        if missing:
+            loaded = {}
+            slip_ids = {slip_id for slip_id, _ in missing}
+            seasons = {season for _, season in missing}
+            rows = db.execute(
+                select(SlipCalendar.slip_id, SlipCalendar.season, SlipCalendar.bitmap)
+                .where(SlipCalendar.slip_id.in_(slip_ids), SlipCalendar.season.in_(seasons))
+            )
+            for slip_id, season, bitmap in rows:
+                loaded[(slip_id, season)] = int.from_bytes(bitmap, 'little')
+            # Seasons without a stored calendar are derived from bookings (not persisted
+            # here, so reads never write)
+            unbuilt = [key for key in missing if key not in loaded]
+            loaded.update(bookings_bitmaps(db, unbuilt))
+            with self._lock:
+                for key in missing:
+                    self._entries[key] = (now, loaded[key])
+                    result[key] = loaded[key]
+        return result
+
+    def forget(self, keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+calendar = AvailabilityCalendar()
+
+
+def _store(db, bitmaps):
+    """Upsert {(slip_id, season): bitmap} rows; the caller holds the slips' locks"""
+    existing = set()
+    if bitmaps:
+        existing = set(tuple(row) for row in db.execute(
+            select(SlipCalendar.slip_id, SlipCalendar.season).where(
+                SlipCalendar.slip_id.in_({slip_id for slip_id, _ in bitmaps}),
+                SlipCalendar.season.in_({season for _, season in bitmaps})
+            )
+        ))
+    now = datetime.utcnow()
+    for (slip_id, season), bitmap in bitmaps.items():
+        data = bitmap.to_bytes(SEASON_BYTES, 'little')
+        if (slip_id, season) in existing:
+            db.query(SlipCalendar).filter_by(slip_id=slip_id, season=season).update(
+                {'bitmap': data, 'updated_at': now}, synchronize_session=False
+            )
+        else:
+            db.add(SlipCalendar(slip_id=slip_id, season=season, bitmap=data, updated_at=now))
+    # Drop the cached copies once the transaction commits
+    db.info.setdefault('calendar_keys', set()).update(bitmaps)
+
+
+def refresh(db, slip_seasons):
+    """
+    Recompute and store the calendars for (slip_id, season) pairs from bookings.
+
+    Used after cancellations and bulk imports; must run inside the writing transaction
+    after the bookings have been flushed.
+    """
+    _store(db, bookings_bitmaps(db, set(slip_seasons)))
+
+
+def mark_booking(db, slip_id, check_in, check_out):
+    """Set the nights of a new booking in its slip's calendars (inside the booking transaction)"""
+    masks = night_masks(*booking_nights(check_in, check_out))
+    keys = {(slip_id, season) for season in masks}
+    stored = {
+        (row_slip, season): int.from_bytes(bitmap, 'little')
+        for row_slip, season, bitmap in db.execute(
+            select(SlipCalendar.slip_id, SlipCalendar.season, SlipCalendar.bitmap)
+            .where(SlipCalendar.slip_id == slip_id, SlipCalendar.season.in_(masks))
+        )
+    }
+    # Seasons never stored yet are built from bookings, which already include this one
+    bitmaps = bookings_bitmaps(db, keys - set(stored))
+    for key in stored:
+        bitmaps[key] = stored[key] | masks[key[1]]
+    _store(db, bitmaps)
+
+
+def booking_slip_seasons(slip_id, check_in, check_out):
+    return {(slip_id, season) for season in night_masks(*booking_nights(check_in, check_out))}
+
+
+# On the session class rather than SessionLocal, so the sync side of asgi.py's
+# AsyncSessions (made by AsyncSessionLocal) is covered too
+@event.listens_for(RoutingSession, 'after_commit')
+def _forget_committed(session):
+    keys = session.info.pop('calendar_keys', None)
+    if keys:
+        calendar.forget(keys)
+
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def _discard_pending(session):
+    session.info.pop('calendar_keys', None)
+
+
+def occupancy(db, slip_ids, start, days):
+    """{slip_id: '0110...'} with one character per night from `start`, '1' = booked"""
+    first, last = to_date(start), to_date(start) + timedelta(days=days)
+    spans = season_spans(first, last)
+    bitmaps = calendar.bitmaps(db, [(slip_id, season) for slip_id in slip_ids for season, _, _ in spans])
+    result = {}
+    for slip_id in slip_ids:
+        parts = []
+        for season, begin, end in spans:
+            bits = (bitmaps[(slip_id, season)] >> begin) & ((1 << (end - begin)) - 1)
+            # Bit 0 is the first night; format() puts the most significant bit first
+            parts.append(format(bits, '0%db' % (end - begin))[::-1])
+        result[slip_id] = ''.join(parts)
+    return result
+
+
+def free_slips(db, slip_ids, nights):
+    """Slips in `slip_ids` free for every one of `nights` (a list of (first, last) date ranges)"""
+    masks = {}
+    for first, last in nights:
+        for season, mask in night_masks(to_date(first), to_date(last)).items():
+            masks[season] = masks.get(season, 0) | mask
+    bitmaps = calendar.bitmaps(db, [(slip_id, season) for slip_id in slip_ids for season in masks])
+    return [
+        slip_id for slip_id in slip_ids
+        if not any(bitmaps[(slip_id, season)] & mask for season, mask in masks.items())
+    ]
+
+
+def all_slip_ids(db):
+    return list(db.execute(select(Slip.id).order_by(Slip.id)).scalars())
+
+
+def rebuild(db, seasons=None):
+    """Rebuild slip_calendars from the bookings table; returns the number of calendars written"""
+    query = select(Booking.slip_id, Booking.check_in, Booking.check_out).where(
+        Booking.status.notin_(INACTIVE_STATUSES)
+    )
+    if seasons:
+        query = query.where(
+            Booking.check_in < datetime(max(seasons) + 1, 1, 1),
+            Booking.check_out > datetime(min(seasons), 1, 1)
+        )
+    bitmaps = {}
+    for slip_id, check_in, check_out in db.execute(query.execution_options(yield_per=REBUILD_BATCH_SIZE)):
+        for season, mask in night_masks(*booking_nights(check_in, check_out)).items():
+            if not seasons or season in seasons:
+                bitmaps[(slip_id, season)] = bitmaps.get((slip_id, season), 0) | mask
+
+    try:
+        statement = delete(SlipCalendar)
+        if seasons:
+            statement = statement.where(SlipCalendar.season.in_(seasons))
+        db.execute(statement)
+        now = datetime.utcnow()
+        rows = [
+            {'slip_id': slip_id, 'season': season, 'bitmap': bitmap.to_bytes(SEASON_BYTES, 'little'), 'updated_at': now}
+            for (slip_id, season), bitmap in bitmaps.items()
+        ]
+        for start in range(0, len(rows), REBUILD_BATCH_SIZE):
+            db.execute(insert(SlipCalendar), rows[start:start + REBUILD_BATCH_SIZE])
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    calendar.clear()
+    return len(rows)
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Request batching for dock rental API - several API calls in one round trip
+
+POST /api/batch takes {"requests": [{"id", "method", "path", "body", "headers"}, ...],
+"atomic": false}. Entries run in order through the normal route table. Consecutive
+GETs run concurrently in their own sessions; everything else shares the batch's
+session. With "atomic": true the writes share one database transaction, committed only
+if every write succeeds. Stripe calls and other side effects outside the database
+cannot be rolled back.
+"""
+
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+from serializers import dumps
+from concurrency import run_blocking
+
+MAX_BATCH_REQUESTS = int(os.getenv('MAX_BATCH_REQUESTS', '20'))
+# Threads running one group of concurrent GET entries
+BATCH_READ_THREADS = 8
+BATCH_METHODS = ('GET', 'POST')
+# Sub-response headers worth returning to the client
+RESPONSE_HEADERS = ('Content-type', 'ETag', 'Last-Modified', 'Allow', 'Content-Disposition')
+
+
+class BatchEntry:
+    __slots__ = ('id', 'method', 'path', 'body', 'headers')
+
+    def __init__(self, id, method, path, body, headers):
+        self.id = id
+        self.method = method
+        self.path = path
+        self.body = body
+        self.headers = headers
+
+
+class BatchAborted(Exception):
+    """An atomic batch had a failing write; carries the results so far for the response"""
+
+    def __init__(self, results):
+        super().__init__('Batch rolled back')
+        self.results = results
+
+
+def parse_entries(data):
+    """BatchEntry list from a request body; ValueError on anything malformed"""
+    requests = data.get('requests')
+    if not isinstance(requests, list) or not requests:
+        raise ValueError('requests must be a non-empty list')
+    if len(requests) > MAX_BATCH_REQUESTS:
+        raise ValueError(f'At most {MAX_BATCH_REQUESTS} requests per batch')
+    entries = []
+    for index, item in enumerate(requests):
+        if not isinstance(item, dict):
+            raise ValueError(f'requests[{index}] must be an object')
+        method = str(item.get('method', 'GET')).upper()
+        path = item.get('path')
+        if method not in BATCH_METHODS:
+            raise ValueError(f'requests[{index}]: method must be one of {", ".join(BATCH_METHODS)}')
+        if not isinstance(path, str) or not path.startswith('/api/'):
+            raise ValueError(f'requests[{index}]: path must start with /api/')
+        if path.split('?')[0].rstrip('/') == '/api/batch':
+            raise ValueError(f'requests[{index}]: batches cannot be nested')
+        headers = item.get('headers') or {}
+        if not isinstance(headers, dict):
+            raise ValueError(f'requests[{index}]: headers must be an object')
+        entries.append(BatchEntry(item.get('id', index), method, path, item.get('body'), headers))
+    return entries
+
+
+def failed(result):
+    return result is None or result[0] is None or result[0] >= 400
+
+
+def run_concurrently(calls):
+    """Results of the zero-argument `calls`, run on a thread pool"""
+    def run_all():
+        with ThreadPoolExecutor(min(len(calls), BATCH_READ_THREADS)) as pool:
+            return list(pool.map(lambda call: call(), calls))
+    return run_blocking(run_all)
+
+
+def execute(entries, run, db, atomic=False, gather=run_concurrently):
+    """
+    Run the entries in order; returns one (status, headers, body) per entry.
+
+    `run(entry, db, read_only)` executes one entry, in `db` or, when db is None, in a
+    session of its own; `gather(calls)` runs a group of consecutive GETs concurrently.
+    GETs only read from a replica until the batch has written.
+    In atomic mode, the first failing write stops the batch with BatchAborted; GETs
+    after a write then run in `db` so they see the uncommitted changes.
+    """
+    results = [None] * len(entries)
+    wrote = False
+    index = 0
+    while index < len(entries):
+        if entries[index].method == 'GET' and not (atomic and wrote):
+            end = index
+            while end < len(entries) and entries[end].method == 'GET':
+                end += 1
+            group = entries[index:end]
+            if len(group) == 1:
+                results[index] = run(group[0], None, not wrote)
+            else:
+                read_only = not wrote
+                results[index:end] = gather([functools.partial(run, entry, None, read_only) for entry in group])
+            index = end
+            continue
+
+        entry = entries[index]
+        results[index] = run(entry, db, False)
+        if entry.method != 'GET':
+            wrote = True
+            if atomic and failed(results[index]):
+                raise BatchAborted(results)
+        index += 1
+    return results
+
+
+def encode_response(entries, results, atomic, committed):
+    """
+    The batch response body. JSON sub-response bodies are spliced in as they are,
+    without a decode/encode round trip; other bodies become JSON strings.
+    """
+    parts = []
+    for entry, result in zip(entries, results):
+        if result is None:
+            # Not run: an earlier write in an atomic batch failed
+            status, headers, body = 424, {}, b'{"error":"Not run: the batch was rolled back"}'
+        else:
+            status, headers, body = result
+            content_type = headers.get('Content-type', '')
+            if not body:
+                body = b'null'
+            elif not content_type.startswith('application/json'):
+                body = dumps(body.decode('utf-8', 'replace'))
+        kept = {name: headers[name] for name in RESPONSE_HEADERS if name in headers}
+        parts.append(
+            b'{"id":' + dumps(entry.id) + b',"status":' + str(status).encode()
+            + b',"headers":' + dumps(kept) + b',"body":' + body + b'}'
+        )
+    summary = {'atomic': atomic}
+    if atomic:
+        summary['committed'] = committed
+    return b'{"responses":[' + b','.join(parts) + b'],' + dumps(summary)[1:]
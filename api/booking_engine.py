@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+"""
+Booking engine for dock rental app - overlap-safe booking creation
+"""
+
+from datetime import datetime, timezone
+from sqlalchemy import select, text, union_all
+from sqlalchemy.exc import IntegrityError
+from database import Slip, Booking, ArchivedBooking, INACTIVE_STATUSES
+import availability
+import analytics
+import pricing
+from serializers import BOOKING
+from sync import changes_committed
+
+# Name of the Postgres exclusion constraint created in database.py
+OVERLAP_CONSTRAINT = 'bookings_no_overlap'
+
+
+class BookingConflict(Exception):
+    """Raised when a slip is already booked for part of the requested dates"""
+
+    def __init__(self, slip_id, check_in, check_out, conflicts):
+        super().__init__(f'Slip {slip_id} is not available for the selected dates')
+        self.slip_id = slip_id
+        self.check_in = check_in
+        self.check_out = check_out
+        self.conflicts = conflicts
+
+    def to_dict(self):
+        """Structured conflict response for the API"""
+        return {
+            'error': 'Booking conflict',
+            'message': str(self),
+            'slipId': self.slip_id,
+            'checkIn': self.check_in.isoformat(),
+            'checkOut': self.check_out.isoformat(),
+            'conflicts': [
+                {
+                    'id': booking_id,
+                    'checkIn': check_in.isoformat() if check_in else None,
+                    'checkOut': check_out.isoformat() if check_out else None,
+                    'status': status
+                }
+                for booking_id, check_in, check_out, status in self.conflicts
+            ]
+        }
+
+
+def parse_datetime(value):
+    """
+    Parse an ISO 8601 timestamp as sent by the frontend, to a naive UTC datetime.
+
+    The columns are TIMESTAMP WITHOUT TIME ZONE, and asyncpg rejects aware values for them.
+    """
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def find_conflicts(db, slip_id, check_in, check_out):
+    """Return (id, check_in, check_out, status) of active bookings overlapping [check_in, check_out)"""
+    query = (
+        select(Booking.id, Booking.check_in, Booking.check_out, Booking.status)
+        .where(
+            Booking.slip_id == slip_id,
+            Booking.check_in < check_out,
+            Booking.check_out > check_in,
+            Booking.status.notin_(INACTIVE_STATUSES)
+        )
+        .order_by(Booking.check_in)
+    )
+    return [tuple(row) for row in db.execute(query)]
+
+
+def lock_slips(db, slip_ids):
+    """
+    Serialize writers competing for the given slips without locking the whole table.
+
+    Returns the set of slip ids that exist. Rows are locked in id order so two
+    writers locking overlapping sets cannot deadlock.
+    """
+    slip_ids = sorted(set(slip_ids))
+    if not slip_ids:
+        return set()
+    if db.get_bind().dialect.name == 'sqlite':
+        # SQLite has no row locks; a no-op write takes the database write lock up front
+        # so the overlap check and the insert run in one serialized transaction
+        db.execute(text('UPDATE slips SET id = id WHERE id = :slip_id'), {'slip_id': slip_ids[0]})
+        return set(db.execute(select(Slip.id).where(Slip.id.in_(slip_ids))).scalars())
+    return set(db.execute(
+        select(Slip.id).where(Slip.id.in_(slip_ids)).order_by(Slip.id).with_for_update()
+    ).scalars())
+
+
+def lock_slip(db, slip_id):
+    """Lock one slip for booking; raises ValueError if it does not exist"""
+    if not lock_slips(db, [slip_id]):
+        raise ValueError(f'Slip {slip_id} does not exist')
+
+
+def create_booking(db, booking_data, user_type='renter', user_id=None):
+    """
+    Create a booking from frontend booking data, rejecting overlapping dates.
+
+    `user_type` prices the stay and `user_id` owns it; the caller derives both from the
+    session, never from booking_data. Without `user_id` the booking's userId is kept.
+    """
+    slip_id = booking_data['slipId']
+    check_in = parse_datetime(booking_data['checkIn'])
+    check_out = parse_datetime(booking_data['checkOut'])
+    booking_date = parse_datetime(booking_data['bookingDate'])
+
+    if check_out <= check_in:
+        raise ValueError('checkOut must be after checkIn')
+
+    # Parse optional dates
+    payment_date = None
+    rental_start_date = None
+    rental_end_date = None
+
+    if booking_data.get('paymentDate'):
+        payment_date = parse_datetime(booking_data['paymentDate'])
+    if booking_data.get('rentalStartDate'):
+        rental_start_date = parse_datetime(booking_data['rentalStartDate'])
+    if booking_data.get('rentalEndDate'):
+        rental_end_date = parse_datetime(booking_data['rentalEndDate'])
+
+    status = booking_data.get('status', 'pending')
+    if user_id is None:
+        user_id = booking_data.get('userId', 1)  # Default to user 1 if not provided
+
+    try:
+        # Nights and total are computed here; client values are only checked against them
+        quote = pricing.quote_booking(db, slip_id, check_in, check_out, user_type)
+        pricing.verify_quote(quote, booking_data.get('nights'), booking_data.get('totalCost'))
+
+        lock_slip(db, slip_id)
+
+        if status not in INACTIVE_STATUSES:
+            conflicts = find_conflicts(db, slip_id, check_in, check_out)
+            if conflicts:
+                raise BookingConflict(slip_id, check_in, check_out, conflicts)
+
+        new_booking = Booking(
+            slip_id=slip_id,
+            user_id=user_id,
+            guest_name=booking_data['guestName'],
+            guest_email=booking_data['guestEmail'],
+            guest_phone=booking_data.get('guestPhone'),
+            check_in=check_in,
+            check_out=check_out,
+            boat_length=booking_data.get('boatLength'),
+            boat_make_model=booking_data.get('boatMakeModel'),
+            user_type=user_type,
+            nights=quote['nights'],
+            total_cost=quote['totalCost'],
+            status=status,
+            booking_date=booking_date,
+            payment_status=booking_data.get('paymentStatus', 'pending'),
+            payment_method=booking_data.get('paymentMethod', 'stripe'),
+            payment_date=payment_date,
+            rental_agreement_name=booking_data.get('rentalAgreementName'),
+            insurance_proof_name=booking_data.get('insuranceProofName'),
+            rental_property=booking_data.get('rentalProperty'),
+            rental_start_date=rental_start_date,
+            rental_end_date=rental_end_date
+        )
+
+        db.add(new_booking)
+        db.flush()
+        if status not in INACTIVE_STATUSES:
+            availability.mark_booking(db, slip_id, check_in, check_out)
+        analytics.refresh(db, analytics.booking_slip_months(slip_id, check_in, check_out))
+        db.commit()
+    except IntegrityError as e:
+        db.rollback()
+        if OVERLAP_CONSTRAINT in str(e.orig):
+            # Lost a race the row lock did not cover (e.g. a writer outside this engine)
+            raise BookingConflict(
+                slip_id, check_in, check_out, find_conflicts(db, slip_id, check_in, check_out)
+            ) from e
+        raise
+    except Exception:
+        db.rollback()
+        raise
+
+    changes_committed.notify()
+    db.refresh(new_booking)
+    return new_booking
+
+
+def cancel_booking(db, booking_id, user_id=None):
+    """
+    Mark a booking cancelled and release its nights in the availability calendar.
+
+    With `user_id`, only that user's own bookings may be cancelled (PermissionError otherwise).
+    """
+    try:
+        booking = db.get(Booking, int(booking_id))
+        if booking is None:
+            raise ValueError(f'Booking {booking_id} does not exist')
+        if user_id is not None and booking.user_id != user_id:
+            raise PermissionError(f'Booking {booking_id} belongs to another user')
+        lock_slip(db, booking.slip_id)
+        if booking.status not in INACTIVE_STATUSES:
+            booking.status = 'cancelled'
+            db.flush()
+            availability.refresh(
+                db, availability.booking_slip_seasons(booking.slip_id, booking.check_in, booking.check_out)
+            )
+            analytics.refresh(db, analytics.booking_slip_months(booking.slip_id, booking.check_in, booking.check_out))
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    changes_committed.notify()
+    db.refresh(booking)
+    return booking
+
+
+# Page size bounds for list_bookings
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+
+
+def _select_bookings(model, columns, slip_id, status, start, end, after):
+    """Select `columns` from `model` (Booking or ArchivedBooking) with the list filters applied"""
+    query = select(*columns).select_from(model).outerjoin(Slip, model.slip_id == Slip.id)
+    if slip_id is not None:
+        query = query.where(model.slip_id == int(slip_id))
+    if status is not None:
+        query = query.where(model.status == status)
+    # Date window: bookings overlapping [start, end); on the archive, the check_in
+    # bound also prunes the yearly partitions after the window
+    if start is not None:
+        query = query.where(model.check_out > start)
+    if end is not None:
+        query = query.where(model.check_in < end)
+    if after is not None:
+        query = query.where(model.id > int(after))
+    return query
+
+
+def filtered_bookings_query(slip_id=None, status=None, start=None, end=None, include_archived=False, after=None):
+    """
+    Select serializers.BOOKING rows ordered by id, optionally filtered by slip, status and date window.
+
+    Only live bookings unless `include_archived`, which merges in bookings_archive by id.
+    `after` starts past a booking id (keyset pagination).
+    """
+    query = _select_bookings(Booking, BOOKING.columns, slip_id, status, start, end, after)
+    if not include_archived:
+        return query.order_by(Booking.id)
+    archived_columns = [
+        getattr(ArchivedBooking, column.key) if column.class_ is Booking else column for column in BOOKING.columns
+    ]
+    merged = union_all(
+        query, _select_bookings(ArchivedBooking, archived_columns, slip_id, status, start, end, after)
+    ).subquery()
+    return select(merged).order_by(merged.c.id)
+
+
+def list_bookings(db, cursor=None, limit=DEFAULT_PAGE_SIZE, slip_id=None, status=None, start=None, end=None,
+                  include_archived=False):
+    """
+    Return one page of booking rows ordered by id, plus the cursor for the next page.
+
+    Pagination is keyset-based: `cursor` is the last booking id of the previous page, so
+    every page costs the same regardless of how deep into the history it is. Rows are
+    column tuples (see serializers.BOOKING), with the slip name joined in the same query.
+    """
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+
+    query = filtered_bookings_query(slip_id, status, start, end, include_archived, after=cursor).limit(limit + 1)
+
+    rows = db.execute(query).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = str(rows[-1].id)
+    return rows, next_cursor
+
+
+def stream_bookings(db, batch_size, slip_id=None, status=None, start=None, end=None, include_archived=False):
+    """Iterate every matching booking row, fetching `batch_size` rows per round trip"""
+    query = filtered_bookings_query(slip_id, status, start, end, include_archived).execution_options(
+        yield_per=batch_size
+    )
+    return db.execute(query)
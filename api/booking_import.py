@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+"""
+Bulk booking import for dock rental app - validates a whole file, checks prices and
+overlaps with one set-based query each and inserts in batches (COPY on Postgres/psycopg2)
+
+Nights and totals are checked against the server quote (pricing.py) like interactive
+bookings are; rows without totalCost get the quoted total.
+"""
+
+import csv
+import io
+import json
+from bisect import bisect_left
+from datetime import datetime, timezone
+from functools import lru_cache
+from sqlalchemy import select, insert
+from database import Booking, INACTIVE_STATUSES
+from booking_engine import lock_slips
+import pricing
+import availability
+import analytics
+from sync import changes_committed
+
+# Rows per executemany round trip
+INSERT_BATCH_SIZE = 1000
+
+# Frontend field name -> (Booking column, converter)
+FIELDS = {
+    'slipId': ('slip_id', int),
+    'userId': ('user_id', int),
+    'guestName': ('guest_name', str),
+    'guestEmail': ('guest_email', str),
+    'guestPhone': ('guest_phone', str),
+    'checkIn': ('check_in', None),
+    'checkOut': ('check_out', None),
+    'boatLength': ('boat_length', float),
+    'boatMakeModel': ('boat_make_model', str),
+    'userType': ('user_type', str),
+    'nights': ('nights', int),
+    'totalCost': ('total_cost', float),
+    'status': ('status', str),
+    'bookingDate': ('booking_date', None),
+    'paymentStatus': ('payment_status', str),
+    'paymentMethod': ('payment_method', str),
+    'paymentDate': ('payment_date', None),
+    'rentalAgreementName': ('rental_agreement_name', str),
+    'insuranceProofName': ('insurance_proof_name', str),
+    'rentalProperty': ('rental_property', str),
+    'rentalStartDate': ('rental_start_date', None),
+    'rentalEndDate': ('rental_end_date', None),
+}
+DATE_FIELDS = [key for key, (_, convert) in FIELDS.items() if convert is None]
+REQUIRED_FIELDS = ('slipId', 'guestName', 'guestEmail', 'checkIn', 'checkOut')
+DEFAULTS = {
+    'user_id': 1,
+    'user_type': 'renter',
+    'status': 'pending',
+    'payment_status': 'pending',
+    'payment_method': 'stripe',
+}
+COLUMNS = [column for column, _ in FIELDS.values()] + ['created_at', 'updated_at']
+
+
+@lru_cache(maxsize=65536)
+def parse_date(value):
+    """Parse an ISO 8601 date or timestamp to a naive UTC datetime (memoized: imports repeat dates a lot)"""
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def read_records(text, fmt):
+    """Decode a CSV or JSON Lines document into a list of dicts keyed by frontend field names"""
+    if fmt == 'csv':
+        # Empty CSV cells mean "not provided"
+        return [{key: value for key, value in row.items() if value != ''} for row in csv.DictReader(io.StringIO(text))]
+    if fmt == 'jsonl':
+        return [json.loads(line) for line in text.splitlines() if line.strip()]
+    raise ValueError(f'Unsupported import format: {fmt}')
+
+
+def prepare_rows(records, now=None):
+    """
+    Validate and convert records column by column.
+
+    Returns (rows, results): `rows` maps record index -> Booking column dict for the
+    valid records; `results` holds one per-row result dict for every record.
+    """
+    now = now or datetime.utcnow()
+    results = [{'row': index + 1, 'status': 'ok'} for index in range(len(records))]
+    errors = [[] for _ in records]
+
+    for key in REQUIRED_FIELDS:
+        for index, record in enumerate(records):
+            if record.get(key) in (None, ''):
+                errors[index].append(f'{key} is required')
+
+    # One pass per column rather than per record, so each converter runs in a tight loop
+    columns = {}
+    for key, (column, convert) in FIELDS.items():
+        values = [record.get(key) for record in records]
+        if convert is None:
+            convert = parse_date
+        converted = [None] * len(values)
+        for index, value in enumerate(values):
+            if value is None or value == '':
+                continue
+            try:
+                converted[index] = convert(value)
+            except (TypeError, ValueError):
+                errors[index].append(f'{key} is invalid: {value!r}')
+        columns[column] = converted
+
+    rows = {}
+    for index in range(len(records)):
+        row = {column: values[index] for column, values in columns.items()}
+        if not errors[index] and row['check_out'] <= row['check_in']:
+            errors[index].append('checkOut must be after checkIn')
+        if errors[index]:
+            results[index].update(status='error', errors=errors[index])
+            continue
+        for column, default in DEFAULTS.items():
+            if row[column] is None:
+                row[column] = default
+        nights = pricing.count_nights(row['check_in'], row['check_out'])
+        if row['nights'] is None:
+            row['nights'] = nights
+        elif row['nights'] != nights:
+            results[index].update(status='error', errors=[f"nights is {row['nights']}, expected {nights}"])
+            continue
+        if row['booking_date'] is None:
+            row['booking_date'] = now
+        row['created_at'] = now
+        row['updated_at'] = now
+        rows[index] = row
+    return rows, results
+
+
+def check_prices(db, rows, results):
+    """Fill in missing totals from the server quote and drop rows whose total disagrees with it"""
+    if not rows:
+        return
+    order = list(rows)
+    quotes = pricing.quote_stays(
+        db, [(rows[index]['slip_id'], rows[index]['check_in'], rows[index]['check_out'], rows[index]['user_type'])
+             for index in order]
+    )
+    for index, quote in zip(order, quotes):
+        row = rows[index]
+        if row['total_cost'] is None:
+            row['total_cost'] = quote['totalCost']
+        elif abs(row['total_cost'] - quote['totalCost']) > pricing.PRICE_TOLERANCE:
+            rows.pop(index)
+            results[index].update(status='error', errors=[
+                f"totalCost is {row['total_cost']}, the current price is {quote['totalCost']}"
+            ])
+
+
+def check_overlaps(db, rows, results):
+    """
+    Drop rows that overlap an existing active booking or an earlier row of the same import.
+
+    Existing bookings for every slip in the import are fetched in one query over the
+    import's overall date window; the per-row checks then run in memory.
+    """
+    active = {index: row for index, row in rows.items() if row['status'] not in INACTIVE_STATUSES}
+    if not active:
+        return
+
+    existing = {}
+    query = select(Booking.id, Booking.slip_id, Booking.check_in, Booking.check_out).where(
+        Booking.slip_id.in_({row['slip_id'] for row in active.values()}),
+        Booking.check_in < max(row['check_out'] for row in active.values()),
+        Booking.check_out > min(row['check_in'] for row in active.values()),
+        Booking.status.notin_(INACTIVE_STATUSES)
+    ).order_by(Booking.slip_id, Booking.check_in)
+    for booking_id, slip_id, check_in, check_out in db.execute(query):
+        existing.setdefault(slip_id, []).append((check_in, check_out, booking_id))
+
+    # Per slip: starts sorted, and the running max of ends, so "does any interval with
+    # start < end overlap [start, end)" is one bisect
+    index_by_slip = {}
+    for slip_id, intervals in existing.items():
+        running_max = []
+        latest = None
+        for interval in intervals:
+            if latest is None or interval[1] > latest[1]:
+                latest = interval
+            running_max.append(latest)
+        index_by_slip[slip_id] = ([interval[0] for interval in intervals], running_max)
+
+    accepted = {}
+    for index in sorted(active, key=lambda i: active[i]['check_in']):
+        row = active[index]
+        starts, running_max = index_by_slip.get(row['slip_id'], ([], []))
+        position = bisect_left(starts, row['check_out'])
+        if position and running_max[position - 1][1] > row['check_in']:
+            rows.pop(index)
+            results[index].update(status='conflict', conflictsWith={'bookingId': running_max[position - 1][2]})
+            continue
+        # Rows are visited in start order, so only the furthest-reaching accepted row matters
+        previous = accepted.get(row['slip_id'])
+        if previous is not None and rows[previous]['check_out'] > row['check_in']:
+            rows.pop(index)
+            results[index].update(status='conflict', conflictsWith={'row': previous + 1})
+            continue
+        if previous is None or row['check_out'] > rows[previous]['check_out']:
+            accepted[row['slip_id']] = index
+
+
+def _copy_rows(db, rows):
+    """Load rows with COPY FROM STDIN on a psycopg2 connection"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow([
+            value.isoformat() if isinstance(value, datetime) else ('' if value is None else value)
+            for value in (row[column] for column in COLUMNS)
+        ])
+    buffer.seek(0)
+    cursor = db.connection().connection.cursor()
+    try:
+        cursor.copy_expert(f"COPY bookings ({', '.join(COLUMNS)}) FROM STDIN WITH (FORMAT csv)", buffer)
+    finally:
+        cursor.close()
+
+
+def insert_rows(db, rows, use_copy=True):
+    """Insert column dicts in batches; returns the new ids in order, or None when using COPY"""
+    dialect = db.get_bind().dialect
+    if use_copy and dialect.name == 'postgresql' and dialect.driver == 'psycopg2':
+        _copy_rows(db, rows)
+        return None
+
+    returning = dialect.insert_executemany_returning_sort_by_parameter_order
+    ids = []
+    for start in range(0, len(rows), INSERT_BATCH_SIZE):
+        batch = rows[start:start + INSERT_BATCH_SIZE]
+        if returning:
+            statement = insert(Booking).returning(Booking.id, sort_by_parameter_order=True)
+            ids.extend(db.execute(statement, batch).scalars().all())
+        else:
+            db.execute(insert(Booking), batch)
+    return ids if returning else None
+
+
+def import_bookings(db, records, dry_run=False, use_copy=True):
+    """
+    Validate, overlap-check and insert bookings; returns a summary with a result per row.
+
+    Valid rows are inserted in one transaction; invalid or conflicting rows are skipped
+    and reported. With dry_run nothing is written.
+    """
+    rows, results = prepare_rows(records)
+    try:
+        # Lock the slips involved so concurrent bookings cannot slip in between the
+        # overlap check and the insert
+        found = lock_slips(db, {row['slip_id'] for row in rows.values()})
+        for index, row in list(rows.items()):
+            if row['slip_id'] not in found:
+                rows.pop(index)
+                results[index].update(status='error', errors=[f"Slip {row['slip_id']} does not exist"])
+
+        check_prices(db, rows, results)
+        check_overlaps(db, rows, results)
+
+        order = sorted(rows)
+        if dry_run:
+            db.rollback()
+        else:
+            # Stamp once the transaction is open: the delta-sync feed holds back rows
+            # stamped after the oldest open write transaction began (sync.settled_point)
+            stamped = datetime.utcnow()
+            for row in rows.values():
+                row['updated_at'] = stamped
+            ids = insert_rows(db, [rows[index] for index in order], use_copy=use_copy)
+            slip_seasons = set()
+            slip_months = set()
+            for row in rows.values():
+                if row['status'] not in INACTIVE_STATUSES:
+                    slip_seasons |= availability.booking_slip_seasons(row['slip_id'], row['check_in'], row['check_out'])
+                slip_months |= analytics.booking_slip_months(row['slip_id'], row['check_in'], row['check_out'])
+            availability.refresh(db, slip_seasons)
+            analytics.refresh(db, slip_months)
+            db.commit()
+            changes_committed.notify()
+            if ids is not None:
+                for index, booking_id in zip(order, ids):
+                    results[index]['id'] = booking_id
+    except Exception:
+        db.rollback()
+        raise
+
+    counts = {'ok': 0, 'error': 0, 'conflict': 0}
+    for result in results:
+        counts[result['status']] += 1
+    return {
+        'total': len(results),
+        'inserted': 0 if dry_run else counts['ok'],
+        'errors': counts['error'],
+        'conflicts': counts['conflict'],
+        'dryRun': dry_run,
+        'rows': results
+    }
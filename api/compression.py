@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Response compression for dock rental API - Accept-Encoding negotiation, gzip and brotli
+
+Whole bodies below COMPRESSION_MIN_BYTES are sent as they are. Streamed bodies are
+compressed chunk by chunk with a sync flush, so clients can decode each chunk as it
+arrives. Brotli is used when the optional brotli package is installed.
+"""
+
+import os
+import zlib
+
+try:
+    import brotli
+except ImportError:  # optional; gzip is always available
+    brotli = None
+
+COMPRESSION_MIN_BYTES = int(os.getenv('COMPRESSION_MIN_BYTES', '1024'))
+GZIP_LEVEL = int(os.getenv('GZIP_LEVEL', '6'))
+BROTLI_QUALITY = int(os.getenv('BROTLI_QUALITY', '5'))
+# Cached payloads are compressed once per version, so they can afford more effort
+CACHED_GZIP_LEVEL = int(os.getenv('CACHED_GZIP_LEVEL', '9'))
+CACHED_BROTLI_QUALITY = int(os.getenv('CACHED_BROTLI_QUALITY', '9'))
+
+# Server preference when the client accepts several with the same q-value
+PREFERRED_ENCODINGS = ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def negotiate(accept_encoding):
+    """The content coding to use for an Accept-Encoding header value, or None for identity"""
+    if not accept_encoding:
+        return None
+    weights = {}
+    for item in accept_encoding.split(','):
+        name, _, params = item.strip().partition(';')
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        weights[name.strip().lower()] = quality
+    best, best_quality = None, 0.0
+    for encoding in PREFERRED_ENCODINGS:
+        quality = weights.get(encoding, weights.get('*', 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def compress(body, encoding, cached=False):
+    """`body` compressed as a whole with `encoding` ('br' or 'gzip')"""
+    if encoding == 'br':
+        return brotli.compress(body, quality=CACHED_BROTLI_QUALITY if cached else BROTLI_QUALITY)
+    compressor = zlib.compressobj(CACHED_GZIP_LEVEL if cached else GZIP_LEVEL, zlib.DEFLATED, 31)
+    return compressor.compress(body) + compressor.flush()
+
+
+def iter_compressed(chunks, encoding):
+    """Compress a stream of byte strings, emitting output at each input chunk boundary"""
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        for data in chunks:
+            yield compressor.process(data) + compressor.flush()
+        yield compressor.finish()
+    else:
+        compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+        for data in chunks:
+            yield compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        yield compressor.flush()
@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+"""
+Blocking calls under the ASGI app for dock rental API
+
+Route code is synchronous. The ASGI app runs it inside SQLAlchemy's greenlet bridge,
+so database IO already yields to the event loop; run_blocking() does the same for
+other blocking calls (Stripe requests, retry back-off) by moving them to a worker
+thread. Outside the ASGI app it just calls the function.
+"""
+
+import asyncio
+import contextvars
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy.exc import MissingGreenlet
+from sqlalchemy.util import await_only
+
+# Threads for blocking calls made by in-flight ASGI requests. The default executor is
+# sized for CPU work; slow Stripe round trips need one thread each to overlap.
+BLOCKING_THREADS = int(os.getenv('ASGI_BLOCKING_THREADS', '64'))
+
+_executor = None
+
+
+async def _in_thread(func, args, kwargs):
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(BLOCKING_THREADS, thread_name_prefix='blocking')
+    call = functools.partial(contextvars.copy_context().run, func, *args, **kwargs)
+    return await asyncio.get_running_loop().run_in_executor(_executor, call)
+
+
+def run_blocking(func, *args, **kwargs):
+    """func(*args, **kwargs), in a worker thread when called from an ASGI request"""
+    try:
+        # await_only() raises before running anything when there is no event loop greenlet
+        return await_only(_in_thread(func, args, kwargs))
+    except MissingGreenlet:
+        return func(*args, **kwargs)
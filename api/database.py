@@ -4,22 +4,75 @@ Database configuration and models for dock rental app
 """
 
 import os
-from sqlalchemy import create_engine, Column, Integer, String, Float, Boolean, DateTime, Text, ForeignKey
+import time
+import hashlib
+import threading
+import itertools
+from contextlib import contextmanager
+from sqlalchemy import create_engine, Table, Column, PrimaryKeyConstraint, Integer, String, Float, Boolean, DateTime, Text, ForeignKey, Index, DDL, JSON, LargeBinary, event, select, text, inspect
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, relationship
+from sqlalchemy.orm import sessionmaker, relationship, Session
+from sqlalchemy.sql import Select
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool, NullPool
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.schema import CreateTable, CreateIndex
 from datetime import datetime
-import json
 
 # Database URL from environment variable (Vercel will provide this)
 DATABASE_URL = os.getenv('POSTGRES_URL', 'postgresql://localhost/dock_rental')
 
-# Create engine
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Connection pool settings. Serverless workers are short-lived and numerous, so keep
+# the per-process pool small, or set DB_POOL_MODE=pgbouncer when an external
+# transaction-mode pooler sits in front of Postgres.
+DB_POOL_MODE = os.getenv('DB_POOL_MODE', 'persistent')  # 'persistent' or 'pgbouncer'
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '2'))
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', '3'))
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '10'))
+DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', '300'))
+
+# Optional read replicas (comma-separated URLs). Read-only requests use them round-robin;
+# a replica that fails its health check, or lags more than REPLICA_MAX_LAG seconds on
+# Postgres, is skipped until its next check
+REPLICA_URLS = [url.strip() for url in os.getenv('POSTGRES_REPLICA_URLS', '').split(',') if url.strip()]
+REPLICA_CHECK_INTERVAL = float(os.getenv('REPLICA_CHECK_INTERVAL', '10'))
+REPLICA_MAX_LAG = float(os.getenv('REPLICA_MAX_LAG', '30'))
+# After a client writes, its reads go to the primary for this long (read-your-writes)
+REPLICA_PIN_SECONDS = int(os.getenv('REPLICA_PIN_SECONDS', '5'))
+
+class RoutingSession(Session):
+    """
+    Session that sends plain SELECTs to `replica` when one is set.
+
+    Flushes, DML, text() statements and SELECT ... FOR UPDATE always go to the primary,
+    so a read-only request that happens to write still writes in the right place.
+    """
+    
+    replica = None
+    
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if (self.replica is not None and not self._flushing
+                and isinstance(clause, Select) and clause._for_update_arg is None):
+            return self.replica
+        return super().get_bind(mapper=mapper, clause=clause, **kwargs)
+
+# Engine is created on first use (see get_engine) so importing this module stays cheap
+_engine = None
+_engine_lock = threading.Lock()
+SessionLocal = sessionmaker(class_=RoutingSession, autocommit=False, autoflush=False)
+
+# asyncio engine for the ASGI app (see get_async_engine), also created on first use
+_async_engine = None
+AsyncSessionLocal = async_sessionmaker(sync_session_class=RoutingSession, autoflush=False)
 
 # Create base class for models
 Base = declarative_base()
 
+# JSON list columns: native JSONB on Postgres, JSON-encoded text elsewhere (e.g. SQLite)
+JSONList = JSON(none_as_null=True).with_variant(JSONB(none_as_null=True), 'postgresql')
+
 class User(Base):
     __tablename__ = "users"
     
@@ -44,39 +97,52 @@ class Slip(Base):
     width = Column(Float, nullable=False)
     depth = Column(Float, nullable=False)
     price_per_night = Column(Float, nullable=False)
-    amenities = Column(Text)  # JSON string
+    amenities = Column(JSONList)  # list of amenity names
     description = Column(Text)
     dock_etiquette = Column(Text)
     available = Column(Boolean, default=True)
-    images = Column(Text)  # JSON string
+    images = Column(JSONList)  # list of image URLs
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    __table_args__ = (
+        # Boat-fit search: equality on available, then range scans on size or price
+        Index('ix_slips_fit', 'available', 'max_length', 'width', 'depth'),
+        Index('ix_slips_price', 'available', 'price_per_night'),
+        # Serves amenity containment filters (amenities @> '["Water"]')
+        Index('ix_slips_amenities', 'amenities', postgresql_using='gin').ddl_if(dialect='postgresql'),
+        # Delta sync reads changes in (updated_at, id) order
+        Index('ix_slips_updated', 'updated_at', 'id'),
+    )
+    
     # Relationships
     bookings = relationship("Booking", back_populates="slip")
     
     def get_amenities_list(self):
-        """Convert amenities JSON string to list"""
-        if self.amenities:
-            return json.loads(self.amenities)
-        return []
+        """Amenities as a list (already decoded by the driver)"""
+        return self.amenities or []
     
     def set_amenities_list(self, amenities_list):
-        """Convert amenities list to JSON string"""
-        self.amenities = json.dumps(amenities_list)
+        self.amenities = list(amenities_list)
     
     def get_images_list(self):
-        """Convert images JSON string to list"""
-        if self.images:
-            return json.loads(self.images)
-        return []
+        """Images as a list (already decoded by the driver)"""
+        return self.images or []
     
     def set_images_list(self, images_list):
-        """Convert images list to JSON string"""
-        self.images = json.dumps(images_list)
+        self.images = list(images_list)
+
+# Booking statuses that no longer hold the slip
+INACTIVE_STATUSES = ('cancelled',)
 
 class Booking(Base):
     __tablename__ = "bookings"
+    __table_args__ = (
+        # Range lookups for overlap detection: slip first, then dates
+        Index('ix_bookings_slip_dates', 'slip_id', 'check_in', 'check_out'),
+        # Delta sync reads changes in (updated_at, id) order
+        Index('ix_bookings_updated', 'updated_at', 'id'),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     slip_id = Column(Integer, ForeignKey("slips.id"), nullable=False)
@@ -108,21 +174,477 @@ class Booking(Base):
     slip = relationship("Slip", back_populates="bookings")
     user = relationship("User", back_populates="bookings")
 
+# On Postgres, let the database itself reject overlapping active bookings per slip
+event.listen(
+    Booking.__table__,
+    'after_create',
+    DDL("CREATE EXTENSION IF NOT EXISTS btree_gist").execute_if(dialect='postgresql')
+)
+BOOKINGS_NO_OVERLAP = (
+    "ALTER TABLE bookings ADD CONSTRAINT bookings_no_overlap "
+    "EXCLUDE USING gist (slip_id WITH =, tsrange(check_in, check_out) WITH &&) "
+    "WHERE (status <> 'cancelled')"
+)
+event.listen(Booking.__table__, 'after_create', DDL(BOOKINGS_NO_OVERLAP).execute_if(dialect='postgresql'))
+# Pairs of active bookings that bookings_no_overlap would reject, for operators to resolve
+OVERLAPPING_BOOKINGS = text(
+    "SELECT a.id, b.id FROM bookings a JOIN bookings b "
+    "ON a.slip_id = b.slip_id AND a.id < b.id AND a.check_in < b.check_out AND b.check_in < a.check_out "
+    "WHERE a.status <> 'cancelled' AND b.status <> 'cancelled' "
+    "ORDER BY a.id, b.id LIMIT :limit"
+)
+
+# Bookings moved out of the live table by archive.py: same columns, plus when they were
+# moved. On Postgres the table is partitioned by check-in year, so date-filtered reads
+# with include_archived only touch the years they ask for.
+class ArchivedBooking(Base):
+    __table__ = Table(
+        "bookings_archive",
+        Base.metadata,
+        *[Column(column.name, column.type, nullable=column.nullable) for column in Booking.__table__.columns],
+        Column('archived_at', DateTime, default=datetime.utcnow),
+        # The partition key has to be part of the primary key
+        PrimaryKeyConstraint('id', 'check_in'),
+        Index('ix_bookings_archive_slip_dates', 'slip_id', 'check_in', 'check_out'),
+        postgresql_partition_by='RANGE (check_in)'
+    )
+
+class SlipCalendar(Base):
+    __tablename__ = "slip_calendars"
+    
+    # One bit per night of the season (calendar year); set = occupied
+    slip_id = Column(Integer, ForeignKey("slips.id"), primary_key=True)
+    season = Column(Integer, primary_key=True)
+    bitmap = Column(LargeBinary, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class BookingRollup(Base):
+    __tablename__ = "booking_rollups"
+    __table_args__ = (
+        # Dashboard queries filter on a month range first
+        Index('ix_booking_rollups_month', 'month'),
+    )
+    
+    # Booked nights aggregated by slip, month, status and payment status (see analytics.py)
+    slip_id = Column(Integer, ForeignKey("slips.id"), primary_key=True)
+    month = Column(String(7), primary_key=True)  # 'YYYY-MM'
+    status = Column(String, primary_key=True)
+    payment_status = Column(String, primary_key=True)
+    bookings = Column(Integer, nullable=False)
+    nights = Column(Integer, nullable=False)
+    revenue = Column(Float, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class RevokedToken(Base):
+    __tablename__ = "revoked_tokens"
+    __table_args__ = (
+        # Each process reloads recent revocations by revoked_at (see auth.RevocationList)
+        Index('ix_revoked_tokens_revoked_at', 'revoked_at'),
+    )
+    
+    # Session tokens ended before they expire (logout); rows are purged after expires_at
+    jti = Column(String, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"))
+    expires_at = Column(DateTime, nullable=False)
+    revoked_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+class SchemaVersion(Base):
+    __tablename__ = "schema_version"
+    
+    id = Column(Integer, primary_key=True)
+    fingerprint = Column(String, nullable=False)
+    applied_at = Column(DateTime, default=datetime.utcnow)
+
+# Key for the Postgres advisory lock held while bootstrapping the schema
+SCHEMA_LOCK_KEY = 8208201
+
+_schema_ready = False
+_schema_lock = threading.Lock()
+
+class MeteredQueuePool(QueuePool):
+    """QueuePool that records how long checkouts wait for a free connection"""
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.wait_count = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.timeouts = 0
+    
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except Exception:
+            self.timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - start
+            self.wait_count += 1
+            self.wait_seconds_total += waited
+            self.wait_seconds_max = max(self.wait_seconds_max, waited)
+
+class MeteredAsyncQueuePool(MeteredQueuePool, AsyncAdaptedQueuePool):
+    """MeteredQueuePool for asyncio engines"""
+
+def engine_options(url, queue_pool=MeteredQueuePool):
+    """create_engine() keyword arguments for the configured pool mode"""
+    url = make_url(url)
+    if url.get_backend_name() == 'sqlite':
+        return {}
+    
+    options = {'pool_pre_ping': True}
+    if DB_POOL_MODE == 'pgbouncer':
+        # The external pooler owns the connections; don't hold any between requests
+        options['poolclass'] = NullPool
+        # Transaction pooling hands each transaction a different server connection,
+        # so server-side prepared statements must not be cached per connection
+        if url.get_driver_name() == 'psycopg':
+            options['connect_args'] = {'prepare_threshold': None}
+        elif url.get_driver_name() == 'asyncpg':
+            # SQLAlchemy's own asyncpg statement cache is disabled via the URL, see engine_url()
+            options['connect_args'] = {'statement_cache_size': 0}
+    else:
+        options.update(
+            poolclass=queue_pool,
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_recycle=DB_POOL_RECYCLE,
+            pool_use_lifo=True
+        )
+    return options
+
+def engine_url(url):
+    """Database URL adjusted for the configured pool mode"""
+    url = make_url(url)
+    if DB_POOL_MODE == 'pgbouncer' and url.get_driver_name() == 'asyncpg':
+        url = url.update_query_dict({'prepared_statement_cache_size': '0'})
+    return url
+
+def async_engine_url(url):
+    """Database URL for the asyncio drivers: asyncpg for Postgres, aiosqlite for SQLite"""
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend in ('postgresql', 'postgres'):
+        url = url.set(drivername='postgresql+asyncpg')
+        # asyncpg spells libpq's sslmode as ssl
+        if 'sslmode' in url.query:
+            query = dict(url.query)
+            query['ssl'] = query.pop('sslmode')
+            url = url.set(query=query)
+    elif backend == 'sqlite':
+        url = url.set(drivername='sqlite+aiosqlite')
+    return url
+
+def get_engine():
+    """Create the engine on first use and bind SessionLocal to it"""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = create_engine(engine_url(DATABASE_URL), **engine_options(DATABASE_URL))
+                SessionLocal.configure(bind=_engine)
+    return _engine
+
+def get_async_engine():
+    """Create the asyncio engine on first use and bind AsyncSessionLocal to it"""
+    global _async_engine
+    if _async_engine is None:
+        with _engine_lock:
+            if _async_engine is None:
+                url = async_engine_url(DATABASE_URL)
+                _async_engine = create_async_engine(
+                    engine_url(url), **engine_options(url, queue_pool=MeteredAsyncQueuePool)
+                )
+                AsyncSessionLocal.configure(bind=_async_engine)
+    return _async_engine
+
+class ReplicaSet:
+    """Replica engines picked round-robin among those passing their last health check"""
+    
+    def __init__(self, urls, create):
+        self.urls = urls
+        self._create = create
+        self._engines = None
+        self._healthy = []
+        self._checked_at = []
+        self._turn = itertools.count()
+        self._lock = threading.Lock()
+    
+    def _ensure_engines(self):
+        if self._engines is None:
+            with self._lock:
+                if self._engines is None:
+                    self._healthy = [True] * len(self.urls)
+                    self._checked_at = [float('-inf')] * len(self.urls)
+                    self._engines = [self._create(url) for url in self.urls]
+    
+    def _check(self, index):
+        """Probe one replica; on Postgres also require replay lag under REPLICA_MAX_LAG"""
+        engine = self._engines[index]
+        try:
+            with engine.connect() as conn:
+                if engine.dialect.name == 'postgresql':
+                    lag = conn.execute(text(
+                        'SELECT COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)'
+                    )).scalar()
+                    healthy = float(lag) <= REPLICA_MAX_LAG
+                else:
+                    conn.execute(text('SELECT 1'))
+                    healthy = True
+        except Exception as e:
+            print(f"Replica {index} failed its health check: {e}")
+            healthy = False
+        self._healthy[index] = healthy
+        self._checked_at[index] = time.monotonic()
+    
+    def choose(self):
+        """Next healthy replica engine, or None to read from the primary"""
+        if not self.urls:
+            return None
+        self._ensure_engines()
+        start = next(self._turn)
+        for offset in range(len(self._engines)):
+            index = (start + offset) % len(self._engines)
+            if time.monotonic() - self._checked_at[index] >= REPLICA_CHECK_INTERVAL:
+                self._check(index)
+            if self._healthy[index]:
+                return self._engines[index]
+        return None
+    
+    def status(self):
+        if self._engines is None:
+            return []
+        return [
+            {'url': make_url(url).render_as_string(hide_password=True), 'healthy': healthy}
+            for url, healthy in zip(self.urls, self._healthy)
+        ]
+
+replicas = ReplicaSet(REPLICA_URLS, lambda url: create_engine(engine_url(url), **engine_options(url)))
+# The ASGI app binds sessions to the sync facade of its asyncio replica engines
+async_replicas = ReplicaSet(
+    REPLICA_URLS,
+    lambda url: create_async_engine(
+        engine_url(async_engine_url(url)),
+        **engine_options(async_engine_url(url), queue_pool=MeteredAsyncQueuePool)
+    ).sync_engine
+)
+
+def pool_metrics():
+    """Snapshot of the connection pool for monitoring (the ASGI app's pool when it has one)"""
+    pool = (_async_engine or get_engine()).pool
+    metrics = {'mode': DB_POOL_MODE, 'pool': type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        metrics.update(
+            size=pool.size(),
+            checked_out=pool.checkedout(),
+            checked_in=pool.checkedin(),
+            overflow=pool.overflow()
+        )
+    if isinstance(pool, MeteredQueuePool):
+        metrics.update(
+            waits=pool.wait_count,
+            wait_ms_total=round(pool.wait_seconds_total * 1000, 3),
+            wait_ms_max=round(pool.wait_seconds_max * 1000, 3),
+            timeouts=pool.timeouts
+        )
+    if REPLICA_URLS:
+        metrics['replicas'] = (async_replicas if _async_engine is not None else replicas).status()
+    return metrics
+
+def __getattr__(name):
+    # Keep `database.engine` working now that the engine is lazy
+    if name == 'engine':
+        return get_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def schema_fingerprint(dialect):
+    """Hash of the DDL the models compile to, so schema changes yield a new fingerprint"""
+    statements = []
+    for table in Base.metadata.sorted_tables:
+        statements.append(str(CreateTable(table).compile(dialect=dialect)))
+        statements.extend(str(CreateIndex(index).compile(dialect=dialect)) for index in sorted(table.indexes, key=lambda i: i.name))
+    return hashlib.sha256('\n'.join(statements).encode()).hexdigest()
+
+def current_schema_fingerprint(conn):
+    """Fingerprint recorded by the last bootstrap, or None if the database was never bootstrapped"""
+    if not inspect(conn).has_table(SchemaVersion.__tablename__):
+        return None
+    return conn.execute(
+        select(SchemaVersion.fingerprint).order_by(SchemaVersion.id.desc()).limit(1)
+    ).scalar()
+
 # Create all tables
-def create_tables():
-    Base.metadata.create_all(bind=engine)
+def create_tables(bind=None):
+    Base.metadata.create_all(bind=bind if bind is not None else get_engine())
+
+def overlapping_bookings(conn, limit=50):
+    """(booking id, booking id) pairs of active bookings on the same slip with overlapping dates"""
+    return [tuple(row) for row in conn.execute(OVERLAPPING_BOOKINGS, {'limit': limit})]
 
-# Get database session
-def get_db():
+def add_overlap_constraint(conn):
+    """
+    Add bookings_no_overlap to a bookings table created before it existed; True once present.
+
+    Runs in a savepoint: while existing active bookings overlap, the ALTER fails, the
+    conflicting pairs are printed and the rest of the bootstrap goes ahead without it.
+    """
+    has_overlap_constraint = conn.execute(
+        text("SELECT 1 FROM pg_constraint WHERE conname = 'bookings_no_overlap' AND conrelid = 'bookings'::regclass")
+    ).first()
+    if has_overlap_constraint:
+        return True
+    try:
+        with conn.begin_nested():
+            conn.execute(text('CREATE EXTENSION IF NOT EXISTS btree_gist'))
+            conn.execute(text(BOOKINGS_NO_OVERLAP))
+    except IntegrityError:
+        pairs = ', '.join(f'{first}/{second}' for first, second in overlapping_bookings(conn))
+        print(f"bookings_no_overlap not added; cancel or move these overlapping bookings first: {pairs}")
+        return False
+    return True
+
+def migrate_tables(conn):
+    """
+    In-place upgrades of existing tables that create_all() does not perform.
+
+    Returns False if an upgrade is still pending (see add_overlap_constraint), so the
+    schema is not recorded as current and the next bootstrap tries again.
+    """
+    if conn.dialect.name != 'postgresql':
+        return True
+    # amenities/images used to be TEXT columns holding JSON strings
+    columns = {column['name']: column['type'] for column in inspect(conn).get_columns('slips')}
+    for name in ('amenities', 'images'):
+        if not isinstance(columns[name], JSONB):
+            conn.execute(text(f'ALTER TABLE slips ALTER COLUMN {name} TYPE jsonb USING {name}::jsonb'))
+    conn.execute(text('CREATE INDEX IF NOT EXISTS ix_slips_amenities ON slips USING gin (amenities)'))
+    conn.execute(text('CREATE INDEX IF NOT EXISTS ix_slips_fit ON slips (available, max_length, width, depth)'))
+    conn.execute(text('CREATE INDEX IF NOT EXISTS ix_slips_price ON slips (available, price_per_night)'))
+    conn.execute(text('CREATE INDEX IF NOT EXISTS ix_slips_updated ON slips (updated_at, id)'))
+    conn.execute(text('CREATE INDEX IF NOT EXISTS ix_bookings_updated ON bookings (updated_at, id)'))
+    conn.execute(text('CREATE INDEX IF NOT EXISTS ix_bookings_slip_dates ON bookings (slip_id, check_in, check_out)'))
+    return add_overlap_constraint(conn)
+
+def bootstrap_schema():
+    """
+    Create tables, seed sample data and record the schema fingerprint.
+
+    Safe to run from several cold starts at once: on Postgres the work happens under an
+    advisory lock and is skipped if another process finished it first.
+    """
+    engine = get_engine()
+    fingerprint = schema_fingerprint(engine.dialect)
+    with engine.begin() as conn:
+        if engine.dialect.name == 'postgresql':
+            conn.execute(text('SELECT pg_advisory_xact_lock(:key)'), {'key': SCHEMA_LOCK_KEY})
+        if current_schema_fingerprint(conn) == fingerprint:
+            return False
+        create_tables(bind=conn)
+        migrated = migrate_tables(conn)
+        init_db(bind=conn)
+        if migrated:
+            conn.execute(SchemaVersion.__table__.insert().values(fingerprint=fingerprint, applied_at=datetime.utcnow()))
+    return True
+
+def ensure_schema():
+    """
+    Bootstrap the schema at most once per deployment.
+
+    The first request in each process compares the recorded fingerprint with the models
+    (one small query); DDL and seeding only run when they differ. A failed bootstrap
+    raises and is retried by the next caller rather than serving a half-migrated schema.
+    """
+    global _schema_ready
+    if _schema_ready:
+        return
+    with _schema_lock:
+        if _schema_ready:
+            return
+        try:
+            engine = get_engine()
+            with engine.connect() as conn:
+                current = current_schema_fingerprint(conn)
+            if current != schema_fingerprint(engine.dialect):
+                bootstrap_schema()
+        except Exception as e:
+            print(f"Database initialization error: {e}")
+            raise
+        _schema_ready = True
+
+def open_session(read_only=False):
+    """
+    New session on a bootstrapped schema; the caller must close it.
+
+    With read_only=True its SELECTs go to a healthy replica, if any are configured.
+    """
+    ensure_schema()
     db = SessionLocal()
+    if read_only:
+        db.replica = replicas.choose()
+    return db
+
+def open_async_session(read_only=False):
+    """New AsyncSession; the schema is bootstrapped when the ASGI app starts"""
+    get_async_engine()
+    db = AsyncSessionLocal()
+    if read_only:
+        # Health checks connect through the sync facade, so this must run inside the greenlet
+        db.sync_session.replica = async_replicas.choose()
+    return db
+
+@contextmanager
+def session_scope(read_only=False):
+    """Session for one unit of work that is always closed, even if the body raises"""
+    db = open_session(read_only)
+    try:
+        yield db
+    finally:
+        db.close()
+
+@contextmanager
+def atomic_session(bind):
+    """
+    Session on `bind` whose commit() calls only release savepoints of one outer
+    transaction. The outer transaction commits when the block exits normally and rolls
+    back if it raises, so several committing operations succeed or fail together.
+    """
+    ensure_schema()
+    with bind.connect() as conn:
+        transaction = conn.begin()
+        driver_connection = None
+        if conn.dialect.name == 'sqlite':
+            # The sqlite3 driver starts transactions lazily, and a SAVEPOINT outside one
+            # commits on RELEASE; take manual control and begin (and lock) up front
+            driver_connection = conn.connection.dbapi_connection
+            driver_connection.isolation_level = None
+            conn.exec_driver_sql('BEGIN IMMEDIATE')
+        db = SessionLocal(bind=conn, join_transaction_mode='create_savepoint')
+        try:
+            yield db
+        except BaseException:
+            db.close()
+            transaction.rollback()
+            raise
+        else:
+            db.close()
+            transaction.commit()
+        finally:
+            if driver_connection is not None:
+                driver_connection.isolation_level = ''
+
+# Get database session (generator form; exhaust it or use session_scope)
+def get_db(read_only=False):
+    db = open_session(read_only)
     try:
         yield db
     finally:
         db.close()
 
 # Initialize database with sample data
-def init_db():
-    db = SessionLocal()
+def init_db(bind=None):
+    db = SessionLocal(bind=bind if bind is not None else get_engine())
     try:
         # Check if we already have data
         if db.query(Slip).count() > 0:
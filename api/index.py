@@ -4,26 +4,153 @@ Vercel serverless function handler for dock rental API
 """
 
 from http.server import BaseHTTPRequestHandler
+from http.client import HTTPMessage
 import json
-import os
 import stripe
-from datetime import datetime
+from datetime import datetime, timedelta
 import hashlib
-from database import get_db, User, Slip, Booking, create_tables, init_db
+import io
+import time
+from urllib.parse import urlparse, parse_qs
+from sqlalchemy import select
+from database import open_session, atomic_session, pool_metrics, User, Slip, Booking, REPLICA_URLS, REPLICA_PIN_SECONDS
+from booking_engine import create_booking, cancel_booking, BookingConflict, list_bookings, stream_bookings, filtered_bookings_query, parse_datetime, DEFAULT_PAGE_SIZE
+from streaming import iter_json_list, iter_csv, write_chunked, STREAM_BATCH_SIZE
+from slip_cache import get_slips_payload, etag_matches, slip_to_dict, encoded_body, representation_etag, invalidate as invalidate_slip_cache
+from compression import negotiate, compress, iter_compressed, COMPRESSION_MIN_BYTES
+from sync import changes, wait_for_changes, SYNC_PAGE_SIZE
+from batch import parse_entries, execute as execute_batch, run_concurrently, encode_response, BatchAborted
+from slip_search import search_slips
+from availability import occupancy, free_slips, all_slip_ids, calendar
+from slip_updates import set_slip_images, set_all_slip_images, set_slip_images_batch
+from booking_import import import_bookings, read_records
+from analytics import summary as analytics_summary, export_rows
+from pricing import quote_matrix, PriceMismatch
+from payments import payments, configure_stripe, booking_idempotency_key
+from router import Router, RouteNotFound, MethodNotAllowed
+from serializers import BOOKING, USER, booking_to_dict, user_to_dict, dumps
+from instrumentation import start_request, end_request, current as current_timings, timed, metrics
+from auth import (authenticate, bearer_token, issue_token, requires, revocations, InvalidToken, AUTH_ENFORCED,
+                  SESSIONS_ENABLED)
 
 # Configure Stripe
-stripe.api_key = os.getenv('STRIPE_SECRET_KEY')
+configure_stripe()
 if not stripe.api_key:
     raise ValueError("STRIPE_SECRET_KEY environment variable is required")
 
-# Initialize database tables
-try:
-    create_tables()
-    init_db()
-except Exception as e:
-    print(f"Database initialization error: {e}")
+# Request body content types accepted by /api/import-bookings besides JSON
+IMPORT_FORMATS = {'text/csv': 'csv', 'application/x-ndjson': 'jsonl', 'application/jsonl': 'jsonl'}
+
+# Longest occupancy window /api/availability returns in one call
+MAX_CALENDAR_DAYS = 731
+
+# Cookie that keeps a client's reads on the primary for a while after it writes
+PRIMARY_PIN_COOKIE = 'primary_pin'
+
+# User types allowed on the admin routes
+ADMIN_TYPES = ('admin', 'superadmin')
+
+# Route table filled in by the @routes decorators on handler methods
+routes = Router()
+
+def error_status(e):
+    """HTTP status for an exception raised while handling a request"""
+    if isinstance(e, (ValueError, KeyError)):
+        return 400
+    if isinstance(e, InvalidToken):
+        return 401
+    if isinstance(e, PermissionError):
+        return 403
+    if isinstance(e, stripe.StripeError):
+        return 502
+    return 500
+
+def wants_stream(params):
+    return params.get('stream', [None])[0] in ('1', 'true')
+
+def wants_archived(params):
+    """?includeArchived=true: read bookings_archive as well as the live bookings"""
+    return params.get('includeArchived', [None])[0] in ('1', 'true')
+
+def analytics_filters(params):
+    """Keyword arguments for the analytics queries from ?groupBy=&from=&to=&slipId=&status=&paymentStatus="""
+    group_by = params.get('groupBy', ['month'])[0]
+    return {
+        'group_by': [name for name in group_by.split(',') if name],
+        'start_month': params.get('from', [None])[0],
+        'end_month': params.get('to', [None])[0],
+        'slip_id': params.get('slipId', [None])[0],
+        'status': params.get('status', [None])[0],
+        'payment_status': params.get('paymentStatus', [None])[0]
+    }
 
 class handler(BaseHTTPRequestHandler):
+    _db = None
+    _status = None
+    
+    def handle_one_request(self):
+        try:
+            super().handle_one_request()
+        finally:
+            self._close_session()
+    
+    def _session(self):
+        """Per-request database session, opened on first use and closed when the request ends"""
+        if self._db is None:
+            self._db = self._open_session(self._reads_from_replica())
+        return self._db
+    
+    def _open_session(self, read_only):
+        """A new session, closed by the caller; /api/batch entries open theirs here too"""
+        return open_session(read_only=read_only)
+    
+    def _gather(self, calls):
+        """Results of zero-argument `calls` run concurrently, for /api/batch GET groups"""
+        return run_concurrently(calls)
+    
+    def _reads_from_replica(self):
+        """GETs may read from a replica unless this client wrote recently (see _set_replica_pin)"""
+        if self.command != 'GET':
+            return False
+        # Delta-sync tokens must never move past rows a lagging replica has not received
+        # yet; SYNC_SETTLE_SECONDS only covers commit delays on the primary
+        if 'since' in parse_qs(urlparse(self.path).query):
+            return False
+        cookies = self.headers.get('Cookie') or ''
+        return not any(part.strip().startswith(PRIMARY_PIN_COOKIE + '=') for part in cookies.split(';'))
+    
+    def _authenticate(self):
+        """(claims, user row) for the request's bearer session token, or None without one; raises InvalidToken"""
+        token = bearer_token(self.headers.get('Authorization'))
+        if token is None:
+            return None
+        with timed('auth'):
+            return authenticate(token, self._session)
+    
+    def _authorize(self, user_types):
+        """None if this request may call a route restricted to `user_types`, else (status, response)"""
+        try:
+            session = self._authenticate()
+        except InvalidToken as e:
+            return 401, {'error': 'Not authenticated', 'message': str(e)}
+        except Exception as e:
+            return error_status(e), {'error': 'Failed to authenticate', 'message': str(e)}
+        if session is None:
+            return 401, {'error': 'Not authenticated', 'message': 'A session token is required'}
+        if user_types and session[1].user_type not in user_types:
+            return 403, {'error': 'Forbidden', 'message': f'Requires user type {" or ".join(user_types)}'}
+        return None
+    
+    def send_response(self, code, message=None):
+        # Remembered for the per-route request metrics
+        self._status = code
+        super().send_response(code, message)
+    
+    def _close_session(self):
+        if self._db is not None:
+            db, self._db = self._db, None
+            db.close()
+    
     def _set_security_headers(self):
         """Set security headers for all responses"""
         self.send_header('X-Content-Type-Options', 'nosniff')
@@ -32,411 +159,248 @@ class handler(BaseHTTPRequestHandler):
         self.send_header('Referrer-Policy', 'strict-origin-when-cross-origin')
         self.send_header('Content-Security-Policy', "default-src 'self'")
     
-    def do_GET(self):
-        self.send_response(200)
-        self.send_header('Content-type', 'application/json')
+    def _set_timing_headers(self):
+        """Server-Timing for the work done so far (queries, JSON encoding, Stripe calls)"""
+        timings = current_timings()
+        if timings is not None:
+            self.send_header('Server-Timing', timings.server_timing())
+            self.send_header('Timing-Allow-Origin', '*')
+    
+    def _set_replica_pin(self):
+        """After a successful write, read this client from the primary for REPLICA_PIN_SECONDS"""
+        if REPLICA_URLS and self.command == 'POST' and self._status < 400:
+            self.send_header(
+                'Set-Cookie',
+                f'{PRIMARY_PIN_COOKIE}=1; Max-Age={REPLICA_PIN_SECONDS}; Path=/api; SameSite=Lax; HttpOnly'
+            )
+    
+    def _send_json(self, status, response, headers=()):
+        """Send a complete JSON response with its final status code"""
+        with timed('json'):
+            body = dumps(response)
+        self._send_body(status, body, 'application/json', headers)
+    
+    def _send_body(self, status, body, content_type, headers=()):
+        # Small bodies gain little and cost a compressor setup
+        compressible = len(body) >= COMPRESSION_MIN_BYTES
+        encoding = negotiate(self.headers.get('Accept-Encoding')) if compressible else None
+        if encoding:
+            with timed('compress'):
+                body = compress(body, encoding)
+        self.send_response(status)
+        self.send_header('Content-type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        if encoding:
+            self.send_header('Content-Encoding', encoding)
+        if compressible:
+            self.send_header('Vary', 'Accept-Encoding')
+        for name, value in headers:
+            self.send_header(name, value)
         self.send_header('Access-Control-Allow-Origin', '*')
         self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
         self.send_header('Access-Control-Allow-Headers', 'Content-Type, Authorization')
         self._set_security_headers()
+        self._set_timing_headers()
+        self._set_replica_pin()
         self.end_headers()
+        self.wfile.write(body)
+    
+    def _dispatch(self, method):
+        """Handle the request, timing it for Server-Timing and the per-route latency histograms"""
+        token = start_request()
+        self._route = 'unmatched'
+        try:
+            self._handle(method)
+        finally:
+            timings = end_request(token)
+            metrics.observe_request(method, self._route, self._status, time.perf_counter() - timings.started)
+    
+    def _handle(self, method):
+        """
+        Route the request and send the handler's result.
         
-        if self.path == '/api/health':
-            response = {
-                'status': 'healthy',
-                'timestamp': datetime.now().isoformat(),
-                'message': 'Dock Rental API is working!'
-            }
-        elif self.path == '/api/debug/status':
-            response = {
-                'status': 'success',
-                'timestamp': datetime.now().isoformat(),
-                'stripe_configured': bool(stripe.api_key),
-                'stripe_key_prefix': stripe.api_key[:20] + '...' if stripe.api_key else None,
-                'message': 'Dock Rental API is running on Vercel'
-            }
-        elif self.path == '/api/slips':
-            # Return all slips data from database
-            try:
-                db = next(get_db())
-                slips = db.query(Slip).all()
-                
-                slips_data = []
-                for slip in slips:
-                    slip_dict = {
-                        'id': slip.id,
-                        'name': slip.name,
-                        'maxLength': slip.max_length,
-                        'width': slip.width,
-                        'depth': slip.depth,
-                        'pricePerNight': slip.price_per_night,
-                        'amenities': slip.get_amenities_list(),
-                        'description': slip.description,
-                        'dockEtiquette': slip.dock_etiquette,
-                        'available': slip.available,
-                        'images': slip.get_images_list(),
-                        'bookings': []
-                    }
-                    slips_data.append(slip_dict)
-                
-                response = {'slips': slips_data}
-            except Exception as e:
-                response = {
-                    'error': 'Failed to fetch slips',
-                    'message': str(e)
-                }
-        elif self.path == '/api/users':
-            # Return all users data from database
-            try:
-                db = next(get_db())
-                users = db.query(User).all()
-                
-                users_data = []
-                for user in users:
-                    user_dict = {
-                        'id': user.id,
-                        'name': user.name,
-                        'email': user.email,
-                        'userType': user.user_type,
-                        'phone': user.phone,
-                        'createdAt': user.created_at.isoformat() if user.created_at else None
-                    }
-                    users_data.append(user_dict)
-                
-                response = {'users': users_data}
-            except Exception as e:
-                response = {
-                    'error': 'Failed to fetch users',
-                    'message': str(e)
-                }
-        elif self.path == '/api/bookings':
-            # Return all bookings data from database
-            try:
-                db = next(get_db())
-                bookings = db.query(Booking).all()
-                
-                bookings_data = []
-                for booking in bookings:
-                    booking_dict = {
-                        'id': booking.id,
-                        'slipId': booking.slip_id,
-                        'slipName': booking.slip.name if booking.slip else None,
-                        'guestName': booking.guest_name,
-                        'guestEmail': booking.guest_email,
-                        'guestPhone': booking.guest_phone,
-                        'checkIn': booking.check_in.isoformat() if booking.check_in else None,
-                        'checkOut': booking.check_out.isoformat() if booking.check_out else None,
-                        'boatLength': booking.boat_length,
-                        'boatMakeModel': booking.boat_make_model,
-                        'userType': booking.user_type,
-                        'nights': booking.nights,
-                        'totalCost': booking.total_cost,
-                        'status': booking.status,
-                        'bookingDate': booking.booking_date.isoformat() if booking.booking_date else None,
-                        'paymentStatus': booking.payment_status,
-                        'paymentDate': booking.payment_date.isoformat() if booking.payment_date else None,
-                        'paymentMethod': booking.payment_method,
-                        'rentalAgreementName': booking.rental_agreement_name,
-                        'insuranceProofName': booking.insurance_proof_name,
-                        'rentalProperty': booking.rental_property,
-                        'rentalStartDate': booking.rental_start_date.isoformat() if booking.rental_start_date else None,
-                        'rentalEndDate': booking.rental_end_date.isoformat() if booking.rental_end_date else None
-                    }
-                    bookings_data.append(booking_dict)
-                
-                response = {'bookings': bookings_data}
-            except Exception as e:
-                response = {
-                    'error': 'Failed to fetch bookings',
-                    'message': str(e)
-                }
-        else:
-            response = {
-                'error': 'Endpoint not found',
-                'path': self.path
+        Route handlers take (params, data) and return a response dict (200), a
+        (status, response) tuple, or None once they have written the response themselves.
+        """
+        url = urlparse(self.path)
+        try:
+            func, path_params = routes.match(method, url.path)
+        except RouteNotFound:
+            return self._send_json(404, {'error': 'Endpoint not found', 'path': self.path})
+        except MethodNotAllowed as e:
+            return self._send_json(
+                405,
+                {'error': 'Method not allowed', 'path': self.path, 'allowed': e.allowed},
+                [('Allow', ', '.join(e.allowed + ['OPTIONS']))]
+            )
+        self._route = routes.patterns[func]
+        
+        user_types = getattr(func, 'user_types', None)
+        if user_types is not None and (AUTH_ENFORCED or method != 'GET'):
+            denied = self._authorize(user_types)
+            if denied is not None:
+                return self._send_json(*denied)
+        
+        params = parse_qs(url.query)
+        for name, value in path_params.items():
+            params[name] = [value]
+        
+        data = None
+        if method == 'POST':
+            self.body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+            self.content_type = self.headers.get('Content-Type', 'application/json').split(';')[0].strip()
+            # Bulk imports may send CSV or JSON Lines bodies instead of a JSON document
+            if self.content_type not in IMPORT_FORMATS:
+                try:
+                    data = json.loads(self.body.decode('utf-8')) if self.body else {}
+                except ValueError as e:
+                    return self._send_json(400, {'error': 'Invalid JSON body', 'message': str(e)})
+                if not isinstance(data, dict):
+                    return self._send_json(400, {'error': 'Request body must be a JSON object'})
+        
+        result = func(self, params, data)
+        if result is None:
+            return
+        status, response = result if isinstance(result, tuple) else (200, result)
+        self._send_json(status, response)
+    
+    def _stream_list(self, path, params):
+        """Send a list endpoint as chunked JSON, encoding rows as they come off the cursor"""
+        db = self._session()
+        try:
+            if path == '/api/bookings':
+                start = params.get('from', [None])[0]
+                end = params.get('to', [None])[0]
+                rows = stream_bookings(
+                    db,
+                    STREAM_BATCH_SIZE,
+                    slip_id=params.get('slipId', [None])[0],
+                    status=params.get('status', [None])[0],
+                    start=parse_datetime(start) if start else None,
+                    end=parse_datetime(end) if end else None,
+                    include_archived=wants_archived(params)
+                )
+                chunks = iter_json_list('bookings', rows, BOOKING.to_dict)
+            else:
+                rows = db.execute(
+                    USER.select().order_by(User.id).execution_options(yield_per=STREAM_BATCH_SIZE)
+                )
+                chunks = iter_json_list('users', rows, USER.to_dict)
+        except Exception as e:
+            return error_status(e), {
+                'error': f'Failed to fetch {path.rsplit("/", 1)[-1]}',
+                'message': str(e)
             }
         
-        self.wfile.write(json.dumps(response).encode())
+        return self._send_chunked(path, chunks, 'application/json')
     
-    def do_POST(self):
+    def _send_chunked(self, path, chunks, content_type, headers=()):
+        """Send a 200 response whose body is written chunk by chunk as `chunks` yields"""
+        # Chunked framing needs HTTP/1.1; HTTP/1.0 clients read until the connection closes
+        chunked = self.request_version == 'HTTP/1.1'
+        if chunked:
+            self.protocol_version = 'HTTP/1.1'
+        encoding = negotiate(self.headers.get('Accept-Encoding'))
+        if encoding:
+            chunks = iter_compressed(chunks, encoding)
         self.send_response(200)
-        self.send_header('Content-type', 'application/json')
+        self.send_header('Content-type', content_type)
+        if encoding:
+            self.send_header('Content-Encoding', encoding)
+        self.send_header('Vary', 'Accept-Encoding')
+        for name, value in headers:
+            self.send_header(name, value)
+        if chunked:
+            self.send_header('Transfer-Encoding', 'chunked')
+        self.send_header('Connection', 'close')
         self.send_header('Access-Control-Allow-Origin', '*')
         self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
         self.send_header('Access-Control-Allow-Headers', 'Content-Type, Authorization')
         self._set_security_headers()
+        # Covers only the work before the first chunk; the rest is in /api/metrics
+        self._set_timing_headers()
+        self._set_replica_pin()
         self.end_headers()
+        self.close_connection = True
         
-        content_length = int(self.headers['Content-Length'])
-        post_data = self.rfile.read(content_length)
-        data = json.loads(post_data.decode('utf-8'))
-        
-        if self.path == '/api/create-payment-intent':
-            try:
-                amount = data.get('amount', 1000)
-                payment_intent = stripe.PaymentIntent.create(
-                    amount=amount,
-                    currency='usd',
-                    metadata={'source': 'dock-rental-app'}
-                )
-                response = {
-                    'client_secret': payment_intent.client_secret,
-                    'payment_intent_id': payment_intent.id
-                }
-            except Exception as e:
-                response = {
-                    'error': 'Payment intent creation failed',
-                    'message': str(e)
-                }
-        
-        elif self.path == '/api/confirm-payment':
-            try:
-                payment_intent_id = data.get('payment_intent_id')
-                if not payment_intent_id:
-                    response = {'error': 'Payment intent ID is required'}
-                else:
-                    payment_intent = stripe.PaymentIntent.retrieve(payment_intent_id)
-                    response = {
-                        'status': payment_intent.status,
-                        'amount': payment_intent.amount,
-                        'currency': payment_intent.currency
-                    }
-            except Exception as e:
-                response = {
-                    'error': 'Payment confirmation failed',
-                    'message': str(e)
-                }
-        
-        elif self.path == '/api/update-slip-images':
-            try:
-                slip_id = data.get('slip_id')
-                image_url = data.get('image_url')
-                
-                if not slip_id or not image_url:
-                    response = {'error': 'slip_id and image_url are required'}
-                else:
-                    # In a real app, this would save to a database
-                    # For now, we'll just return success
-                    response = {
-                        'success': True,
-                        'message': f'Slip {slip_id} image updated successfully',
-                        'slip_id': slip_id,
-                        'image_url': image_url
-                    }
-            except Exception as e:
-                response = {
-                    'error': 'Failed to update slip image',
-                    'message': str(e)
-                }
-        
-        elif self.path == '/api/update-all-slip-images':
-            try:
-                image_url = data.get('image_url')
-                
-                if not image_url:
-                    response = {'error': 'image_url is required'}
-                else:
-                    # In a real app, this would update all slips in a database
-                    # For now, we'll just return success
-                    response = {
-                        'success': True,
-                        'message': 'All slip images updated successfully',
-                        'image_url': image_url,
-                        'updated_count': 12  # Assuming 12 slips
-                    }
-            except Exception as e:
-                response = {
-                    'error': 'Failed to update all slip images',
-                    'message': str(e)
-                }
-        
-        elif self.path == '/api/register-user':
-            try:
-                name = data.get('name')
-                email = data.get('email')
-                password = data.get('password')
-                phone = data.get('phone', '')
-                user_type = data.get('userType', 'renter')
-                
-                if not name or not email or not password:
-                    response = {'error': 'name, email, and password are required'}
-                else:
-                    db = next(get_db())
-                    
-                    # Check if user already exists
-                    existing_user = db.query(User).filter(User.email == email).first()
-                    if existing_user:
-                        response = {'error': 'User with this email already exists'}
-                    else:
-                        # Hash the password
-                        password_hash = hashlib.sha256(password.encode()).hexdigest()
-                        
-                        # Create new user
-                        new_user = User(
-                            name=name,
-                            email=email,
-                            password_hash=password_hash,
-                            phone=phone,
-                            user_type=user_type
-                        )
-                        
-                        db.add(new_user)
-                        db.commit()
-                        db.refresh(new_user)
-                        
-                        response = {
-                            'success': True,
-                            'message': 'User registered successfully',
-                            'user': {
-                                'id': new_user.id,
-                                'name': new_user.name,
-                                'email': new_user.email,
-                                'phone': new_user.phone,
-                                'userType': new_user.user_type,
-                                'createdAt': new_user.created_at.isoformat() if new_user.created_at else None
-                            }
-                        }
-            except Exception as e:
-                response = {
-                    'error': 'Failed to register user',
-                    'message': str(e)
-                }
-        
-        elif self.path == '/api/login-user':
-            try:
-                email = data.get('email')
-                password = data.get('password')
-                
-                if not email or not password:
-                    response = {'error': 'email and password are required'}
-                else:
-                    db = next(get_db())
-                    
-                    # Hash the password for comparison
-                    password_hash = hashlib.sha256(password.encode()).hexdigest()
-                    
-                    # Find user by email
-                    user = db.query(User).filter(User.email == email).first()
-                    
-                    if user and user.password_hash == password_hash:
-                        response = {
-                            'success': True,
-                            'message': 'Login successful',
-                            'user': {
-                                'id': user.id,
-                                'name': user.name,
-                                'email': user.email,
-                                'phone': user.phone,
-                                'userType': user.user_type,
-                                'createdAt': user.created_at.isoformat() if user.created_at else None
-                            }
-                        }
-                    else:
-                        response = {'error': 'Invalid credentials'}
-            except Exception as e:
-                response = {
-                    'error': 'Failed to login user',
-                    'message': str(e)
-                }
+        try:
+            if chunked:
+                write_chunked(self.wfile, chunks)
+            else:
+                for data in chunks:
+                    self.wfile.write(data)
+        except Exception as e:
+            # Headers are already sent; dropping the connection without the final chunk
+            # tells the client the body is incomplete
+            print(f"Streaming {path} failed: {e}")
+        return None
+    
+    def _send_slips(self, amenities):
+        """Send the cached slips payload, or 304 when the client already has this version"""
+        try:
+            payload = get_slips_payload(self._session(), amenities)
+        except Exception as e:
+            return error_status(e), {
+                'error': 'Failed to fetch slips',
+                'message': str(e)
+            }
         
-        elif self.path == '/api/create-booking':
-            try:
-                booking_data = data.get('booking')
-                
-                if not booking_data:
-                    response = {'error': 'booking data is required'}
-                else:
-                    db = next(get_db())
-                    
-                    # Parse dates
-                    check_in = datetime.fromisoformat(booking_data['checkIn'].replace('Z', '+00:00'))
-                    check_out = datetime.fromisoformat(booking_data['checkOut'].replace('Z', '+00:00'))
-                    booking_date = datetime.fromisoformat(booking_data['bookingDate'].replace('Z', '+00:00'))
-                    
-                    # Parse optional dates
-                    payment_date = None
-                    rental_start_date = None
-                    rental_end_date = None
-                    
-                    if booking_data.get('paymentDate'):
-                        payment_date = datetime.fromisoformat(booking_data['paymentDate'].replace('Z', '+00:00'))
-                    if booking_data.get('rentalStartDate'):
-                        rental_start_date = datetime.fromisoformat(booking_data['rentalStartDate'].replace('Z', '+00:00'))
-                    if booking_data.get('rentalEndDate'):
-                        rental_end_date = datetime.fromisoformat(booking_data['rentalEndDate'].replace('Z', '+00:00'))
-                    
-                    # Create new booking
-                    new_booking = Booking(
-                        slip_id=booking_data['slipId'],
-                        user_id=booking_data.get('userId', 1),  # Default to user 1 if not provided
-                        guest_name=booking_data['guestName'],
-                        guest_email=booking_data['guestEmail'],
-                        guest_phone=booking_data.get('guestPhone'),
-                        check_in=check_in,
-                        check_out=check_out,
-                        boat_length=booking_data.get('boatLength'),
-                        boat_make_model=booking_data.get('boatMakeModel'),
-                        user_type=booking_data.get('userType', 'renter'),
-                        nights=booking_data['nights'],
-                        total_cost=booking_data['totalCost'],
-                        status=booking_data.get('status', 'pending'),
-                        booking_date=booking_date,
-                        payment_status=booking_data.get('paymentStatus', 'pending'),
-                        payment_method=booking_data.get('paymentMethod', 'stripe'),
-                        payment_date=payment_date,
-                        rental_agreement_name=booking_data.get('rentalAgreementName'),
-                        insurance_proof_name=booking_data.get('insuranceProofName'),
-                        rental_property=booking_data.get('rentalProperty'),
-                        rental_start_date=rental_start_date,
-                        rental_end_date=rental_end_date
-                    )
-                    
-                    db.add(new_booking)
-                    db.commit()
-                    db.refresh(new_booking)
-                    
-                    response = {
-                        'success': True,
-                        'message': 'Booking created successfully',
-                        'booking': {
-                            'id': new_booking.id,
-                            'slipId': new_booking.slip_id,
-                            'slipName': new_booking.slip.name if new_booking.slip else None,
-                            'guestName': new_booking.guest_name,
-                            'guestEmail': new_booking.guest_email,
-                            'guestPhone': new_booking.guest_phone,
-                            'checkIn': new_booking.check_in.isoformat() if new_booking.check_in else None,
-                            'checkOut': new_booking.check_out.isoformat() if new_booking.check_out else None,
-                            'boatLength': new_booking.boat_length,
-                            'boatMakeModel': new_booking.boat_make_model,
-                            'userType': new_booking.user_type,
-                            'nights': new_booking.nights,
-                            'totalCost': new_booking.total_cost,
-                            'status': new_booking.status,
-                            'bookingDate': new_booking.booking_date.isoformat() if new_booking.booking_date else None,
-                            'paymentStatus': new_booking.payment_status,
-                            'paymentDate': new_booking.payment_date.isoformat() if new_booking.payment_date else None,
-                            'paymentMethod': new_booking.payment_method,
-                            'rentalAgreementName': new_booking.rental_agreement_name,
-                            'insuranceProofName': new_booking.insurance_proof_name,
-                            'rentalProperty': new_booking.rental_property,
-                            'rentalStartDate': new_booking.rental_start_date.isoformat() if new_booking.rental_start_date else None,
-                            'rentalEndDate': new_booking.rental_end_date.isoformat() if new_booking.rental_end_date else None
-                        }
-                    }
-            except Exception as e:
-                response = {
-                    'error': 'Failed to create booking',
-                    'message': str(e)
-                }
+        encoding = None
+        if len(payload['body']) >= COMPRESSION_MIN_BYTES:
+            encoding = negotiate(self.headers.get('Accept-Encoding'))
+        etag = representation_etag(payload['etag'], encoding)
+        not_modified = etag_matches(self.headers.get('If-None-Match'), etag)
+        body = payload['body']
+        if encoding and not not_modified:
+            with timed('compress'):
+                body = encoded_body(payload, encoding)
+        self.send_response(304 if not_modified else 200)
+        self.send_header('Content-type', 'application/json')
+        self.send_header('ETag', etag)
+        if payload['last_modified']:
+            self.send_header('Last-Modified', payload['last_modified'])
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Vary', 'Accept-Encoding')
+        if encoding and not not_modified:
+            self.send_header('Content-Encoding', encoding)
+        if not not_modified:
+            self.send_header('Content-Length', str(len(body)))
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
+        self.send_header('Access-Control-Allow-Headers', 'Content-Type, Authorization, If-None-Match')
+        self.send_header('Access-Control-Expose-Headers', 'ETag, Last-Modified')
+        self._set_security_headers()
+        self._set_timing_headers()
+        self._set_replica_pin()
+        self.end_headers()
         
-        else:
-            response = {
-                'error': 'Endpoint not found',
-                'path': self.path
+        if not not_modified:
+            self.wfile.write(body)
+        return None
+    
+    def _changes(self, key, model, query, to_dict, params):
+        """Delta-sync page for ?since=<token>[&limit=][&wait=<seconds> to long-poll]"""
+        try:
+            db = self._session()
+            since = params['since'][0]
+            limit = params.get('limit', [SYNC_PAGE_SIZE])[0]
+            rows, next_since, has_more = wait_for_changes(
+                db,
+                lambda: changes(db, model, query, since, limit),
+                params.get('wait', [0])[0]
+            )
+            return {key: [to_dict(row) for row in rows], 'nextSince': next_since, 'hasMore': has_more}
+        except Exception as e:
+            return error_status(e), {
+                'error': f'Failed to fetch {key} changes',
+                'message': str(e)
             }
-        
-        self.wfile.write(json.dumps(response).encode())
+    
+    def do_GET(self):
+        self._dispatch('GET')
+    
+    def do_POST(self):
+        self._dispatch('POST')
     
     def do_OPTIONS(self):
         self.send_response(200)
@@ -445,4 +409,633 @@ class handler(BaseHTTPRequestHandler):
         self.send_header('Access-Control-Allow-Headers', 'Content-Type, Authorization')
         self._set_security_headers()
         self.end_headers()
-        self.wfile.write(b'') 
\ No newline at end of file
+        self.wfile.write(b'')
+    
+    # GET routes
+    
+    @routes.get('/api/health')
+    def get_health(self, params, data):
+        return {
+            'status': 'healthy',
+            'timestamp': datetime.now().isoformat(),
+            'message': 'Dock Rental API is working!'
+        }
+    
+    @routes.get('/api/debug/status')
+    def get_debug_status(self, params, data):
+        return {
+            'status': 'success',
+            'timestamp': datetime.now().isoformat(),
+            'stripe_configured': bool(stripe.api_key),
+            'stripe_key_prefix': stripe.api_key[:20] + '...' if stripe.api_key else None,
+            'message': 'Dock Rental API is running on Vercel'
+        }
+    
+    @routes.get('/api/debug/pool')
+    def get_debug_pool(self, params, data):
+        return pool_metrics()
+    
+    @routes.get('/api/metrics')
+    def get_metrics(self, params, data):
+        pool = pool_metrics()
+        gauges = [
+            (f'db_pool_{name}', f'Connection pool {name.replace("_", " ")}', value)
+            for name, value in pool.items() if isinstance(value, (int, float))
+        ]
+        body = metrics.render(gauges).encode()
+        self._send_body(200, body, 'text/plain; version=0.0.4; charset=utf-8')
+    
+    @routes.get('/api/slips')
+    def get_slips(self, params, data):
+        if 'since' in params:
+            return self._changes('slips', Slip, select(Slip), lambda row: slip_to_dict(row[0]), params)
+        return self._send_slips(params.get('amenity', []))
+    
+    @routes.get('/api/slips/search')
+    def get_slips_search(self, params, data):
+        try:
+            def number(name):
+                value = params.get(name, [None])[0]
+                return float(value) if value not in (None, '') else None
+            
+            check_in = params.get('checkIn', [None])[0]
+            check_out = params.get('checkOut', [None])[0]
+            slips = search_slips(
+                self._session(),
+                boat_length=number('boatLength'),
+                boat_width=number('boatWidth'),
+                draft=number('draft'),
+                min_price=number('minPrice'),
+                max_price=number('maxPrice'),
+                check_in=parse_datetime(check_in) if check_in else None,
+                check_out=parse_datetime(check_out) if check_out else None,
+                available_only=params.get('available', ['true'])[0] != 'false',
+                sort=params.get('sort', ['price'])[0],
+                limit=params.get('limit', [50])[0]
+            )
+            return {'slips': [slip_to_dict(slip) for slip in slips]}
+        except Exception as e:
+            return error_status(e), {
+                'error': 'Failed to search slips',
+                'message': str(e)
+            }
+    
+    @routes.get('/api/availability')
+    def get_availability(self, params, data):
+        try:
+            db = self._session()
+            slip_ids = params.get('slipIds', [None])[0]
+            slip_ids = [int(slip_id) for slip_id in slip_ids.split(',')] if slip_ids else all_slip_ids(db)
+            start = parse_datetime(params['from'][0]).date()
+            days = min(int(params.get('days', [30])[0]), MAX_CALENDAR_DAYS)
+            return {
+                'from': start.isoformat(),
+                'days': days,
+                'occupancy': occupancy(db, slip_ids, start, days)
+            }
+        except Exception as e:
+            return error_status(e), {
+                'error': 'Failed to fetch availability',
+                'message': str(e)
+            }
+    
+    @routes.get('/api/availability/free')
+    def get_availability_free(self, params, data):
+        try:
+            db = self._session()
+            slip_ids = params.get('slipIds', [None])[0]
+            slip_ids = [int(slip_id) for slip_id in slip_ids.split(',')] if slip_ids else all_slip_ids(db)
+            # Nights as one from/to range and/or individual night=YYYY-MM-DD values
+            nights = []
+            if params.get('from') and params.get('to'):
+                nights.append((parse_datetime(params['from'][0]).date(), parse_datetime(params['to'][0]).date()))
+            for night in params.get('night', []):
+                first = parse_datetime(night).date()
+                nights.append((first, first + timedelta(days=1)))
+            if not nights:
+                return 400, {'error': 'from and to, or night, are required'}
+            return {'slipIds': free_slips(db, slip_ids, nights)}
+        except Exception as e:
+            return error_status(e), {
+                'error': 'Failed to fetch availability',
+                'message': str(e)
+            }
+    
+    @routes.get('/api/analytics')
+    @requires(*ADMIN_TYPES)
+    def get_analytics(self, params, data):
+        try:
+            return analytics_summary(self._session(), **analytics_filters(params))
+        except Exception as e:
+            return error_status(e), {
+                'error': 'Failed to fetch analytics',
+                'message': str(e)
+            }
+    
+    @routes.get('/api/analytics/export')
+    @requires(*ADMIN_TYPES)
+    def get_analytics_export(self, params, data):
+        """Send an analytics CSV export straight from the query cursor"""
+        report = params.get('report', ['summary'])[0]
+        try:
+            header, rows = export_rows(
+                self._session(),
+                report,
+                STREAM_BATCH_SIZE,
+                include_archived=wants_archived(params),
+                **analytics_filters(params)
+            )
+        except Exception as e:
+            return error_status(e), {
+                'error': 'Failed to export analytics',
+                'message': str(e)
+            }
+        return self._send_chunked(
+            '/api/analytics/export',
+            iter_csv(header, rows),
+            'text/csv; charset=utf-8',
+            [('Content-Disposition', f'attachment; filename="{report}.csv"')]
+        )
+    
+    @routes.get('/api/users')
+    @requires(*ADMIN_TYPES)
+    def get_users(self, params, data):
+        if wants_stream(params):
+            return self._stream_list('/api/users', params)
+        # Return all users data from database
+        try:
+            db = self._session()
+            rows = db.execute(USER.select().order_by(User.id))
+            return {'users': [USER.to_dict(row) for row in rows]}
+        except Exception as e:
+            return error_status(e), {
+                'error': 'Failed to fetch users',
+                'message': str(e)
+            }
+    
+    @routes.get('/api/bookings')
+    def get_bookings(self, params, data):
+        if wants_stream(params):
+            return self._stream_list('/api/bookings', params)
+        if 'since' in params:
+            # Only the slip filter applies: a status filter would hide status changes.
+            # Archived bookings were final before they moved, so the feed skips them
+            query = filtered_bookings_query(slip_id=params.get('slipId', [None])[0])
+            return self._changes('bookings', Booking, query, BOOKING.to_dict, params)
+        if 'limit' not in params and 'cursor' not in params:
+            # Callers that don't page (the dashboard) still get every booking, streamed
+            return self._stream_list('/api/bookings', params)
+        # Return one page of bookings, optionally filtered by slip, status and date window
+        try:
+            start = params.get('from', [None])[0]
+            end = params.get('to', [None])[0]
+            
+            db = self._session()
+            rows, next_cursor = list_bookings(
+                db,
+                cursor=params.get('cursor', [None])[0],
+                limit=params.get('limit', [DEFAULT_PAGE_SIZE])[0],
+                slip_id=params.get('slipId', [None])[0],
+                status=params.get('status', [None])[0],
+                start=parse_datetime(start) if start else None,
+                end=parse_datetime(end) if end else None,
+                include_archived=wants_archived(params)
+            )
+            
+            return {'bookings': [BOOKING.to_dict(row) for row in rows], 'nextCursor': next_cursor}
+        except Exception as e:
+            return error_status(e), {
+                'error': 'Failed to fetch bookings',
+                'message': str(e)
+            }
+    
+    # POST routes
+    
+    @routes.post('/api/create-payment-intent')
+    def post_create_payment_intent(self, params, data):
+        try:
+            amount = data.get('amount', 1000)
+            payment_intent = payments.create_payment_intent(
+                amount=amount,
+                currency='usd',
+                metadata={'source': 'dock-rental-app'},
+                idempotency_key=booking_idempotency_key(data)
+            )
+            return {
+                'client_secret': payment_intent.client_secret,
+                'payment_intent_id': payment_intent.id
+            }
+        except Exception as e:
+            return error_status(e), {
+                'error': 'Payment intent creation failed',
+                'message': str(e)
+            }
+    
+    @routes.post('/api/confirm-payment')
+    def post_confirm_payment(self, params, data):
+        try:
+            payment_intent_id = data.get('payment_intent_id')
+            if not payment_intent_id:
+                return 400, {'error': 'Payment intent ID is required'}
+            return payments.get_payment_intent_status(payment_intent_id)
+        except Exception as e:
+            return error_status(e), {
+                'error': 'Payment confirmation failed',
+                'message': str(e)
+            }
+    
+    @routes.post('/api/stripe-webhook')
+    def post_stripe_webhook(self, params, data):
+        try:
+            event_type = payments.handle_webhook(self.body, self.headers.get('Stripe-Signature'))
+            return {'received': True, 'type': event_type}
+        except Exception as e:
+            return 400 if isinstance(e, stripe.SignatureVerificationError) else error_status(e), {
+                'error': 'Webhook rejected',
+                'message': str(e)
+            }
+    
+    @routes.post('/api/import-bookings')
+    @requires(*ADMIN_TYPES)
+    def post_import_bookings(self, params, data):
+        try:
+            if data is None:
+                records = read_records(self.body.decode('utf-8'), IMPORT_FORMATS[self.content_type])
+            else:
+                records = data.get('bookings') or []
+            return import_bookings(
+                self._session(),
+                records,
+                dry_run=params.get('dryRun', [None])[0] in ('1', 'true')
+            )
+        except Exception as e:
+            return error_status(e), {
+                'error': 'Failed to import bookings',
+                'message': str(e)
+            }
+    
+    @routes.post('/api/update-slip-images')
+    @requires(*ADMIN_TYPES)
+    def post_update_slip_images(self, params, data):
+        try:
+            slip_id = data.get('slip_id')
+            image_url = data.get('image_url')
+            
+            if not slip_id or not image_url:
+                return 400, {'error': 'slip_id and image_url are required'}
+            updated_count = set_slip_images(self._session(), slip_id, [image_url])
+            if not updated_count:
+                return 404, {'error': f'Slip {slip_id} not found'}
+            return {
+                'success': True,
+                'message': f'Slip {slip_id} image updated successfully',
+                'slip_id': slip_id,
+                'image_url': image_url,
+                'updated_count': updated_count
+            }
+        except Exception as e:
+            return error_status(e), {
+                'error': 'Failed to update slip image',
+                'message': str(e)
+            }
+    
+    @routes.post('/api/update-all-slip-images')
+    @requires(*ADMIN_TYPES)
+    def post_update_all_slip_images(self, params, data):
+        try:
+            image_url = data.get('image_url')
+            
+            if not image_url:
+                return 400, {'error': 'image_url is required'}
+            return {
+                'success': True,
+                'message': 'All slip images updated successfully',
+                'image_url': image_url,
+                'updated_count': set_all_slip_images(self._session(), [image_url])
+            }
+        except Exception as e:
+            return error_status(e), {
+                'error': 'Failed to update all slip images',
+                'message': str(e)
+            }
+    
+    @routes.post('/api/update-slip-images-batch')
+    @requires(*ADMIN_TYPES)
+    def post_update_slip_images_batch(self, params, data):
+        try:
+            images = data.get('images')
+            
+            if not isinstance(images, dict) or not all(isinstance(urls, list) for urls in images.values()):
+                return 400, {'error': 'images must map slip_id to a list of image URLs'}
+            return {
+                'success': True,
+                'message': 'Slip images updated successfully',
+                'updated_count': set_slip_images_batch(self._session(), images)
+            }
+        except Exception as e:
+            return error_status(e), {
+                'error': 'Failed to update slip images',
+                'message': str(e)
+            }
+    
+    @routes.post('/api/cancel-booking')
+    def post_cancel_booking(self, params, data):
+        try:
+            booking_id = data.get('booking_id')
+            
+            if not booking_id:
+                return 400, {'error': 'booking_id is required'}
+            # Always checked, whether or not AUTH_ENFORCED is set: this write is destructive
+            session = self._authenticate()
+            if session is None:
+                return 401, {'error': 'Not authenticated', 'message': 'A session token is required'}
+            claims, user = session
+            owner = None if user.user_type in ADMIN_TYPES else user.id
+            booking = cancel_booking(self._session(), booking_id, user_id=owner)
+            return {
+                'success': True,
+                'message': 'Booking cancelled successfully',
+                'booking': booking_to_dict(booking, booking.slip.name if booking.slip else None)
+            }
+        except Exception as e:
+            return error_status(e), {
+                'error': 'Failed to cancel booking',
+                'message': str(e)
+            }
+    
+    @routes.post('/api/register-user')
+    def post_register_user(self, params, data):
+        try:
+            name = data.get('name')
+            email = data.get('email')
+            password = data.get('password')
+            phone = data.get('phone', '')
+            user_type = data.get('userType', 'renter')
+            
+            if not name or not email or not password:
+                return 400, {'error': 'name, email, and password are required'}
+            
+            db = self._session()
+            
+            # Check if user already exists
+            existing_user = db.query(User).filter(User.email == email).first()
+            if existing_user:
+                return 409, {'error': 'User with this email already exists'}
+            
+            # Hash the password
+            password_hash = hashlib.sha256(password.encode()).hexdigest()
+            
+            # Create new user
+            new_user = User(
+                name=name,
+                email=email,
+                password_hash=password_hash,
+                phone=phone,
+                user_type=user_type
+            )
+            
+            db.add(new_user)
+            db.commit()
+            db.refresh(new_user)
+            
+            return 201, {
+                'success': True,
+                'message': 'User registered successfully',
+                'user': user_to_dict(new_user)
+            }
+        except Exception as e:
+            return error_status(e), {
+                'error': 'Failed to register user',
+                'message': str(e)
+            }
+    
+    @routes.post('/api/login-user')
+    def post_login_user(self, params, data):
+        try:
+            email = data.get('email')
+            password = data.get('password')
+            
+            if not email or not password:
+                return 400, {'error': 'email and password are required'}
+            
+            db = self._session()
+            
+            # Hash the password for comparison
+            password_hash = hashlib.sha256(password.encode()).hexdigest()
+            
+            # Find user by email
+            user = db.query(User).filter(User.email == email).first()
+            
+            if not user or user.password_hash != password_hash:
+                return 401, {'error': 'Invalid credentials'}
+            response = {
+                'success': True,
+                'message': 'Login successful',
+                'user': user_to_dict(user)
+            }
+            # Later requests send the token instead of credentials (see auth.py); none is
+            # issued while SESSION_SECRET is unset
+            if SESSIONS_ENABLED:
+                token, claims = issue_token(user.id, user.user_type)
+                response['token'] = token
+                response['expiresAt'] = datetime.utcfromtimestamp(claims['exp']).isoformat() + 'Z'
+            return response
+        except Exception as e:
+            return error_status(e), {
+                'error': 'Failed to login user',
+                'message': str(e)
+            }
+    
+    @routes.get('/api/session')
+    def get_session(self, params, data):
+        """The user of the request's session token, from the user cache"""
+        try:
+            session = self._authenticate()
+            if session is None:
+                return 401, {'error': 'Not authenticated', 'message': 'A session token is required'}
+            claims, user = session
+            return {
+                'user': USER.to_dict(user),
+                'expiresAt': datetime.utcfromtimestamp(claims['exp']).isoformat() + 'Z'
+            }
+        except Exception as e:
+            return error_status(e), {
+                'error': 'Not authenticated' if isinstance(e, InvalidToken) else 'Failed to check session',
+                'message': str(e)
+            }
+    
+    @routes.post('/api/logout')
+    def post_logout(self, params, data):
+        """Revoke the request's session token"""
+        try:
+            session = self._authenticate()
+            if session is None:
+                return 400, {'error': 'A session token is required'}
+            revocations.revoke(self._session(), session[0])
+            return {'success': True, 'message': 'Logged out'}
+        except Exception as e:
+            return error_status(e), {
+                'error': 'Not authenticated' if isinstance(e, InvalidToken) else 'Failed to log out',
+                'message': str(e)
+            }
+    
+    @routes.post('/api/quotes')
+    def post_quotes(self, params, data):
+        try:
+            slip_ids = data.get('slipIds') or []
+            ranges = data.get('ranges') or []
+            
+            if not slip_ids or not ranges:
+                return 400, {'error': 'slipIds and ranges are required'}
+            quotes = quote_matrix(
+                self._session(),
+                slip_ids,
+                [(parse_datetime(r['checkIn']), parse_datetime(r['checkOut'])) for r in ranges],
+                data.get('userType', 'renter')
+            )
+            return {'quotes': quotes, 'count': len(quotes)}
+        except Exception as e:
+            return error_status(e), {
+                'error': 'Failed to quote',
+                'message': str(e)
+            }
+    
+    @routes.post('/api/create-booking')
+    def post_create_booking(self, params, data):
+        try:
+            booking_data = data.get('booking')
+            
+            if not booking_data:
+                return 400, {'error': 'booking data is required'}
+            
+            db = self._session()
+            # Pricing depends on the user type, so it comes from the session, not the body;
+            # without one the stay is priced for a renter
+            user_type, user_id = 'renter', None
+            session = self._authenticate()
+            if session is not None:
+                user = session[1]
+                user_type, user_id = user.user_type, user.id
+                # Admins may book for another user, priced as that user
+                if user.user_type in ADMIN_TYPES and booking_data.get('userId') is not None:
+                    customer = db.get(User, int(booking_data['userId']))
+                    if customer is None:
+                        return 400, {'error': f"User {booking_data['userId']} does not exist"}
+                    user_type, user_id = customer.user_type, customer.id
+            new_booking = create_booking(db, booking_data, user_type=user_type, user_id=user_id)
+            
+            return 201, {
+                'success': True,
+                'message': 'Booking created successfully',
+                'booking': booking_to_dict(new_booking, new_booking.slip.name if new_booking.slip else None)
+            }
+        except (BookingConflict, PriceMismatch) as e:
+            return 409, e.to_dict()
+        except Exception as e:
+            return error_status(e), {
+                'error': 'Failed to create booking',
+                'message': str(e)
+            }
+    
+    @routes.post('/api/batch')
+    def post_batch(self, params, data):
+        try:
+            entries = parse_entries(data)
+        except ValueError as e:
+            return 400, {'error': 'Invalid batch', 'message': str(e)}
+        atomic = bool(data.get('atomic'))
+        
+        def run(entry, db, read_only):
+            return SubRequest(self, entry, db, read_only).run()
+        
+        try:
+            committed = None
+            if atomic:
+                try:
+                    with atomic_session(self._session().get_bind()) as db:
+                        results = execute_batch(entries, run, db, atomic=True, gather=self._gather)
+                    committed = True
+                except BatchAborted as e:
+                    results, committed = e.results, False
+                finally:
+                    if not committed:
+                        # Reads inside the rolled-back transaction may have cached what it wrote
+                        calendar.clear()
+                        invalidate_slip_cache()
+            else:
+                results = execute_batch(entries, run, self._session(), gather=self._gather)
+            body = encode_response(entries, results, atomic, committed)
+        except Exception as e:
+            return error_status(e), {
+                'error': 'Batch failed',
+                'message': str(e)
+            }
+        self._send_body(200, body, 'application/json')
+
+
+class SubRequest(handler):
+    """One /api/batch entry, routed like a top-level request with its response captured"""
+    
+    # Plain body writes, no chunk framing
+    request_version = 'HTTP/1.0'
+    # Request headers the entries inherit from the batch request
+    FORWARDED_HEADERS = ('Authorization', 'Cookie')
+    
+    def __init__(self, parent, entry, db, read_only):
+        # BaseHTTPRequestHandler.__init__ would read the request from a socket
+        self.command = entry.method
+        self.path = entry.path
+        self.headers = HTTPMessage()
+        for name in self.FORWARDED_HEADERS:
+            if parent.headers.get(name):
+                self.headers[name] = parent.headers[name]
+        for name, value in entry.headers.items():
+            self.headers[name] = str(value)
+        if entry.body is None:
+            body = b''
+        elif isinstance(entry.body, str):
+            body = entry.body.encode('utf-8')  # e.g. a CSV import with its own Content-Type
+        else:
+            body = dumps(entry.body)
+        # Bodies are spliced into the batch response, which is compressed as a whole
+        del self.headers['Accept-Encoding']
+        del self.headers['Content-Length']
+        self.headers['Content-Length'] = str(len(body))
+        self.client_address = parent.client_address
+        self.rfile = io.BytesIO(body)
+        self.wfile = io.BytesIO()
+        self.close_connection = True
+        self._parent = parent
+        self._db = db
+        self._owns_session = db is None
+        self._read_only = read_only
+        self._response_headers = {}
+    
+    def _session(self):
+        if self._db is None:
+            # The batch request's kind of session: under asgi.py, one on the async engine
+            self._db = self._parent._open_session(self._read_only and self._reads_from_replica())
+        return self._db
+    
+    def send_response(self, code, message=None):
+        self._status = code
+        self._response_headers = {}
+    
+    def send_header(self, keyword, value):
+        self._response_headers[keyword] = value
+    
+    def end_headers(self):
+        pass
+    
+    def run(self):
+        """Route and handle the entry; returns (status, headers, body bytes)"""
+        try:
+            self._handle(self.command)
+        except Exception as e:
+            print(f"Batch entry {self.command} {self.path} failed: {e}")
+            if self._status is None:
+                self._send_json(500, {'error': 'Internal server error', 'message': str(e)})
+        finally:
+            if self._owns_session and self._db is not None:
+                self._db.close()
+        return self._status, self._response_headers, self.wfile.getvalue()
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Per-request instrumentation for dock rental API
+
+Each request gets a RequestTimings in a context variable. SQLAlchemy cursor events
+add query counts and durations to it, and timed() blocks add named spans (JSON
+encoding, Stripe calls). The handler reports them in a Server-Timing header and
+records per-route latency histograms, served in Prometheus text format.
+"""
+
+import contextvars
+import os
+import threading
+import time
+from contextlib import contextmanager
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Queries slower than this are logged with their SQL
+SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', '250'))
+
+# Latency histogram bucket upper bounds, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_current = contextvars.ContextVar('request_timings', default=None)
+
+
+class RequestTimings:
+    """Query count and named durations collected while handling one request"""
+
+    __slots__ = ('started', 'queries', 'query_seconds', 'spans')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.spans = {}
+
+    def add(self, name, seconds):
+        self.spans[name] = self.spans.get(name, 0.0) + seconds
+
+    def server_timing(self):
+        """Server-Timing header value: db, named spans and total so far, in milliseconds"""
+        parts = [f'db;dur={self.query_seconds * 1000:.1f};desc="{self.queries} queries"']
+        parts += [f'{name};dur={seconds * 1000:.1f}' for name, seconds in self.spans.items()]
+        parts.append(f'total;dur={(time.perf_counter() - self.started) * 1000:.1f}')
+        return ', '.join(parts)
+
+
+def start_request():
+    """Begin collecting timings for the current request; returns a token for end_request()"""
+    return _current.set(RequestTimings())
+
+
+def end_request(token):
+    timings = _current.get()
+    _current.reset(token)
+    return timings
+
+
+def current():
+    return _current.get()
+
+
+@contextmanager
+def timed(name):
+    """Add the block's duration to the current request's `name` span (no-op outside requests)"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings = _current.get()
+        if timings is not None:
+            timings.add(name, time.perf_counter() - start)
+
+
+class Metrics:
+    """Process-wide request and query counters, exported in Prometheus text format"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._latency = {}   # (method, route) -> [bucket counts..., sum, count]
+        self._requests = {}  # (method, route, status) -> count
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.slow_queries = 0
+
+    def observe_request(self, method, route, status, seconds):
+        with self._lock:
+            series = self._latency.get((method, route))
+            if series is None:
+                series = self._latency[(method, route)] = [0] * len(self.buckets) + [0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    series[index] += 1
+            series[-2] += seconds
+            series[-1] += 1
+            key = (method, route, status)
+            self._requests[key] = self._requests.get(key, 0) + 1
+
+    def observe_query(self, seconds, slow):
+        with self._lock:
+            self.queries += 1
+            self.query_seconds += seconds
+            if slow:
+                self.slow_queries += 1
+
+    def render(self, gauges=()):
+        """Prometheus text exposition; `gauges` adds (name, help, value) lines"""
+        lines = [
+            '# HELP http_request_duration_seconds Request latency by route',
+            '# TYPE http_request_duration_seconds histogram',
+        ]
+        with self._lock:
+            for (method, route), series in sorted(self._latency.items()):
+                labels = f'method="{method}",route="{route}"'
+                for bound, count in zip(self.buckets, series):
+                    lines.append(f'http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {count}')
+                lines.append(f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}} {series[-1]}')
+                lines.append(f'http_request_duration_seconds_sum{{{labels}}} {series[-2]:.6f}')
+                lines.append(f'http_request_duration_seconds_count{{{labels}}} {series[-1]}')
+            lines += ['# HELP http_requests_total Requests by route and status', '# TYPE http_requests_total counter']
+            for (method, route, status), count in sorted(self._requests.items()):
+                lines.append(f'http_requests_total{{method="{method}",route="{route}",status="{status}"}} {count}')
+            lines += [
+                '# HELP db_queries_total SQL statements executed',
+                '# TYPE db_queries_total counter',
+                f'db_queries_total {self.queries}',
+                '# HELP db_query_duration_seconds_total Time spent executing SQL',
+                '# TYPE db_query_duration_seconds_total counter',
+                f'db_query_duration_seconds_total {self.query_seconds:.6f}',
+                '# HELP db_slow_queries_total Statements slower than SLOW_QUERY_MS',
+                '# TYPE db_slow_queries_total counter',
+                f'db_slow_queries_total {self.slow_queries}',
+            ]
+        for name, help_text, value in gauges:
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} gauge', f'{name} {value}']
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _query_started(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _query_finished(conn, cursor, statement, parameters, context, executemany):
+    seconds = time.perf_counter() - conn.info['query_started'].pop()
+    slow = seconds * 1000 >= SLOW_QUERY_MS
+    metrics.observe_query(seconds, slow)
+    timings = _current.get()
+    if timings is not None:
+        timings.queries += 1
+        timings.query_seconds += seconds
+    if slow:
+        print(f"Slow query ({seconds * 1000:.1f} ms): {' '.join(statement.split())[:2000]}")
+
+
+@event.listens_for(Engine, 'handle_error')
+def _query_failed(exception_context):
+    # after_cursor_execute does not fire for failed statements; drop their start time
+    conn = exception_context.connection
+    if conn is not None and conn.info.get('query_started'):
+        conn.info['query_started'].pop()
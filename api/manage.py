@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Command line tasks for the dock rental API
+
+Usage:
+    python api/manage.py bootstrap    # create tables, seed data, record schema fingerprint
+    python api/manage.py import-bookings FILE [--format csv|jsonl] [--dry-run]
+    python api/manage.py rebuild-calendar [--season YEAR ...]
+    python api/manage.py rebuild-rollups
+    python api/manage.py seed-synthetic [--slips N] [--bookings N] [--users N] [--seed N]
+    python api/manage.py archive-bookings [--retention-days N] [--batch-size N] [--dry-run]
+"""
+
+import argparse
+import json
+from database import bootstrap_schema, session_scope
+from booking_import import import_bookings, read_records
+import availability
+import analytics
+import synthetic
+import archive
+
+
+def cmd_bootstrap(args):
+    if bootstrap_schema():
+        print("Schema bootstrapped")
+    else:
+        print("Schema already up to date")
+
+
+def cmd_import_bookings(args):
+    fmt = args.format or ('csv' if args.file.endswith('.csv') else 'jsonl')
+    with open(args.file, encoding='utf-8') as f:
+        records = read_records(f.read(), fmt)
+    with session_scope() as db:
+        result = import_bookings(db, records, dry_run=args.dry_run, use_copy=not args.no_copy)
+    rows = result.pop('rows')
+    print(json.dumps(result, indent=2))
+    for row in rows:
+        if row['status'] != 'ok':
+            print(json.dumps(row))
+
+
+def cmd_rebuild_calendar(args):
+    with session_scope() as db:
+        count = availability.rebuild(db, seasons=args.season)
+    print(f"Rebuilt {count} slip calendars")
+
+
+def cmd_rebuild_rollups(args):
+    with session_scope() as db:
+        count = analytics.rebuild(db)
+    print(f"Rebuilt {count} booking rollup rows")
+
+
+def cmd_seed_synthetic(args):
+    with session_scope() as db:
+        added = synthetic.populate(
+            db, slips=args.slips, bookings=args.bookings, users=args.users, seed=args.seed, use_copy=not args.no_copy
+        )
+    print(json.dumps(added))
+
+
+def cmd_archive_bookings(args):
+    with session_scope() as db:
+        result = archive.archive_bookings(
+            db, retention_days=args.retention_days, batch_size=args.batch_size, dry_run=args.dry_run
+        )
+    print(json.dumps(result))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Dock rental API tasks')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    bootstrap = subparsers.add_parser('bootstrap', help='Create tables and seed data once per deployment')
+    bootstrap.set_defaults(func=cmd_bootstrap)
+
+    import_parser = subparsers.add_parser('import-bookings', help='Bulk import bookings from CSV or JSON Lines')
+    import_parser.add_argument('file')
+    import_parser.add_argument('--format', choices=['csv', 'jsonl'], help='Defaults to the file extension')
+    import_parser.add_argument('--dry-run', action='store_true', help='Validate and report without inserting')
+    import_parser.add_argument('--no-copy', action='store_true', help='Use batched INSERTs even on Postgres')
+    import_parser.set_defaults(func=cmd_import_bookings)
+
+    calendar_parser = subparsers.add_parser('rebuild-calendar', help='Rebuild availability bitmaps from bookings')
+    calendar_parser.add_argument('--season', type=int, action='append', help='Only this season (repeatable)')
+    calendar_parser.set_defaults(func=cmd_rebuild_calendar)
+
+    rollups_parser = subparsers.add_parser('rebuild-rollups', help='Rebuild analytics rollups from bookings')
+    rollups_parser.set_defaults(func=cmd_rebuild_rollups)
+
+    synthetic_parser = subparsers.add_parser('seed-synthetic', help='Generate synthetic slips, users and bookings')
+    synthetic_parser.add_argument('--slips', type=int, default=1000)
+    synthetic_parser.add_argument('--bookings', type=int, default=100000)
+    synthetic_parser.add_argument('--users', type=int, default=500)
+    synthetic_parser.add_argument('--seed', type=int, default=82)
+    synthetic_parser.add_argument('--no-copy', action='store_true', help='Use batched INSERTs even on Postgres')
+    synthetic_parser.set_defaults(func=cmd_seed_synthetic)
+
+    archive_parser = subparsers.add_parser('archive-bookings', help='Move finished bookings past retention to the archive')
+    archive_parser.add_argument('--retention-days', type=int, default=archive.ARCHIVE_RETENTION_DAYS)
+    archive_parser.add_argument('--batch-size', type=int, default=archive.ARCHIVE_BATCH_SIZE)
+    archive_parser.add_argument('--dry-run', action='store_true', help='Count eligible bookings without moving them')
+    archive_parser.set_defaults(func=cmd_archive_bookings)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
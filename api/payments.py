@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Stripe client layer for dock rental app - idempotent, retried, time-bounded calls
+and a webhook-fed cache of PaymentIntent status
+"""
+
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from collections import OrderedDict
+import stripe
+from instrumentation import timed
+from concurrency import run_blocking
+
+# Per-call HTTP timeout and retry budget
+STRIPE_TIMEOUT = float(os.getenv('STRIPE_TIMEOUT', '10'))
+STRIPE_MAX_RETRIES = int(os.getenv('STRIPE_MAX_RETRIES', '2'))
+STRIPE_RETRY_BASE_DELAY = float(os.getenv('STRIPE_RETRY_BASE_DELAY', '0.25'))
+
+# How long a PaymentIntent status is served from cache. Statuses that can still
+# change expire quickly, however they arrived; final ones live longer.
+# Stripe does not deliver events in order, so a cached final status is never
+# replaced by a non-final one, nor a status by one observed earlier.
+STATUS_TTL = float(os.getenv('STRIPE_STATUS_TTL', '5'))
+FINAL_STATUS_TTL = float(os.getenv('STRIPE_FINAL_STATUS_TTL', '3600'))
+STATUS_CACHE_SIZE = 10000
+FINAL_STATUSES = ('succeeded', 'canceled')
+
+STRIPE_WEBHOOK_SECRET = os.getenv('STRIPE_WEBHOOK_SECRET')
+
+# Errors worth retrying: network failures, rate limits and Stripe-side 5xx
+RETRYABLE_ERRORS = (stripe.APIConnectionError, stripe.RateLimitError, stripe.APIError)
+
+
+def _first(mapping, *keys):
+    for key in keys:
+        if mapping.get(key) is not None:
+            return mapping[key]
+    return None
+
+
+def booking_idempotency_key(data):
+    """
+    Idempotency key for a create-payment-intent request, derived from the booking.
+
+    Retries and double submits of the same booking map to the same PaymentIntent.
+    Requests without identifying booking fields get a random key, which still makes
+    our own retries of that one request safe.
+    """
+    booking = data.get('booking') or data.get('bookingData') or {}
+    parts = [
+        _first(booking, 'slip_id', 'slipId'),
+        _first(booking, 'guest_email', 'guestEmail'),
+        _first(booking, 'check_in', 'checkIn'),
+        _first(booking, 'check_out', 'checkOut'),
+    ]
+    if not any(parts):
+        return f'pi-{uuid.uuid4().hex}'
+    parts += [data.get('amount'), data.get('currency', 'usd')]
+    return 'pi-' + hashlib.sha256(json.dumps(parts, default=str).encode()).hexdigest()[:48]
+
+
+class StatusCache:
+    """Thread-safe LRU of PaymentIntent id -> (expires_at, status dict, observed at)"""
+
+    def __init__(self, max_size=STATUS_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, payment_intent_id):
+        with self._lock:
+            entry = self._entries.get(payment_intent_id)
+            if entry is None:
+                return None
+            expires_at, status, _ = entry
+            if expires_at < time.monotonic():
+                del self._entries[payment_intent_id]
+                return None
+            self._entries.move_to_end(payment_intent_id)
+            return status
+
+    def put(self, payment_intent_id, status, ttl, created):
+        """
+        Cache `status` unless it is staler than the cached one; returns the status kept.
+
+        `created` is when the status was observed, in Unix seconds: the Stripe event
+        timestamp for webhook-delivered statuses, the time of the call for API reads.
+        """
+        with self._lock:
+            entry = self._entries.get(payment_intent_id)
+            if entry is not None:
+                _, current, current_created = entry
+                current_final = current['status'] in FINAL_STATUSES
+                final = status['status'] in FINAL_STATUSES
+                if current_final and not final:
+                    return current
+                # A final status ends the PaymentIntent, so it wins even against clock skew
+                if created < current_created and not (final and not current_final):
+                    return current
+            self._entries[payment_intent_id] = (time.monotonic() + ttl, status, created)
+            self._entries.move_to_end(payment_intent_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return status
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def intent_status(payment_intent):
+    """The fields /api/confirm-payment reports for a PaymentIntent"""
+    return {
+        'status': payment_intent['status'],
+        'amount': payment_intent['amount'],
+        'currency': payment_intent['currency']
+    }
+
+
+class PaymentClient:
+    """Wraps the Stripe PaymentIntent calls used by the API"""
+
+    def __init__(self, api=stripe, max_retries=STRIPE_MAX_RETRIES, base_delay=STRIPE_RETRY_BASE_DELAY, sleep=time.sleep):
+        self.api = api
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.sleep = sleep
+        self.status_cache = StatusCache()
+
+    def _call(self, func, **kwargs):
+        """Call Stripe, retrying transient failures with jittered exponential backoff"""
+        attempt = 0
+        while True:
+            try:
+                with timed('stripe'):
+                    return run_blocking(func, **kwargs)
+            except RETRYABLE_ERRORS as e:
+                # 4xx APIErrors (other than rate limits) will fail the same way again
+                status = getattr(e, 'http_status', None)
+                if attempt >= self.max_retries or (status is not None and status < 500 and not isinstance(e, stripe.RateLimitError)):
+                    raise
+                run_blocking(self.sleep, self.base_delay * (2 ** attempt) * (0.5 + random.random()))
+                attempt += 1
+
+    def create_payment_intent(self, amount, idempotency_key, currency='usd', metadata=None):
+        payment_intent = self._call(
+            self.api.PaymentIntent.create,
+            amount=amount,
+            currency=currency,
+            metadata=metadata or {},
+            idempotency_key=idempotency_key
+        )
+        self.remember(payment_intent)
+        return payment_intent
+
+    def get_payment_intent_status(self, payment_intent_id):
+        """Status of a PaymentIntent, from cache when fresh, otherwise from Stripe"""
+        status = self.status_cache.get(payment_intent_id)
+        if status is None:
+            payment_intent = self._call(self.api.PaymentIntent.retrieve, id=payment_intent_id)
+            status = self.remember(payment_intent)
+        return status
+
+    def remember(self, payment_intent, event_created=None):
+        """Cache a PaymentIntent's status; `event_created` is set for webhook-delivered ones"""
+        status = intent_status(payment_intent)
+        ttl = FINAL_STATUS_TTL if status['status'] in FINAL_STATUSES else STATUS_TTL
+        created = event_created if event_created is not None else time.time()
+        return self.status_cache.put(payment_intent['id'], status, ttl, created)
+
+    def handle_webhook(self, payload, signature, secret=None):
+        """
+        Verify a Stripe webhook and refresh the status cache from payment_intent events.
+
+        Returns the event type. Raises ValueError or stripe.SignatureVerificationError
+        for payloads that must be rejected.
+        """
+        secret = secret or STRIPE_WEBHOOK_SECRET
+        if not secret:
+            raise ValueError('STRIPE_WEBHOOK_SECRET is not configured')
+        event = self.api.Webhook.construct_event(payload, signature, secret)
+        if event['type'].startswith('payment_intent.'):
+            self.remember(event['data']['object'], event_created=event.get('created', 0))
+        return event['type']
+
+
+def configure_stripe():
+    """Apply API key, timeout and optional local API base (e.g. stripe-mock) to the stripe module"""
+    stripe.api_key = os.getenv('STRIPE_SECRET_KEY')
+    if os.getenv('STRIPE_API_BASE'):
+        stripe.api_base = os.getenv('STRIPE_API_BASE')
+    # Retries are handled by PaymentClient so they share its backoff and idempotency keys
+    stripe.max_network_retries = 0
+    stripe.default_http_client = stripe.new_default_http_client(timeout=STRIPE_TIMEOUT)
+
+
+payments = PaymentClient()
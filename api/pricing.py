@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+Server-side pricing for dock rental app - nights, totals and batched quotes
+"""
+
+import json
+import math
+import os
+from datetime import datetime, timedelta
+from sqlalchemy import select
+from database import Slip
+
+# Length-of-stay discounts as {exact nights: fraction off}, as the frontend computes them:
+# a 30-night stay is 40% off, a 29- or 31-night stay pays full price
+LENGTH_DISCOUNTS = {30: 0.40}
+
+# Who gets length-of-stay discounts, and who never pays
+DISCOUNT_USER_TYPES = ('renter',)
+EXEMPT_USER_TYPES = ('homeowner',)
+
+# Totals within this many dollars of the server quote are accepted as equal
+PRICE_TOLERANCE = 0.01
+
+# Largest slips x ranges grid one batch request may ask for
+MAX_QUOTES = 10000
+
+
+class PriceMismatch(ValueError):
+    """Raised when client-supplied nights or total disagree with the server quote"""
+
+    def __init__(self, quote, nights, total_cost):
+        super().__init__('Booking total does not match the current price')
+        self.quote = quote
+        self.nights = nights
+        self.total_cost = total_cost
+
+    def to_dict(self):
+        return {
+            'error': 'Price mismatch',
+            'message': str(self),
+            'submitted': {'nights': self.nights, 'totalCost': self.total_cost},
+            'quote': self.quote
+        }
+
+
+def _load_seasonal_rates():
+    """SEASONAL_RATES env var: [{"from": "06-01", "to": "09-01", "multiplier": 1.25}, ...]"""
+    raw = os.getenv('SEASONAL_RATES')
+    if not raw:
+        return ()
+    return tuple((rate['from'], rate['to'], float(rate['multiplier'])) for rate in json.loads(raw))
+
+
+class PricingRules:
+    """Seasonal multipliers, length-of-stay discounts and user-type rules"""
+
+    def __init__(self, seasonal_rates=None, length_discounts=LENGTH_DISCOUNTS,
+                 discount_user_types=DISCOUNT_USER_TYPES, exempt_user_types=EXEMPT_USER_TYPES):
+        # (from 'MM-DD', to 'MM-DD' exclusive, multiplier); ranges may wrap the new year
+        self.seasonal_rates = _load_seasonal_rates() if seasonal_rates is None else tuple(seasonal_rates)
+        self.length_discounts = dict(length_discounts)
+        self.discount_user_types = discount_user_types
+        self.exempt_user_types = exempt_user_types
+
+    def night_multiplier(self, night):
+        month_day = night.strftime('%m-%d')
+        for start, end, multiplier in self.seasonal_rates:
+            if (start <= month_day < end) if start <= end else (month_day >= start or month_day < end):
+                return multiplier
+        return 1.0
+
+    def night_units(self, first_night, nights):
+        """Sum of per-night multipliers; equals `nights` when no seasonal rates apply"""
+        if not self.seasonal_rates:
+            return float(nights)
+        return sum(self.night_multiplier(first_night + timedelta(days=i)) for i in range(nights))
+
+    def discount_rate(self, nights, user_type):
+        if user_type not in self.discount_user_types:
+            return 0.0
+        return self.length_discounts.get(nights, 0.0)
+
+
+rules = PricingRules()
+
+
+def count_nights(check_in, check_out):
+    """Nights billed for a stay: started days between check-in and check-out"""
+    return max(0, math.ceil((check_out - check_in).total_seconds() / 86400))
+
+
+def quote_matrix(db, slip_ids, ranges, user_type='renter', pricing=None):
+    """
+    Price every slip in `slip_ids` for every (check_in, check_out) in `ranges`.
+
+    Slip prices come from one query and the per-range factors (nights, seasonal units,
+    discount) are computed once per range, so an N x M request costs N + M work plus
+    one multiplication per cell. Unknown slips are skipped.
+    """
+    pricing = pricing or rules
+    if len(slip_ids) * len(ranges) > MAX_QUOTES:
+        raise ValueError(f'At most {MAX_QUOTES} slip x date-range combinations per request')
+    prices = dict(db.execute(
+        select(Slip.id, Slip.price_per_night).where(Slip.id.in_({int(slip_id) for slip_id in slip_ids}))
+    ).tuples().all())
+
+    factors = [_stay_factors(pricing, check_in, check_out, user_type) for check_in, check_out in ranges]
+
+    quotes = []
+    for slip_id in slip_ids:
+        price = prices.get(int(slip_id))
+        if price is None:
+            continue
+        for (check_in, check_out), stay in zip(ranges, factors):
+            quotes.append(_quote(slip_id, price, check_in, check_out, user_type, *stay))
+    return quotes
+
+
+def quote_stays(db, stays, pricing=None):
+    """
+    Quote each (slip_id, check_in, check_out, user_type) in `stays` with one price query.
+
+    Returns one quote per stay, or None for a stay on an unknown slip.
+    """
+    pricing = pricing or rules
+    prices = dict(db.execute(
+        select(Slip.id, Slip.price_per_night).where(Slip.id.in_({int(stay[0]) for stay in stays}))
+    ).tuples().all())
+    factors = {}
+    quotes = []
+    for slip_id, check_in, check_out, user_type in stays:
+        price = prices.get(int(slip_id))
+        if price is None:
+            quotes.append(None)
+            continue
+        key = (check_in, check_out, user_type)
+        if key not in factors:
+            factors[key] = _stay_factors(pricing, check_in, check_out, user_type)
+        quotes.append(_quote(slip_id, price, check_in, check_out, user_type, *factors[key]))
+    return quotes
+
+
+def _stay_factors(pricing, check_in, check_out, user_type):
+    """(nights, seasonal units, discount rate, exempt) of one stay, independent of the slip"""
+    if check_out <= check_in:
+        raise ValueError('checkOut must be after checkIn')
+    nights = count_nights(check_in, check_out)
+    units = pricing.night_units(check_in.date() if isinstance(check_in, datetime) else check_in, nights)
+    return nights, units, pricing.discount_rate(nights, user_type), user_type in pricing.exempt_user_types
+
+
+def _quote(slip_id, price, check_in, check_out, user_type, nights, units, discount_rate, exempt):
+    base_total = 0.0 if exempt else round(price * units, 2)
+    discount = round(base_total * discount_rate, 2)
+    return {
+        'slipId': int(slip_id),
+        'checkIn': check_in.isoformat(),
+        'checkOut': check_out.isoformat(),
+        'userType': user_type,
+        'nights': nights,
+        'pricePerNight': price,
+        'baseTotal': base_total,
+        'discount': discount,
+        'totalCost': round(base_total - discount, 2)
+    }
+
+
+def quote_booking(db, slip_id, check_in, check_out, user_type='renter'):
+    """Quote a single stay; raises ValueError for an unknown slip"""
+    quotes = quote_matrix(db, [slip_id], [(check_in, check_out)], user_type)
+    if not quotes:
+        raise ValueError(f'Slip {slip_id} does not exist')
+    return quotes[0]
+
+
+def verify_quote(quote, nights=None, total_cost=None):
+    """Raise PriceMismatch if client-supplied nights/total disagree with `quote`"""
+    if nights is not None and int(nights) != quote['nights']:
+        raise PriceMismatch(quote, nights, total_cost)
+    if total_cost is not None and abs(float(total_cost) - quote['totalCost']) > PRICE_TOLERANCE:
+        raise PriceMismatch(quote, nights, total_cost)
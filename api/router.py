@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Route table for dock rental API - maps (method, path) to handler functions
+
+Static paths are looked up in a dict; paths with {name} segments are compiled to
+regular expressions once, when the route is registered.
+"""
+
+import re
+
+# {name} placeholders match one path segment
+PLACEHOLDER = re.compile(r'\{(\w+)\}')
+
+
+class RouteNotFound(Exception):
+    """No route has this path"""
+
+
+class MethodNotAllowed(Exception):
+    """The path exists but not for this method; `allowed` lists the methods it has"""
+
+    def __init__(self, allowed):
+        super().__init__('Method not allowed')
+        self.allowed = allowed
+
+
+def normalize(path):
+    """Drop a trailing slash so /api/slips/ and /api/slips are the same route"""
+    return path.rstrip('/') or '/'
+
+
+class Router:
+    def __init__(self):
+        self._static = {}   # path -> {method: func}
+        self._dynamic = []  # (compiled pattern, pattern, {method: func})
+        self.patterns = {}  # func -> pattern, for labelling metrics by route
+
+    def add(self, method, pattern, func):
+        pattern = normalize(pattern)
+        self.patterns[func] = pattern
+        if PLACEHOLDER.search(pattern):
+            # split() alternates literal text and placeholder names
+            parts = PLACEHOLDER.split(pattern)
+            regex = re.compile('^' + ''.join(
+                re.escape(part) if index % 2 == 0 else f'(?P<{part}>[^/]+)' for index, part in enumerate(parts)
+            ) + '$')
+            for _, existing, methods in self._dynamic:
+                if existing == pattern:
+                    methods[method] = func
+                    return
+            self._dynamic.append((regex, pattern, {method: func}))
+        else:
+            self._static.setdefault(pattern, {})[method] = func
+
+    def route(self, method, pattern):
+        """Decorator registering `func` for method and path pattern"""
+        def register(func):
+            self.add(method, pattern, func)
+            return func
+        return register
+
+    def get(self, pattern):
+        return self.route('GET', pattern)
+
+    def post(self, pattern):
+        return self.route('POST', pattern)
+
+    def match(self, method, path):
+        """
+        Return (func, path_params) for a request path (without the query string).
+
+        Raises RouteNotFound or MethodNotAllowed.
+        """
+        path = normalize(path)
+        methods = self._static.get(path)
+        path_params = {}
+        if methods is None:
+            for regex, _, candidate in self._dynamic:
+                found = regex.match(path)
+                if found:
+                    methods, path_params = candidate, found.groupdict()
+                    break
+            else:
+                raise RouteNotFound(path)
+        func = methods.get(method)
+        if func is None:
+            raise MethodNotAllowed(sorted(methods))
+        return func, path_params
+
+    def table(self):
+        """(method, pattern) for every registered route"""
+        entries = [(path, methods) for path, methods in self._static.items()]
+        entries += [(pattern, methods) for _, pattern, methods in self._dynamic]
+        return [(method, pattern) for pattern, methods in entries for method in methods]
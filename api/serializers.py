@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Column-projected serializers for dock rental app
+
+List endpoints select just the columns they return, as plain row tuples, and turn
+each row into its API dict through a precompiled field table instead of loading
+ORM instances. JSON encoding uses orjson when it is installed.
+"""
+
+import json
+from sqlalchemy import select
+from database import User, Slip, Booking
+
+try:
+    import orjson
+except ImportError:  # optional fast JSON backend
+    orjson = None
+
+
+def dumps(obj):
+    """Encode `obj` as JSON bytes, with orjson when available"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            pass  # types orjson does not know (e.g. Decimal); the stdlib encoder reports them
+    return json.dumps(obj).encode()
+
+
+class Projection:
+    """
+    The columns an API representation needs and how to build it from a row.
+
+    `fields` is a sequence of (api key, column, is_datetime); datetime values are
+    converted to ISO 8601 strings, everything else is passed through.
+    """
+
+    __slots__ = ('keys', 'columns', 'attributes', '_datetimes')
+
+    def __init__(self, fields):
+        self.keys = tuple(key for key, _, _ in fields)
+        self.columns = tuple(column for _, column, _ in fields)
+        # ORM attribute names, for serializing an already loaded instance
+        self.attributes = tuple(column.key for column in self.columns)
+        self._datetimes = tuple(index for index, (_, _, is_datetime) in enumerate(fields) if is_datetime)
+
+    def select(self):
+        return select(*self.columns)
+
+    def to_dict(self, row):
+        """API dict for a row selected with `select()`"""
+        if not self._datetimes:
+            return dict(zip(self.keys, row))
+        values = list(row)
+        for index in self._datetimes:
+            value = values[index]
+            if value is not None:
+                values[index] = value.isoformat()
+        return dict(zip(self.keys, values))
+
+
+BOOKING = Projection((
+    ('id', Booking.id, False),
+    ('slipId', Booking.slip_id, False),
+    ('slipName', Slip.name, False),
+    ('guestName', Booking.guest_name, False),
+    ('guestEmail', Booking.guest_email, False),
+    ('guestPhone', Booking.guest_phone, False),
+    ('checkIn', Booking.check_in, True),
+    ('checkOut', Booking.check_out, True),
+    ('boatLength', Booking.boat_length, False),
+    ('boatMakeModel', Booking.boat_make_model, False),
+    ('userType', Booking.user_type, False),
+    ('nights', Booking.nights, False),
+    ('totalCost', Booking.total_cost, False),
+    ('status', Booking.status, False),
+    ('bookingDate', Booking.booking_date, True),
+    ('paymentStatus', Booking.payment_status, False),
+    ('paymentDate', Booking.payment_date, True),
+    ('paymentMethod', Booking.payment_method, False),
+    ('rentalAgreementName', Booking.rental_agreement_name, False),
+    ('insuranceProofName', Booking.insurance_proof_name, False),
+    ('rentalProperty', Booking.rental_property, False),
+    ('rentalStartDate', Booking.rental_start_date, True),
+    ('rentalEndDate', Booking.rental_end_date, True),
+))
+
+USER = Projection((
+    ('id', User.id, False),
+    ('name', User.name, False),
+    ('email', User.email, False),
+    ('userType', User.user_type, False),
+    ('phone', User.phone, False),
+    ('createdAt', User.created_at, True),
+))
+
+
+def booking_to_dict(booking, slip_name=None):
+    """API dict for a loaded Booking instance (single-row responses)"""
+    return BOOKING.to_dict([
+        slip_name if column is Slip.name else getattr(booking, attribute)
+        for column, attribute in zip(BOOKING.columns, BOOKING.attributes)
+    ])
+
+
+def user_to_dict(user):
+    """API dict for a loaded User instance"""
+    return USER.to_dict([getattr(user, attribute) for attribute in USER.attributes])
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+In-process read-through cache of the serialized /api/slips payload
+"""
+
+import hashlib
+import threading
+from datetime import timezone
+from email.utils import format_datetime
+from sqlalchemy import select, func, and_, type_coerce
+from sqlalchemy.dialects.postgresql import JSONB
+from database import Slip
+from serializers import dumps
+from compression import compress
+
+_lock = threading.Lock()
+# Payloads by amenity filter, all for the same table version
+_cached = {}
+MAX_CACHED_FILTERS = 64
+
+
+def slip_to_dict(slip):
+    """Convert a Slip row to its API representation"""
+    return {
+        'id': slip.id,
+        'name': slip.name,
+        'maxLength': slip.max_length,
+        'width': slip.width,
+        'depth': slip.depth,
+        'pricePerNight': slip.price_per_night,
+        'amenities': slip.get_amenities_list(),
+        'description': slip.description,
+        'dockEtiquette': slip.dock_etiquette,
+        'available': slip.available,
+        'images': slip.get_images_list(),
+        'bookings': []
+    }
+
+
+def slips_version(db):
+    """Cheap version stamp of the slips table: (max(updated_at), row count)"""
+    return tuple(db.execute(select(func.max(Slip.updated_at), func.count(Slip.id))).one())
+
+
+def amenity_filter(dialect_name, amenities):
+    """SQL condition: the slip offers every one of `amenities`"""
+    if dialect_name == 'postgresql':
+        # jsonb containment, served by the GIN index on slips.amenities
+        return type_coerce(Slip.amenities, JSONB).contains(list(amenities))
+    # Portable fallback for SQLite's JSON text columns
+    conditions = []
+    for amenity in amenities:
+        each = func.json_each(Slip.amenities).table_valued('value')
+        conditions.append(select(1).select_from(each).where(each.c.value == amenity).exists())
+    return and_(*conditions)
+
+
+def get_slips_payload(db, amenities=()):
+    """
+    Return a dict with the encoded slips `body`, its `etag` and `last_modified` header value.
+
+    Only the version query hits the database while the catalogue is unchanged; the
+    rows are re-read and re-encoded when the version moves or after invalidate().
+    `amenities` restricts the list to slips offering all of them.
+    """
+    key = tuple(sorted(set(amenities)))
+    version = slips_version(db)
+    cached = _cached.get(key)
+    if cached is not None and cached['version'] == version:
+        return cached
+
+    query = select(Slip).order_by(Slip.id)
+    if key:
+        query = query.where(amenity_filter(db.get_bind().dialect.name, key))
+    slips = db.execute(query).scalars().all()
+    body = dumps({'slips': [slip_to_dict(slip) for slip in slips]})
+
+    last_updated, count = version
+    payload = {
+        'version': version,
+        'body': body,
+        'etag': '"%s"' % hashlib.sha1(f'{last_updated}:{count}:{key}'.encode()).hexdigest(),
+        'last_modified': format_datetime(last_updated.replace(tzinfo=timezone.utc), usegmt=True) if last_updated else None,
+        # Compressed bodies by content coding, filled in by encoded_body()
+        'encoded': {}
+    }
+    with _lock:
+        # Entries for an older version are useless once any filter sees a new one
+        if len(_cached) >= MAX_CACHED_FILTERS or any(entry['version'] != version for entry in _cached.values()):
+            _cached.clear()
+        _cached[key] = payload
+    return payload
+
+
+def encoded_body(payload, encoding):
+    """The payload body compressed with `encoding`, compressed once per cached payload"""
+    body = payload['encoded'].get(encoding)
+    if body is None:
+        body = payload['encoded'][encoding] = compress(payload['body'], encoding, cached=True)
+    return body
+
+
+def representation_etag(etag, encoding):
+    """ETag of the `encoding`-compressed representation (byte-different bodies need different tags)"""
+    return etag if encoding is None else f'{etag[:-1]}-{encoding}"'
+
+
+def invalidate():
+    """Drop the cached payloads; call after writing to the slips table"""
+    with _lock:
+        _cached.clear()
+
+
+def etag_matches(if_none_match, etag):
+    """Whether an If-None-Match header value matches `etag` (weak comparison)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    candidates = [tag.strip() for tag in if_none_match.split(',')]
+    return etag in (tag[2:] if tag.startswith('W/') else tag for tag in candidates)
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Boat-fit slip search for dock rental app
+"""
+
+from sqlalchemy import select, exists
+from database import Slip, Booking, INACTIVE_STATUSES
+
+SORT_OPTIONS = ('price', 'fit')
+MAX_RESULTS = 200
+
+
+def search_slips(db, boat_length=None, boat_width=None, draft=None, min_price=None, max_price=None,
+                 check_in=None, check_out=None, available_only=True, sort='price', limit=50):
+    """
+    Slips that fit the boat, are within the price range and are free for [check_in, check_out).
+
+    Everything, including the free-dates check, is one query: bookings are excluded with
+    a NOT EXISTS anti-join on (slip_id, check_in, check_out) rather than per slip.
+    Sorting by 'fit' puts the slips with the least spare length/width/depth first.
+    """
+    if sort not in SORT_OPTIONS:
+        raise ValueError(f'sort must be one of {", ".join(SORT_OPTIONS)}')
+    limit = max(1, min(int(limit), MAX_RESULTS))
+
+    query = select(Slip)
+    if available_only:
+        query = query.where(Slip.available.is_(True))
+    if boat_length is not None:
+        query = query.where(Slip.max_length >= boat_length)
+    if boat_width is not None:
+        query = query.where(Slip.width >= boat_width)
+    if draft is not None:
+        query = query.where(Slip.depth >= draft)
+    if min_price is not None:
+        query = query.where(Slip.price_per_night >= min_price)
+    if max_price is not None:
+        query = query.where(Slip.price_per_night <= max_price)
+
+    if (check_in is None) != (check_out is None):
+        raise ValueError('checkIn and checkOut must be given together')
+    if check_in is not None:
+        if check_out <= check_in:
+            raise ValueError('checkOut must be after checkIn')
+        query = query.where(~exists().where(
+            Booking.slip_id == Slip.id,
+            Booking.check_in < check_out,
+            Booking.check_out > check_in,
+            Booking.status.notin_(INACTIVE_STATUSES)
+        ))
+
+    spare = [
+        column - value
+        for column, value in ((Slip.max_length, boat_length), (Slip.width, boat_width), (Slip.depth, draft))
+        if value is not None
+    ]
+    if sort == 'fit' and spare:
+        query = query.order_by(sum(spare[1:], spare[0]), Slip.price_per_night, Slip.id)
+    else:
+        query = query.order_by(Slip.price_per_night, Slip.id)
+
+    return db.execute(query.limit(limit)).scalars().all()
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+Set-based writes to the slips table; every write invalidates the cached slips payload
+"""
+
+from sqlalchemy import update, case, literal, cast
+from sqlalchemy.dialects.postgresql import JSONB
+from database import Slip
+import slip_cache
+from sync import changes_committed
+
+
+def _execute(db, statement):
+    """Run one UPDATE, commit, drop cached slip payloads and return the affected row count"""
+    try:
+        result = db.execute(statement.execution_options(synchronize_session=False))
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    slip_cache.invalidate()
+    changes_committed.notify()
+    return result.rowcount
+
+
+def set_slip_images(db, slip_id, images):
+    """Replace one slip's image list"""
+    return _execute(db, update(Slip).where(Slip.id == int(slip_id)).values(images=list(images)))
+
+
+def set_all_slip_images(db, images):
+    """Replace the image list of every slip in one statement"""
+    return _execute(db, update(Slip).values(images=list(images)))
+
+
+def set_slip_images_batch(db, images_by_slip):
+    """Apply a {slip_id: [image urls]} mapping in one UPDATE ... CASE round trip"""
+    if not images_by_slip:
+        return 0
+    # Postgres resolves a CASE whose branches are all untyped parameters to text, which
+    # cannot be assigned to the jsonb column; SQLite has no JSON type to cast to
+    postgres = db.get_bind().dialect.name == 'postgresql'
+    values = {}
+    for slip_id, images in images_by_slip.items():
+        value = literal(list(images), Slip.images.type)
+        values[int(slip_id)] = cast(value, JSONB) if postgres else value
+    return _execute(
+        db,
+        update(Slip)
+        .where(Slip.id.in_(values))
+        .values(images=case(values, value=Slip.id))
+    )
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Incremental JSON encoding and chunked transfer helpers for large list responses
+"""
+
+import csv
+import io
+from serializers import dumps
+
+# Rows fetched per round trip and encoded per chunk
+STREAM_BATCH_SIZE = 500
+
+
+def iter_json_list(key, rows, to_dict, batch_size=STREAM_BATCH_SIZE):
+    """
+    Yield `{"<key>": [...]}` as a series of byte strings, one per batch of rows.
+
+    `rows` is consumed lazily (e.g. a result executed with yield_per), so only one
+    batch of dicts and its encoded form are held in memory at a time.
+    """
+    yield b'{' + dumps(key) + b': ['
+    first = True
+    batch = []
+    for row in rows:
+        batch.append(dumps(to_dict(row)))
+        if len(batch) >= batch_size:
+            yield (b', ' if not first else b'') + b', '.join(batch)
+            first = False
+            batch = []
+    if batch:
+        yield (b', ' if not first else b'') + b', '.join(batch)
+    yield b']}'
+
+
+def iter_csv(header, rows, batch_size=STREAM_BATCH_SIZE):
+    """Yield a CSV document as byte strings: the header row, then one chunk per batch of rows"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    count = 0
+    for row in rows:
+        writer.writerow([value.isoformat() if hasattr(value, 'isoformat') else value for value in row])
+        count += 1
+        if count % batch_size == 0:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode()
+
+
+def write_chunk(wfile, data):
+    """Write one HTTP/1.1 chunk; an empty chunk terminates the body"""
+    wfile.write(b'%x\r\n' % len(data) + data + b'\r\n')
+    wfile.flush()
+
+
+def write_chunked(wfile, chunks):
+    """Write every non-empty chunk from an iterable, then the terminating chunk"""
+    for data in chunks:
+        if data:
+            write_chunk(wfile, data)
+    write_chunk(wfile, b'')
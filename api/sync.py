@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Delta-sync feed for dock rental app - rows created or changed since an opaque token
+
+Changes are read in (updated_at, id) order from the ix_*_updated indexes; the token
+is the position of the last row returned. Bookings are never deleted, so a
+cancellation arrives as the booking row with status 'cancelled'. Archival (archive.py)
+moves only bookings that stopped changing long before, so it needs no tombstones;
+a full resync from '0' returns live bookings only.
+
+updated_at is stamped before a transaction commits, so the feed stops short of rows
+that may still be uncommitted: SYNC_SETTLE_SECONDS before now and, on Postgres,
+before the start of the oldest open write transaction (a bulk import can run far
+longer than the settle window). A row committed late is then still ahead of every
+token handed out. The settle window also absorbs clock skew between servers.
+"""
+
+import base64
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import tuple_, text
+from concurrency import run_blocking
+
+SYNC_PAGE_SIZE = 500
+MAX_SYNC_PAGE_SIZE = 2000
+SYNC_SETTLE_SECONDS = float(os.getenv('SYNC_SETTLE_SECONDS', '2'))
+# Long-poll bounds: the longest a request may wait, and how often it re-checks the database
+SYNC_MAX_WAIT = float(os.getenv('SYNC_MAX_WAIT', '25'))
+SYNC_POLL_INTERVAL = float(os.getenv('SYNC_POLL_INTERVAL', '1'))
+
+
+class ChangeSignal:
+    """Wakes long-polls in this process when it commits a change (others are found by polling)"""
+
+    def __init__(self):
+        self.version = 0
+        self._condition = threading.Condition()
+
+    def notify(self):
+        with self._condition:
+            self.version += 1
+            self._condition.notify_all()
+
+    def wait(self, seen, timeout):
+        """Block until the version moves past `seen` or `timeout` seconds pass"""
+        with self._condition:
+            self._condition.wait_for(lambda: self.version != seen, timeout)
+
+
+changes_committed = ChangeSignal()
+
+
+def encode_token(updated_at, row_id):
+    raw = f'{updated_at.isoformat()}|{row_id}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_token(token):
+    """(updated_at, id) position of a token; None for an empty token or '0' (from the start)"""
+    if not token or token == '0':
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)).decode()
+        updated_at, row_id = raw.split('|')
+        return datetime.fromisoformat(updated_at), int(row_id)
+    except ValueError:
+        raise ValueError('Invalid since token')
+
+
+# Start of the oldest transaction that has written (has a transaction id), as naive UTC
+OLDEST_WRITE_TRANSACTION = text(
+    "SELECT min(xact_start) AT TIME ZONE 'UTC' FROM pg_stat_activity "
+    "WHERE backend_xid IS NOT NULL AND pid <> pg_backend_pid()"
+)
+
+
+def settled_point(db):
+    """Latest updated_at the feed may return: rows stamped up to then are all committed"""
+    settled = datetime.utcnow() - timedelta(seconds=SYNC_SETTLE_SECONDS)
+    if db.get_bind().dialect.name == 'postgresql':
+        oldest = db.execute(OLDEST_WRITE_TRANSACTION).scalar()
+        if oldest is not None:
+            settled = min(settled, oldest - timedelta(seconds=SYNC_SETTLE_SECONDS))
+    return settled
+
+
+def changes(db, model, query, since, limit=SYNC_PAGE_SIZE):
+    """
+    Rows of `query` (a select over `model`) changed after the `since` token.
+
+    Returns (rows, next token, has_more). The rows keep the columns of `query`, with
+    the position columns added at the end (Projection.to_dict ignores them).
+    """
+    limit = max(1, min(int(limit), MAX_SYNC_PAGE_SIZE))
+    settled = settled_point(db)
+    query = (
+        query.add_columns(model.updated_at.label('sync_updated_at'), model.id.label('sync_id'))
+        .where(model.updated_at <= settled)
+        .order_by(None)
+        .order_by(model.updated_at, model.id)
+        .limit(limit + 1)
+    )
+    position = decode_token(since)
+    if position is not None:
+        query = query.where(tuple_(model.updated_at, model.id) > tuple_(*position))
+
+    rows = db.execute(query).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if rows:
+        next_token = encode_token(rows[-1].sync_updated_at, rows[-1].sync_id)
+    else:
+        # Nothing new: later changes are after the settled point either way
+        next_token = since if position is not None else encode_token(settled, 0)
+    return rows, next_token, has_more
+
+
+def wait_for_changes(db, fetch, wait):
+    """
+    Long-poll: call `fetch()` (returning (rows, token, has_more)) until it finds rows
+    or `wait` seconds (capped at SYNC_MAX_WAIT) pass.
+    """
+    deadline = time.monotonic() + max(0.0, min(float(wait), SYNC_MAX_WAIT))
+    while True:
+        seen = changes_committed.version
+        result = fetch()
+        remaining = deadline - time.monotonic()
+        if result[0] or remaining <= 0:
+            return result
+        # End the read transaction so the connection goes back to the pool while idle
+        db.rollback()
+        run_blocking(changes_committed.wait, seen, min(SYNC_POLL_INTERVAL, remaining))
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Synthetic data generator for dock rental app - thousands of slips, millions of bookings
+
+Builds on the sample data from init_db: tops the slips and users tables up to the
+requested sizes and appends non-overlapping bookings per slip, then rebuilds the
+availability calendars and analytics rollups. Output is deterministic for a seed.
+"""
+
+import random
+from datetime import datetime, timedelta
+from sqlalchemy import select, func, insert
+from database import User, Slip, Booking, init_db
+from booking_import import insert_rows, COLUMNS
+import availability
+import analytics
+import pricing
+
+AMENITIES = ['Water', 'Electric (120V)', 'Electric (240V)', 'WiFi', 'Pump-out', 'Fuel dock', 'Showers', 'Security']
+STATUSES = (('confirmed', 0.7), ('pending', 0.2), ('cancelled', 0.1))
+# Bookings generated and written per round trip
+GENERATE_BATCH_SIZE = 50000
+FIRST_CHECK_IN = datetime(2010, 1, 1)
+
+
+def _add_slips(db, rng, count):
+    existing = db.execute(select(func.count(Slip.id))).scalar_one()
+    rows = []
+    now = datetime.utcnow()
+    for number in range(existing + 1, count + 1):
+        rows.append({
+            'name': f'Slip {number}',
+            'max_length': float(rng.choice(range(20, 61, 2))),
+            'width': float(rng.choice(range(8, 19))),
+            'depth': float(rng.choice(range(4, 13))),
+            'price_per_night': float(rng.choice(range(40, 151, 5))),
+            'amenities': sorted(rng.sample(AMENITIES, rng.randint(1, 4))),
+            'description': f'Synthetic slip {number}',
+            'dock_etiquette': None,
+            'available': rng.random() < 0.9,
+            'images': [],
+            'created_at': now,
+            'updated_at': now,
+        })
+    if rows:
+        db.execute(insert(Slip), rows)
+    return len(rows)
+
+
+def _add_users(db, rng, count):
+    existing = db.execute(select(func.count(User.id))).scalar_one()
+    now = datetime.utcnow()
+    rows = [
+        {
+            'name': f'Synthetic User {number}',
+            'email': f'synthetic-{number}@example.com',
+            'password_hash': 'synthetic',
+            'phone': f'555-{number % 10000:04d}',
+            'user_type': 'homeowner' if rng.random() < 0.1 else 'renter',
+            'created_at': now,
+            'updated_at': now,
+        }
+        for number in range(existing + 1, count + 1)
+    ]
+    if rows:
+        db.execute(insert(User), rows)
+    return len(rows)
+
+
+def _booking_rows(rng, slips, users, count, start):
+    """Yield `count` booking column dicts, round-robin over slips, never overlapping per slip"""
+    next_free = {slip_id: start + timedelta(days=rng.randint(0, 30)) for slip_id, _ in slips}
+    statuses, weights = zip(*STATUSES)
+    now = datetime.utcnow()
+    for index in range(count):
+        slip_id, price = slips[index % len(slips)]
+        user_id, user_type = users[rng.randrange(len(users))]
+        check_in = next_free[slip_id] + timedelta(days=rng.choice((0, 0, 1, 2, 3, 7)))
+        nights = 30 if rng.random() < 0.05 else rng.randint(1, 14)
+        check_out = check_in + timedelta(days=nights)
+        next_free[slip_id] = check_out
+        status = rng.choices(statuses, weights)[0]
+        quote_total = price * nights * (1 - pricing.rules.discount_rate(nights, user_type))
+        row = dict.fromkeys(COLUMNS)
+        row.update(
+            slip_id=slip_id,
+            user_id=user_id,
+            guest_name=f'Guest {index}',
+            guest_email=f'guest-{index}@example.com',
+            check_in=check_in,
+            check_out=check_out,
+            boat_length=float(rng.randint(18, 40)),
+            user_type=user_type,
+            nights=nights,
+            total_cost=0.0 if user_type in pricing.EXEMPT_USER_TYPES else round(quote_total, 2),
+            status=status,
+            booking_date=check_in - timedelta(days=rng.randint(1, 90)),
+            payment_status=('exempt' if user_type in pricing.EXEMPT_USER_TYPES
+                            else 'paid' if status == 'confirmed' else 'pending'),
+            payment_method='stripe',
+            created_at=now,
+            updated_at=now,
+        )
+        yield row
+
+
+def populate(db, slips=1000, bookings=100000, users=500, seed=82, use_copy=True):
+    """
+    Grow the database to at least `slips` slips, `users` users and `bookings` bookings.
+
+    New bookings start after the latest existing check-out, so they never overlap
+    existing ones. Returns counts of the rows added.
+    """
+    init_db(bind=db.get_bind())
+    rng = random.Random(seed)
+    added = {'slips': _add_slips(db, rng, slips), 'users': _add_users(db, rng, users), 'bookings': 0}
+    db.commit()
+
+    missing = bookings - db.execute(select(func.count(Booking.id))).scalar_one()
+    if missing > 0:
+        slip_rows = db.execute(select(Slip.id, Slip.price_per_night).order_by(Slip.id)).all()
+        user_rows = db.execute(select(User.id, User.user_type).order_by(User.id)).all()
+        latest = db.execute(select(func.max(Booking.check_out))).scalar_one()
+        start = max(FIRST_CHECK_IN, latest) if latest else FIRST_CHECK_IN
+        batch = []
+        for row in _booking_rows(rng, slip_rows, user_rows, missing, start):
+            batch.append(row)
+            if len(batch) >= GENERATE_BATCH_SIZE:
+                insert_rows(db, batch, use_copy=use_copy)
+                batch = []
+        if batch:
+            insert_rows(db, batch, use_copy=use_copy)
+        db.commit()
+        added['bookings'] = missing
+        availability.rebuild(db)
+        analytics.rebuild(db)
+    return added
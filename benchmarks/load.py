@@ -0,0 +1,364 @@
+#!/usr/bin/env python3
+"""
+Concurrent load test for every API route
+
+Seeds a database with synthetic slips, users and bookings (api/synthetic.py), starts
+index.handler behind a local threaded HTTP server in a child process with Stripe
+stubbed out, then drives each route in turn with concurrent clients and reports
+per endpoint:
+    requests, errors, throughput_rps, mean_ms, p50_ms, p95_ms, p99_ms
+
+Results are written as JSON (with the git commit) so runs can be compared; pass
+--compare with an earlier results file to print throughput and p95 changes.
+
+Usage:
+    python benchmarks/load.py [--slips 1000] [--bookings 100000] [--requests 200]
+                              [--concurrency 8] [--only /api/bookings ...] [--read-only]
+                              [--output load-results.json] [--compare previous.json]
+
+POSTGRES_URL selects the database; by default a SQLite file in the temp directory is
+reused between runs. Write routes modify the data, so point it at a disposable database.
+"""
+
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+API_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'api')
+DEFAULT_DB = os.path.join(tempfile.gettempdir(), 'dock-rental-load.db')
+WEBHOOK_SECRET = 'whsec_load_test'
+LOAD_ADMIN_EMAIL = 'load-admin@example.com'
+
+
+class StripeObject(dict):
+    """Dict with attribute access, like the objects the stripe library returns"""
+    __getattr__ = dict.__getitem__
+
+
+class FakeStripe:
+    """Stands in for the stripe module inside PaymentClient: no network, instant answers"""
+
+    class PaymentIntent:
+        _ids = itertools.count(1)
+
+        @classmethod
+        def create(cls, amount, currency, metadata, idempotency_key):
+            number = next(cls._ids)
+            return StripeObject(id=f'pi_load_{number}', client_secret=f'pi_load_{number}_secret',
+                                status='requires_payment_method', amount=amount, currency=currency)
+
+        @staticmethod
+        def retrieve(id):
+            return StripeObject(id=id, status='succeeded', amount=1000, currency='usd')
+
+    class Webhook:
+        @staticmethod
+        def construct_event(payload, signature, secret):
+            return json.loads(payload)
+
+
+def serve(port_pipe):
+    """Child process: run the API with Stripe stubbed and report the port"""
+    sys.path.insert(0, API_DIR)
+    import index
+    from http.server import ThreadingHTTPServer
+
+    index.payments.api = FakeStripe
+    index.handler.log_message = lambda *args: None
+
+    class Server(ThreadingHTTPServer):
+        daemon_threads = True
+        # The default backlog of 5 makes concurrent clients hit SYN retransmits
+        request_queue_size = 256
+
+    server = Server(('127.0.0.1', 0), index.handler)
+    port_pipe.send(server.server_port)
+    server.serve_forever()
+
+
+class Scenarios:
+    """Request builders per route: each returns (method, path, body, headers, expected statuses)"""
+
+    def __init__(self, slip_count, booking_count, admin_token):
+        self.slip_count = slip_count
+        self.booking_count = booking_count
+        # admin_token() issues a new session token for the load test's admin user
+        self.admin_token = admin_token
+        self.admin = self.bearer()
+        self.counter = itertools.count(1)
+
+    def bearer(self):
+        return {'Authorization': f'Bearer {self.admin_token()}'}
+
+    def slip_id(self, rng):
+        return rng.randint(1, self.slip_count)
+
+    def future_range(self, rng):
+        # Far past the synthetic history so most creates succeed; the rest are 409s
+        check_in = datetime(2150, 1, 1) + timedelta(days=rng.randint(0, 3650))
+        return check_in, check_in + timedelta(days=rng.randint(1, 7))
+
+    def build(self):
+        return {
+            ('GET', '/api/health'): lambda rng: ('GET', '/api/health', None, {}, (200,)),
+            ('GET', '/api/debug/status'): lambda rng: ('GET', '/api/debug/status', None, {}, (200,)),
+            ('GET', '/api/debug/pool'): lambda rng: ('GET', '/api/debug/pool', None, {}, (200,)),
+            ('GET', '/api/metrics'): lambda rng: ('GET', '/api/metrics', None, {}, (200,)),
+            ('GET', '/api/session'): lambda rng: ('GET', '/api/session', None, self.admin, (200,)),
+            ('GET', '/api/slips'): lambda rng: ('GET', '/api/slips', None, {}, (200,)),
+            ('GET', '/api/slips?amenity'): lambda rng: ('GET', '/api/slips?amenity=WiFi', None, {}, (200,)),
+            ('GET', '/api/slips/search'): lambda rng: (
+                'GET', f'/api/slips/search?boatLength={rng.randint(18, 40)}&checkIn=2030-06-01&checkOut=2030-06-08&sort=fit',
+                None, {}, (200,)),
+            ('GET', '/api/availability'): lambda rng: (
+                'GET', f'/api/availability?from=2020-01-01&days=90&slipIds={",".join(str(self.slip_id(rng)) for _ in range(20))}',
+                None, {}, (200,)),
+            ('GET', '/api/availability/free'): lambda rng: (
+                'GET', '/api/availability/free?from=2020-07-01&to=2020-07-08', None, {}, (200,)),
+            ('GET', '/api/analytics'): lambda rng: (
+                'GET', '/api/analytics?groupBy=month,status&from=2015-01&to=2015-12', None, self.admin, (200,)),
+            ('GET', '/api/analytics/export'): lambda rng: (
+                'GET', '/api/analytics/export?groupBy=slip,month&from=2015-01&to=2015-03', None, self.admin, (200,)),
+            ('GET', '/api/users'): lambda rng: ('GET', '/api/users', None, self.admin, (200,)),
+            ('GET', '/api/bookings'): lambda rng: (
+                'GET', f'/api/bookings?limit=100&cursor={rng.randint(0, max(0, self.booking_count - 100))}',
+                None, {}, (200,)),
+            ('GET', '/api/bookings?stream'): lambda rng: (
+                'GET', f'/api/bookings?stream=1&slipId={self.slip_id(rng)}', None, {}, (200,)),
+            ('POST', '/api/quotes'): lambda rng: (
+                'POST', '/api/quotes', {
+                    'slipIds': [self.slip_id(rng) for _ in range(50)],
+                    'ranges': [{'checkIn': f'2030-0{month}-01', 'checkOut': f'2030-0{month}-08'} for month in range(1, 10)],
+                }, {}, (200,)),
+            ('POST', '/api/create-payment-intent'): lambda rng: (
+                'POST', '/api/create-payment-intent', {'amount': 4200}, {}, (200,)),
+            ('POST', '/api/confirm-payment'): lambda rng: (
+                'POST', '/api/confirm-payment', {'payment_intent_id': f'pi_load_{rng.randint(1, 50)}'}, {}, (200,)),
+            ('POST', '/api/stripe-webhook'): lambda rng: (
+                'POST', '/api/stripe-webhook',
+                {'type': 'payment_intent.succeeded', 'data': {'object': {
+                    'id': f'pi_load_{rng.randint(1, 50)}', 'status': 'succeeded', 'amount': 1000, 'currency': 'usd'}}},
+                {'Stripe-Signature': 't=0,v1=stub'}, (200,)),
+            ('POST', '/api/batch'): self.batch,
+            ('POST', '/api/login-user'): lambda rng: (
+                'POST', '/api/login-user', {'email': 'admin@dock82.com', 'password': 'wrong'}, {}, (401,)),
+            # Each logout revokes its token, so every request gets a new one
+            ('POST', '/api/logout'): lambda rng: ('POST', '/api/logout', {}, self.bearer(), (200,)),
+            ('POST', '/api/register-user'): lambda rng: (
+                'POST', '/api/register-user',
+                {'name': 'Load', 'email': f'load-{time.time_ns()}-{next(self.counter)}@example.com', 'password': 'secret'},
+                {}, (201,)),
+            ('POST', '/api/create-booking'): self.create_booking,
+            ('POST', '/api/cancel-booking'): lambda rng: (
+                'POST', '/api/cancel-booking', {'booking_id': rng.randint(1, self.booking_count)}, self.admin, (200,)),
+            ('POST', '/api/import-bookings'): self.import_bookings,
+            ('POST', '/api/update-slip-images'): lambda rng: (
+                'POST', '/api/update-slip-images',
+                {'slip_id': self.slip_id(rng), 'image_url': 'https://example.com/load.jpg'}, self.admin, (200,)),
+            ('POST', '/api/update-slip-images-batch'): lambda rng: (
+                'POST', '/api/update-slip-images-batch',
+                {'images': {str(self.slip_id(rng)): ['https://example.com/load.jpg'] for _ in range(20)}}, self.admin, (200,)),
+            ('POST', '/api/update-all-slip-images'): lambda rng: (
+                'POST', '/api/update-all-slip-images', {'image_url': 'https://example.com/all.jpg'}, self.admin, (200,)),
+        }
+
+    def create_booking(self, rng):
+        check_in, check_out = self.future_range(rng)
+        return ('POST', '/api/create-booking', {'booking': {
+            'slipId': self.slip_id(rng), 'checkIn': check_in.isoformat() + 'Z', 'checkOut': check_out.isoformat() + 'Z',
+            'bookingDate': datetime.utcnow().isoformat() + 'Z', 'guestName': 'Load Test', 'guestEmail': 'load@example.com',
+        }}, {}, (201, 409))
+
+    def batch(self, rng):
+        slip_id = self.slip_id(rng)
+        return ('POST', '/api/batch', {'requests': [
+            {'id': 'slips', 'path': '/api/slips'},
+            {'id': 'availability', 'path': f'/api/availability?from=2030-06-01&days=30&slipIds={slip_id}'},
+            {'id': 'search', 'path': f'/api/slips/search?boatLength={rng.randint(18, 40)}&sort=fit'},
+            {'id': 'quote', 'method': 'POST', 'path': '/api/quotes', 'body': {
+                'slipIds': [slip_id], 'ranges': [{'checkIn': '2030-06-01', 'checkOut': '2030-06-08'}]}},
+        ]}, {}, (200,))
+
+    def import_bookings(self, rng):
+        records = []
+        for _ in range(50):
+            check_in, check_out = self.future_range(rng)
+            records.append({'slipId': self.slip_id(rng), 'guestName': 'Import', 'guestEmail': 'import@example.com',
+                            'checkIn': check_in.isoformat(), 'checkOut': check_out.isoformat()})
+        return ('POST', '/api/import-bookings?dryRun=1', {'bookings': records}, self.admin, (200,))
+
+
+# Scenarios that change data, skipped with --read-only
+WRITE_PATHS = ('/api/register-user', '/api/create-booking', '/api/cancel-booking', '/api/update-slip-images',
+               '/api/update-slip-images-batch', '/api/update-all-slip-images', '/api/create-payment-intent',
+               '/api/stripe-webhook', '/api/logout')
+
+
+def load_admin(db):
+    """(id, user_type) of the admin user the authenticated scenarios act as, created on first use"""
+    from database import User
+    admin = db.query(User).filter(User.email == LOAD_ADMIN_EMAIL).first()
+    if admin is None:
+        now = datetime.utcnow()
+        admin = User(name='Load Admin', email=LOAD_ADMIN_EMAIL, password_hash='synthetic', user_type='admin',
+                     created_at=now, updated_at=now)
+        db.add(admin)
+        db.commit()
+    return admin.id, admin.user_type
+
+
+def send(base, request):
+    method, path, body, headers, expected = request
+    data = json.dumps(body).encode() if body is not None else None
+    headers = dict(headers, **({'Content-Type': 'application/json'} if data is not None else {}))
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(urllib.request.Request(base + path, data=data, headers=headers, method=method)) as resp:
+            resp.read()
+            status = resp.status
+    except urllib.error.HTTPError as e:
+        e.read()
+        status = e.code
+    except OSError:
+        status = None
+    return time.perf_counter() - start, status in expected
+
+
+def percentile(sorted_values, fraction):
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def run_endpoint(base, builder, requests, concurrency, seed):
+    rng = random.Random(seed)
+    lock = threading.Lock()
+    prepared = [builder(rng) for _ in range(requests)]
+    results = []
+
+    def worker(request):
+        outcome = send(base, request)
+        with lock:
+            results.append(outcome)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(worker, prepared))
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(latency * 1000 for latency, _ in results)
+    return {
+        'requests': len(results),
+        'errors': sum(1 for _, ok in results if not ok),
+        'throughput_rps': round(len(results) / elapsed, 1),
+        'mean_ms': round(statistics.fmean(latencies), 2),
+        'p50_ms': round(percentile(latencies, 0.50), 2),
+        'p95_ms': round(percentile(latencies, 0.95), 2),
+        'p99_ms': round(percentile(latencies, 0.99), 2),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=API_DIR, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(result, previous_path):
+    with open(previous_path, encoding='utf-8') as f:
+        previous = json.load(f)
+    print(f"Compared with {previous.get('commit')} ({previous_path}):")
+    for name, current in result['endpoints'].items():
+        before = previous.get('endpoints', {}).get(name)
+        if not before:
+            continue
+        print(f"  {name:45} throughput {current['throughput_rps'] / before['throughput_rps'] - 1:+7.1%}"
+              f"   p95 {current['p95_ms'] / before['p95_ms'] - 1 if before['p95_ms'] else 0:+7.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test every API route')
+    parser.add_argument('--slips', type=int, default=1000)
+    parser.add_argument('--bookings', type=int, default=100000)
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--requests', type=int, default=200, help='Requests per endpoint')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--seed', type=int, default=82)
+    parser.add_argument('--only', action='append', help='Only endpoints whose name contains this (repeatable)')
+    parser.add_argument('--read-only', action='store_true', help='Skip routes that write to the database')
+    parser.add_argument('--output', default='load-results.json')
+    parser.add_argument('--compare', help='Earlier results file to compare against')
+    args = parser.parse_args()
+
+    os.environ.setdefault('POSTGRES_URL', 'sqlite:///' + DEFAULT_DB)
+    os.environ.setdefault('STRIPE_SECRET_KEY', 'sk_test_load')
+    os.environ['STRIPE_WEBHOOK_SECRET'] = WEBHOOK_SECRET
+    # Inherited by the server process, so tokens issued here are accepted there
+    os.environ.setdefault('SESSION_SECRET', 'load-test-session-secret')
+    sys.path.insert(0, API_DIR)
+    import auth
+    import database
+    import synthetic
+
+    seed_start = time.perf_counter()
+    database.ensure_schema()
+    with database.session_scope() as db:
+        added = synthetic.populate(db, slips=args.slips, bookings=args.bookings, users=args.users, seed=args.seed)
+        admin = load_admin(db)
+    seed_seconds = time.perf_counter() - seed_start
+    database.get_engine().dispose()
+
+    context = multiprocessing.get_context('spawn')
+    parent_pipe, child_pipe = context.Pipe()
+    server = context.Process(target=serve, args=(child_pipe,), daemon=True)
+    server.start()
+    base = f'http://127.0.0.1:{parent_pipe.recv()}'
+
+    scenarios = Scenarios(args.slips, args.bookings, lambda: auth.issue_token(*admin)[0]).build()
+    endpoints = {}
+    try:
+        for (method, name), builder in scenarios.items():
+            label = f'{method} {name}'
+            if args.only and not any(part in label for part in args.only):
+                continue
+            if args.read_only and name in WRITE_PATHS:
+                continue
+            endpoints[label] = run_endpoint(base, builder, args.requests, args.concurrency, args.seed)
+            print(f"{label:45} {endpoints[label]['throughput_rps']:8.1f} req/s   p50 {endpoints[label]['p50_ms']:7.2f} ms"
+                  f"   p95 {endpoints[label]['p95_ms']:7.2f} ms   p99 {endpoints[label]['p99_ms']:7.2f} ms"
+                  f"   errors {endpoints[label]['errors']}")
+    finally:
+        server.terminate()
+        server.join()
+
+    result = {
+        'commit': git_commit(),
+        'timestamp': datetime.utcnow().isoformat() + 'Z',
+        'database': os.environ['POSTGRES_URL'].split(':', 1)[0],
+        'settings': {key: getattr(args, key) for key in ('slips', 'bookings', 'users', 'requests', 'concurrency', 'seed')},
+        'seed': {'added': added, 'seconds': round(seed_seconds, 1)},
+        'endpoints': endpoints,
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(result, f, indent=2)
+    print(f'Wrote {args.output}')
+    if args.compare:
+        compare(result, args.compare)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Booking list serialization benchmark: ORM instances vs column projection
+
+Both paths read the same bookings (joined with the slip name) and encode them as
+the /api/bookings JSON body:
+    orm         select(Booking, Slip.name), per-instance booking_to_dict, json module
+    projection  serializers.BOOKING column tuples, precompiled field table, dumps()
+                (orjson when installed)
+
+Reports rows per second and peak bytes allocated per row (tracemalloc).
+
+Usage:
+    python benchmarks/serializers.py [--rows 20000] [--runs 3]
+
+POSTGRES_URL selects the database; by default a throwaway SQLite file is seeded.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'api'))
+
+
+def seed(database, rows):
+    from sqlalchemy import insert, func, select
+    db = database.open_session()
+    try:
+        if db.execute(select(func.count(database.Booking.id))).scalar_one() >= rows:
+            return
+        slip_ids = db.execute(select(database.Slip.id)).scalars().all()
+        start = datetime(2020, 1, 1)
+        batch = []
+        for i in range(rows):
+            check_in = start + timedelta(days=i // len(slip_ids) * 2)
+            batch.append({
+                'slip_id': slip_ids[i % len(slip_ids)], 'user_id': 1,
+                'guest_name': f'Guest {i}', 'guest_email': f'guest{i}@example.com', 'guest_phone': '555-0100',
+                'check_in': check_in, 'check_out': check_in + timedelta(days=1),
+                'boat_length': 30.0, 'boat_make_model': 'Sea Ray', 'user_type': 'renter',
+                'nights': 1, 'total_cost': 60.0, 'status': 'confirmed', 'booking_date': check_in,
+                'payment_status': 'paid', 'payment_method': 'stripe', 'payment_date': check_in,
+            })
+        db.execute(insert(database.Booking), batch)
+        db.commit()
+    finally:
+        db.close()
+
+
+def orm_body(database, serializers, limit):
+    from sqlalchemy import select
+    db = database.open_session()
+    try:
+        query = (
+            select(database.Booking, database.Slip.name)
+            .outerjoin(database.Slip, database.Booking.slip_id == database.Slip.id)
+            .order_by(database.Booking.id).limit(limit)
+        )
+        bookings = [serializers.booking_to_dict(booking, name) for booking, name in db.execute(query)]
+        return json.dumps({'bookings': bookings}).encode()
+    finally:
+        db.close()
+
+
+def projection_body(booking_engine, database, serializers, limit):
+    db = database.open_session()
+    try:
+        rows = db.execute(booking_engine.filtered_bookings_query().limit(limit))
+        return serializers.dumps({'bookings': [serializers.BOOKING.to_dict(row) for row in rows]})
+    finally:
+        db.close()
+
+
+def measure(func, rows, runs):
+    func()  # warm caches and compiled statements
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        'rows_per_second': round(rows / statistics.median(timings)),
+        'peak_bytes_per_row': round(peak / rows),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare ORM and column-projected booking serialization')
+    parser.add_argument('--rows', type=int, default=20000)
+    parser.add_argument('--runs', type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ.setdefault('POSTGRES_URL', 'sqlite:///' + os.path.join(tmp, 'serializers.db'))
+        import database
+        import booking_engine
+        import serializers
+        database.ensure_schema()
+        seed(database, args.rows)
+
+        result = {
+            'rows': args.rows,
+            'json_backend': 'orjson' if serializers.orjson else 'json',
+            'orm': measure(lambda: orm_body(database, serializers, args.rows), args.rows, args.runs),
+            'projection': measure(
+                lambda: projection_body(booking_engine, database, serializers, args.rows), args.rows, args.runs
+            ),
+        }
+        result['speedup'] = round(result['projection']['rows_per_second'] / result['orm']['rows_per_second'], 2)
+        database.get_engine().dispose()
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == '__main__':
+    main()
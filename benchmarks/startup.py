@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Cold start benchmark for the Python API
+
+Each run starts a fresh interpreter that imports api/index.py, serves one request
+and reports:
+    import_ms         time to import the handler module
+    first_request_ms  time from process start to the first full response
+
+Usage:
+    python benchmarks/startup.py [--runs 5] [--path /api/slips]
+
+POSTGRES_URL selects the database; by default a throwaway SQLite file is used.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+API_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'api')
+
+# Runs inside the child interpreter
+CHILD = r'''
+import json, sys, threading, time, urllib.request
+start = time.perf_counter()
+sys.path.insert(0, sys.argv[1])
+import index
+imported = time.perf_counter()
+from http.server import HTTPServer
+server = HTTPServer(('127.0.0.1', 0), index.handler)
+threading.Thread(target=server.handle_request, daemon=True).start()
+urllib.request.urlopen('http://127.0.0.1:%d%s' % (server.server_port, sys.argv[2])).read()
+done = time.perf_counter()
+print(json.dumps({'import_ms': (imported - start) * 1000, 'first_request_ms': (done - start) * 1000}))
+'''
+
+
+def run_once(path, env):
+    output = subprocess.run(
+        [sys.executable, '-c', CHILD, API_DIR, path],
+        env=env, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure API import time and time to first request')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--path', default='/api/slips')
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    env.setdefault('STRIPE_SECRET_KEY', 'sk_test_benchmark')
+    with tempfile.TemporaryDirectory() as tmp:
+        env.setdefault('POSTGRES_URL', 'sqlite:///' + os.path.join(tmp, 'startup.db'))
+
+        # The first run bootstraps the schema; later runs show the steady-state cold start
+        first = run_once(args.path, env)
+        runs = [run_once(args.path, env) for _ in range(args.runs)]
+
+    result = {
+        'path': args.path,
+        'bootstrap_run': first,
+        'runs': args.runs,
+        'import_ms_median': statistics.median(r['import_ms'] for r in runs),
+        'first_request_ms_median': statistics.median(r['first_request_ms'] for r in runs),
+    }
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == '__main__':
+    main()
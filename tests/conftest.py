@@ -0,0 +1,65 @@
+"""
+Shared setup for the API tests: api/ on the import path, a throwaway SQLite database
+a dummy Stripe key (index.py refuses to import without one) and a session secret.
+"""
+
+import os
+import sys
+import tempfile
+
+API_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'api')
+sys.path.insert(0, API_DIR)
+
+os.environ.setdefault('POSTGRES_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='dock-rental-tests-'), 'test.db'))
+os.environ.setdefault('STRIPE_SECRET_KEY', 'sk_test_dummy')
+os.environ.setdefault('SESSION_SECRET', 'test-session-secret')
+
+import json
+import threading
+import urllib.error
+import urllib.request
+import pytest
+
+
+@pytest.fixture
+def db():
+    from database import open_session
+    session = open_session()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.fixture(scope='session')
+def base_url():
+    """URL of index.handler served from a background thread"""
+    import index
+    from http.server import ThreadingHTTPServer
+    server = ThreadingHTTPServer(('127.0.0.1', 0), index.handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{server.server_port}'
+    server.shutdown()
+
+
+def add_user(db, email, user_type):
+    """(id, session token) of a new user"""
+    from auth import issue_token
+    from database import User
+    user = User(name=email, email=email, password_hash='x', user_type=user_type)
+    db.add(user)
+    db.commit()
+    return user.id, issue_token(user.id, user_type)[0]
+
+
+def post(base_url, path, body, token=None):
+    """(status, JSON body) of a POST to the API"""
+    headers = {'Content-Type': 'application/json'}
+    if token:
+        headers['Authorization'] = f'Bearer {token}'
+    request = urllib.request.Request(base_url + path, method='POST', headers=headers, data=json.dumps(body).encode())
+    try:
+        with urllib.request.urlopen(request) as response:
+            return response.status, json.load(response)
+    except urllib.error.HTTPError as e:
+        return e.code, json.load(e)
@@ -0,0 +1,40 @@
+from datetime import datetime
+import analytics
+from booking_engine import create_booking, cancel_booking
+
+
+def test_month_spans_split_nights_at_month_ends():
+    assert analytics.month_spans(datetime(2042, 1, 28).date(), datetime(2042, 3, 2).date()) == [
+        ('2042-01', 4), ('2042-02', 28), ('2042-03', 1)
+    ]
+    assert analytics.booking_slip_months(3, datetime(2042, 1, 30), datetime(2042, 2, 2)) == {
+        (3, '2042-01'), (3, '2042-02')
+    }
+
+
+def test_stay_over_a_month_end_counts_in_both_months(db):
+    booking = create_booking(db, {
+        'slipId': 1, 'checkIn': '2042-01-28T00:00:00Z', 'checkOut': '2042-02-03T00:00:00Z',
+        'bookingDate': '2042-01-01T00:00:00Z', 'guestName': 'Split', 'guestEmail': 'split@example.com',
+    })
+
+    def months():
+        result = analytics.summary(db, ('month', 'status'), '2042-01', '2042-02', slip_id=1)
+        return {(row['month'], row['status']): row for row in result['rows']}
+
+    status = booking.status
+    january, february = months()[('2042-01', status)], months()[('2042-02', status)]
+    assert (january['nights'], february['nights']) == (4, 2)
+    assert (january['bookings'], february['bookings']) == (1, 0)
+    assert january['revenue'] + february['revenue'] == round(booking.total_cost, 2)
+    assert january['revenue'] == round(booking.total_cost * 4 / 6, 2)
+    assert february['occupancyRate'] == round(2 / 28, 4)
+
+    cancel_booking(db, booking.id)
+    rows = months()
+    assert ('2042-02', status) not in rows
+    assert rows[('2042-02', 'cancelled')]['nights'] == 2
+    assert rows[('2042-02', 'cancelled')]['occupiedNights'] == 0
+    assert rows[('2042-01', 'cancelled')]['revenue'] == 0
+    totals = analytics.summary(db, ('month',), '2042-01', '2042-02', slip_id=1)['totals']
+    assert (totals['bookings'], totals['revenue']) == (1, 0)
@@ -0,0 +1,55 @@
+import asyncio
+import json
+import pytest
+
+pytest.importorskip('aiosqlite')
+
+
+def call(app, path, body):
+    """(status, JSON body) of one POST through the ASGI app"""
+    messages = [{'type': 'http.request', 'body': json.dumps(body).encode(), 'more_body': False}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {'type': 'http', 'method': 'POST', 'path': path, 'query_string': b'', 'client': ('127.0.0.1', 0),
+             'headers': [(b'content-type', b'application/json')]}
+    asyncio.run(app(scope, receive, send))
+    return sent[0]['status'], json.loads(b''.join(m.get('body', b'') for m in sent[1:]))
+
+
+def test_batch_entries_use_the_async_engine():
+    import asgi
+    import database
+
+    status, result = call(asgi.app, '/api/batch', {'requests': [
+        {'id': 'one', 'path': '/api/health'},
+        {'id': 'write', 'method': 'POST', 'path': '/api/quotes',
+         'body': {'slipIds': [1], 'ranges': [{'checkIn': '2043-01-01', 'checkOut': '2043-01-03'}]}},
+        {'id': 'slips', 'path': '/api/slips'},
+        {'id': 'calendar', 'path': '/api/availability?from=2043-01-01&days=3'},
+    ]})
+    assert status == 200
+    assert [response['status'] for response in result['responses']] == [200, 200, 200, 200]
+    # prepare() disposed the sync engine's pool; the entries must not have refilled it
+    assert database.get_engine().pool.checkedin() == 0
+
+
+def test_async_session_commits_forget_cached_calendars(monkeypatch):
+    import availability
+    from database import open_async_session
+
+    forgotten = []
+    monkeypatch.setattr(availability.calendar, 'forget', forgotten.extend)
+
+    async def commit():
+        db = open_async_session()
+        db.sync_session.info['calendar_keys'] = {(1, 2043)}
+        await db.commit()
+        await db.close()
+    asyncio.run(commit())
+    assert forgotten == [(1, 2043)]
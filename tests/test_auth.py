@@ -0,0 +1,61 @@
+import os
+import subprocess
+import sys
+import urllib.error
+import urllib.request
+import pytest
+import auth
+from conftest import API_DIR, add_user, post
+
+
+def test_tokens_round_trip_with_a_secret():
+    token, claims = auth.issue_token(7, 'renter')
+    assert auth.verify_token(token) == claims
+
+
+def test_no_tokens_issued_or_accepted_without_a_secret(monkeypatch):
+    token, _ = auth.issue_token(7, 'renter')
+    monkeypatch.setattr(auth, 'SESSIONS_ENABLED', False)
+    with pytest.raises(auth.SessionsDisabled):
+        auth.issue_token(7, 'renter')
+    with pytest.raises(auth.InvalidToken):
+        auth.verify_token(token)
+
+
+@pytest.mark.parametrize('enforced, fails', [(None, True), ('true', True), ('false', False)])
+def test_missing_secret_fails_closed_unless_enforcement_is_off(enforced, fails):
+    env = dict(os.environ, SESSION_SECRET='')
+    env.pop('AUTH_ENFORCED', None)
+    if enforced is not None:
+        env['AUTH_ENFORCED'] = enforced
+    result = subprocess.run([sys.executable, '-c', 'import auth'], cwd=API_DIR, env=env, capture_output=True, text=True)
+    assert (result.returncode != 0) == fails
+    if fails:
+        assert 'SESSION_SECRET' in result.stderr
+
+
+def get_status(base_url, path, token=None):
+    headers = {'Authorization': f'Bearer {token}'} if token else {}
+    try:
+        with urllib.request.urlopen(urllib.request.Request(base_url + path, headers=headers)) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+def test_admin_routes_are_checked_by_default(db, base_url):
+    _, renter_token = add_user(db, 'auth-renter@example.com', 'renter')
+    _, admin_token = add_user(db, 'auth-admin@example.com', 'admin')
+    body = {'slip_id': 1, 'image_url': 'https://example.com/a.jpg'}
+    assert post(base_url, '/api/update-slip-images', body)[0] == 401
+    assert post(base_url, '/api/update-slip-images', body, renter_token)[0] == 403
+    assert post(base_url, '/api/update-slip-images', body, admin_token)[0] == 200
+    assert get_status(base_url, '/api/users') == 401
+    assert get_status(base_url, '/api/users', admin_token) == 200
+
+
+def test_opting_out_relaxes_admin_reads_only(monkeypatch, base_url):
+    import index
+    monkeypatch.setattr(index, 'AUTH_ENFORCED', False)
+    assert get_status(base_url, '/api/users') == 200
+    assert post(base_url, '/api/import-bookings?dryRun=1', {'bookings': []})[0] == 401
@@ -0,0 +1,42 @@
+from datetime import datetime
+from booking_engine import parse_datetime
+
+
+def test_parse_datetime_returns_naive_utc():
+    assert parse_datetime('2031-06-01T00:00:00Z') == datetime(2031, 6, 1)
+    assert parse_datetime('2031-06-01T22:30:00-05:00') == datetime(2031, 6, 2, 3, 30)
+    assert parse_datetime('2031-06-01T08:00:00').tzinfo is None
+
+
+def test_concurrent_overlapping_bookings_only_one_wins():
+    from concurrent.futures import ThreadPoolExecutor
+    from threading import Barrier
+    from database import open_session
+    from booking_engine import create_booking, BookingConflict
+
+    writers = 8
+    barrier = Barrier(writers)
+
+    def book(index):
+        db = open_session()
+        try:
+            barrier.wait()
+            create_booking(db, {
+                'slipId': 1,
+                # Overlapping stays: every one covers the night of 2040-05-03
+                'checkIn': f'2040-05-0{1 + index % 3}T00:00:00Z',
+                'checkOut': '2040-05-04T00:00:00Z',
+                'bookingDate': '2040-01-01T00:00:00Z',
+                'guestName': f'Guest {index}',
+                'guestEmail': f'guest{index}@example.com',
+            })
+            return 'created'
+        except BookingConflict:
+            return 'conflict'
+        finally:
+            db.close()
+
+    with ThreadPoolExecutor(writers) as pool:
+        results = list(pool.map(book, range(writers)))
+    assert results.count('created') == 1
+    assert results.count('conflict') == writers - 1
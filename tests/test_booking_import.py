@@ -0,0 +1,26 @@
+from booking_import import import_bookings, prepare_rows
+
+
+def record(day, **fields):
+    return {'slipId': 1, 'guestName': 'Import', 'guestEmail': 'import@example.com',
+            'checkIn': f'2046-08-{day:02d}T00:00:00', 'checkOut': f'2046-08-{day + 2:02d}T00:00:00', **fields}
+
+
+def test_import_checks_nights_and_totals_against_the_quote(db):
+    result = import_bookings(db, [
+        record(1),
+        record(5, totalCost=120, nights=2),
+        record(9, totalCost=0),
+        record(13, nights=3),
+        # Two started days, as pricing counts them, though only one date apart
+        record(17, checkIn='2046-08-17T12:00:00', checkOut='2046-08-18T14:00:00', totalCost=120),
+    ], dry_run=True)
+    statuses = [row['status'] for row in result['rows']]
+    assert statuses == ['ok', 'ok', 'error', 'error', 'ok']
+    assert 'current price is 120' in result['rows'][2]['errors'][0]
+    assert result['rows'][3]['errors'] == ['nights is 3, expected 2']
+
+
+def test_default_nights_are_billed_nights():
+    rows, _ = prepare_rows([record(1, checkIn='2046-08-01T12:00:00', checkOut='2046-08-02T14:00:00')])
+    assert rows[0]['nights'] == 2
@@ -0,0 +1,26 @@
+from booking_engine import create_booking
+from conftest import add_user, post
+
+
+def cancel(base_url, booking_id, token=None):
+    return post(base_url, '/api/cancel-booking', {'booking_id': booking_id}, token)[0]
+
+
+def test_cancel_requires_the_owner_or_an_admin(db, base_url):
+    owner_id, owner_token = add_user(db, 'cancel-owner@example.com', 'renter')
+    _, other_token = add_user(db, 'cancel-other@example.com', 'renter')
+    _, admin_token = add_user(db, 'cancel-admin@example.com', 'admin')
+
+    def book(day):
+        return create_booking(db, {
+            'slipId': 2,
+            'checkIn': f'2041-03-{day:02d}T00:00:00Z', 'checkOut': f'2041-03-{day + 1:02d}T00:00:00Z',
+            'bookingDate': '2041-01-01T00:00:00Z', 'guestName': 'Owner', 'guestEmail': 'cancel-owner@example.com',
+        }, user_id=owner_id).id
+
+    first, second = book(1), book(5)
+    assert cancel(base_url, first) == 401
+    assert cancel(base_url, first, 'not-a-token') == 401
+    assert cancel(base_url, first, other_token) == 403
+    assert cancel(base_url, first, owner_token) == 200
+    assert cancel(base_url, second, admin_token) == 200
@@ -0,0 +1,32 @@
+from database import Booking
+from conftest import add_user, post
+
+
+def booking(day, **fields):
+    return {'booking': {
+        'slipId': 1, 'checkIn': f'2045-07-{day:02d}T00:00:00Z', 'checkOut': f'2045-07-{day + 2:02d}T00:00:00Z',
+        'bookingDate': '2045-01-01T00:00:00Z', 'guestName': 'Guest', 'guestEmail': 'guest@example.com', **fields,
+    }}
+
+
+def test_user_type_in_the_body_does_not_change_the_price(base_url):
+    status, body = post(base_url, '/api/create-booking', booking(1, userType='homeowner', totalCost=0))
+    assert status == 409
+    assert body['quote']['totalCost'] == 120
+
+
+def test_price_follows_the_session_user(db, base_url):
+    homeowner_id, homeowner_token = add_user(db, 'price-homeowner@example.com', 'homeowner')
+    status, body = post(base_url, '/api/create-booking', booking(5, totalCost=0), homeowner_token)
+    assert status == 201
+    assert body['booking']['totalCost'] == 0
+    assert db.get(Booking, body['booking']['id']).user_id == homeowner_id
+
+    _, renter_token = add_user(db, 'price-renter@example.com', 'renter')
+    status, _ = post(base_url, '/api/create-booking', booking(9, userId=homeowner_id, totalCost=0), renter_token)
+    assert status == 409
+
+    _, admin_token = add_user(db, 'price-admin@example.com', 'admin')
+    status, body = post(base_url, '/api/create-booking', booking(13, userId=homeowner_id), admin_token)
+    assert status == 201
+    assert (body['booking']['totalCost'], body['booking']['userType']) == (0, 'homeowner')
@@ -0,0 +1,36 @@
+from datetime import datetime
+import pytest
+import database
+from database import Booking, overlapping_bookings
+
+
+def test_overlapping_bookings_lists_active_conflicting_pairs(db):
+    def add(check_in, check_out, status='confirmed'):
+        booking = Booking(slip_id=2, user_id=1, guest_name='Old', guest_email='old@example.com', check_in=check_in,
+                          check_out=check_out, boat_length=20, boat_make_model='Skiff', user_type='renter',
+                          nights=(check_out - check_in).days, total_cost=0, status=status,
+                          booking_date=datetime(2044, 1, 1))
+        db.add(booking)
+        db.flush()
+        return booking.id
+
+    first = add(datetime(2044, 5, 1), datetime(2044, 5, 5))
+    second = add(datetime(2044, 5, 4), datetime(2044, 5, 8))
+    add(datetime(2044, 5, 8), datetime(2044, 5, 9))  # starts as the second ends
+    add(datetime(2044, 5, 2), datetime(2044, 5, 3), status='cancelled')
+    try:
+        pairs = overlapping_bookings(db.connection())
+    finally:
+        db.rollback()
+    assert [pair for pair in pairs if first in pair or second in pair] == [(first, second)]
+
+
+def test_failed_bootstrap_is_not_marked_ready(monkeypatch):
+    def fail():
+        raise RuntimeError('bootstrap failed')
+    monkeypatch.setattr(database, '_schema_ready', False)
+    monkeypatch.setattr(database, 'current_schema_fingerprint', lambda conn: 'outdated')
+    monkeypatch.setattr(database, 'bootstrap_schema', fail)
+    with pytest.raises(RuntimeError):
+        database.ensure_schema()
+    assert database._schema_ready is False
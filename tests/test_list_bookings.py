@@ -0,0 +1,29 @@
+import json
+import urllib.request
+from datetime import datetime, timedelta
+from sqlalchemy import func, select
+from database import Booking
+
+
+def get(base_url, path):
+    with urllib.request.urlopen(base_url + path) as response:
+        return json.load(response)
+
+
+def test_unpaged_request_returns_every_booking(db, base_url):
+    for offset in range(3):
+        check_in = datetime(2093, 1, 1) + timedelta(days=10 * offset)
+        db.add(Booking(slip_id=2, user_id=1, guest_name='List', guest_email='list@example.com', check_in=check_in,
+                       check_out=check_in + timedelta(days=2), boat_length=20, boat_make_model='Skiff',
+                       user_type='renter', nights=2, total_cost=120, status='confirmed',
+                       booking_date=datetime(2093, 1, 1)))
+    db.commit()
+    total = db.scalar(select(func.count()).select_from(Booking))
+
+    result = get(base_url, '/api/bookings')
+    assert len(result['bookings']) == total
+    assert 'nextCursor' not in result
+
+    page = get(base_url, '/api/bookings?limit=1')
+    assert len(page['bookings']) == 1
+    assert page['nextCursor'] == str(page['bookings'][0]['id'])
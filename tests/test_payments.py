@@ -0,0 +1,133 @@
+import json
+import time
+import pytest
+import stripe
+from payments import PaymentClient, booking_idempotency_key, STATUS_TTL, FINAL_STATUS_TTL
+
+
+class StripeObject(dict):
+    """Dict with attribute access, like the objects the stripe library returns"""
+    __getattr__ = dict.__getitem__
+
+
+class FakeStripe:
+    """Stands in for the stripe module: scripted PaymentIntent answers, unsigned webhooks"""
+
+    def __init__(self, retrieve_status='processing', failures=0):
+        self.retrieve_status = retrieve_status
+        self.failures = failures
+        self.calls = []
+        fake = self
+
+        class PaymentIntent:
+            @staticmethod
+            def create(amount, currency, metadata, idempotency_key):
+                fake.calls.append(('create', idempotency_key))
+                if fake.failures:
+                    fake.failures -= 1
+                    raise stripe.APIConnectionError('connection reset')
+                return StripeObject(id='pi_1', client_secret='pi_1_secret', status='requires_payment_method',
+                                    amount=amount, currency=currency)
+
+            @staticmethod
+            def retrieve(id):
+                fake.calls.append(('retrieve', id))
+                return StripeObject(id=id, status=fake.retrieve_status, amount=1000, currency='usd')
+
+        class Webhook:
+            @staticmethod
+            def construct_event(payload, signature, secret):
+                return json.loads(payload)
+
+        self.PaymentIntent = PaymentIntent
+        self.Webhook = Webhook
+
+
+def event(status, created, type='payment_intent.updated'):
+    return json.dumps({
+        'type': type,
+        'created': created,
+        'data': {'object': {'id': 'pi_1', 'status': status, 'amount': 1000, 'currency': 'usd'}},
+    })
+
+
+@pytest.fixture
+def fake():
+    return FakeStripe()
+
+
+@pytest.fixture
+def client(fake):
+    return PaymentClient(api=fake, sleep=lambda seconds: None)
+
+
+def test_late_non_final_event_does_not_replace_succeeded(client, fake):
+    client.handle_webhook(event('succeeded', 200, 'payment_intent.succeeded'), 'sig', secret='whsec')
+    client.handle_webhook(event('processing', 100, 'payment_intent.processing'), 'sig', secret='whsec')
+    assert client.get_payment_intent_status('pi_1')['status'] == 'succeeded'
+    assert fake.calls == []
+
+
+def test_older_event_does_not_replace_newer_one(client):
+    client.handle_webhook(event('requires_action', 200), 'sig', secret='whsec')
+    client.handle_webhook(event('processing', 100), 'sig', secret='whsec')
+    assert client.get_payment_intent_status('pi_1')['status'] == 'requires_action'
+
+
+def test_newer_event_replaces_older_one(client):
+    client.handle_webhook(event('processing', 100), 'sig', secret='whsec')
+    client.handle_webhook(event('succeeded', 200), 'sig', secret='whsec')
+    assert client.get_payment_intent_status('pi_1')['status'] == 'succeeded'
+
+
+def test_event_older_than_an_api_read_does_not_replace_it(client, fake):
+    client.handle_webhook(event('processing', 200), 'sig', secret='whsec')
+    client.status_cache.clear()
+    fake.retrieve_status = 'requires_action'
+    assert client.get_payment_intent_status('pi_1')['status'] == 'requires_action'
+    client.handle_webhook(event('processing', 150), 'sig', secret='whsec')
+    assert client.get_payment_intent_status('pi_1')['status'] == 'requires_action'
+
+
+def test_event_newer_than_an_api_read_replaces_it(client, fake):
+    fake.retrieve_status = 'requires_action'
+    assert client.get_payment_intent_status('pi_1')['status'] == 'requires_action'
+    client.handle_webhook(event('processing', time.time() + 60), 'sig', secret='whsec')
+    assert client.get_payment_intent_status('pi_1')['status'] == 'processing'
+
+
+def test_final_event_replaces_a_later_api_read(client, fake):
+    fake.retrieve_status = 'processing'
+    client.get_payment_intent_status('pi_1')
+    client.handle_webhook(event('succeeded', 100, 'payment_intent.succeeded'), 'sig', secret='whsec')
+    assert client.get_payment_intent_status('pi_1')['status'] == 'succeeded'
+
+
+@pytest.mark.parametrize('status, ttl', [('processing', STATUS_TTL), ('requires_action', STATUS_TTL),
+                                         ('succeeded', FINAL_STATUS_TTL)])
+def test_webhook_statuses_expire_by_finality(client, status, ttl):
+    client.handle_webhook(event(status, 100), 'sig', secret='whsec')
+    expires_at, _, _ = client.status_cache._entries['pi_1']
+    assert ttl - 1 < expires_at - time.monotonic() <= ttl
+
+
+def test_create_retries_transient_errors_with_the_same_idempotency_key(fake):
+    fake.failures = 2
+    client = PaymentClient(api=fake, max_retries=2, sleep=lambda seconds: None)
+    payment_intent = client.create_payment_intent(1000, 'pi-key')
+    assert payment_intent['id'] == 'pi_1'
+    assert fake.calls == [('create', 'pi-key')] * 3
+
+
+def test_create_gives_up_after_max_retries(fake):
+    fake.failures = 5
+    client = PaymentClient(api=fake, max_retries=1, sleep=lambda seconds: None)
+    with pytest.raises(stripe.APIConnectionError):
+        client.create_payment_intent(1000, 'pi-key')
+    assert len(fake.calls) == 2
+
+
+def test_idempotency_key_is_stable_per_booking():
+    data = {'amount': 1000, 'booking': {'slipId': 1, 'guestEmail': 'a@b.c', 'checkIn': '2031-01-01', 'checkOut': '2031-01-04'}}
+    assert booking_idempotency_key(data) == booking_idempotency_key(json.loads(json.dumps(data)))
+    assert booking_idempotency_key({'amount': 1000}) != booking_idempotency_key({'amount': 1000})
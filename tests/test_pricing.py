@@ -0,0 +1,27 @@
+from datetime import datetime, timedelta
+import pytest
+import pricing
+
+CHECK_IN = datetime(2031, 3, 1)
+
+
+def renter_quote(db, nights):
+    # Seed slip 1 costs 60 per night
+    return pricing.quote_booking(db, 1, CHECK_IN, CHECK_IN + timedelta(days=nights), 'renter')
+
+
+@pytest.mark.parametrize('nights, total', [(29, 1740.0), (30, 1080.0), (31, 1860.0)])
+def test_discount_only_for_exactly_30_nights(db, nights, total):
+    # Same rule as the frontend's calculateBookingTotal: days === 30
+    quote = renter_quote(db, nights)
+    assert quote['nights'] == nights
+    assert quote['totalCost'] == total
+
+
+def test_frontend_total_for_31_nights_is_accepted(db):
+    pricing.verify_quote(renter_quote(db, 31), 31, 31 * 60)
+
+
+def test_homeowners_pay_nothing(db):
+    quote = pricing.quote_booking(db, 1, CHECK_IN, CHECK_IN + timedelta(days=30), 'homeowner')
+    assert quote['totalCost'] == 0.0
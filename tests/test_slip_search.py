@@ -0,0 +1,26 @@
+import json
+import urllib.error
+import urllib.request
+import pytest
+
+
+def get(base_url, path):
+    """(status, JSON body) of a GET to the API"""
+    try:
+        with urllib.request.urlopen(base_url + path) as response:
+            return response.status, json.load(response)
+    except urllib.error.HTTPError as e:
+        return e.code, json.load(e)
+
+
+@pytest.mark.parametrize('dates', ['checkIn=2095-01-01', 'checkOut=2095-01-03'])
+def test_one_date_bound_is_rejected(base_url, dates):
+    status, result = get(base_url, f'/api/slips/search?{dates}')
+    assert status == 400
+    assert result['message'] == 'checkIn and checkOut must be given together'
+
+
+def test_both_date_bounds_are_accepted(base_url):
+    status, result = get(base_url, '/api/slips/search?checkIn=2095-01-01&checkOut=2095-01-03')
+    assert status == 200
+    assert result['slips']
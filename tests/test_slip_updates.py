@@ -0,0 +1,29 @@
+import re
+from sqlalchemy.dialects import postgresql
+from database import Slip
+import slip_updates
+
+
+def test_batch_update_sets_each_slips_images(db):
+    count = slip_updates.set_slip_images_batch(db, {1: ['a.jpg', 'b.jpg'], '2': ['c.jpg']})
+    assert count == 2
+    db.expire_all()
+    assert db.get(Slip, 1).images == ['a.jpg', 'b.jpg']
+    assert db.get(Slip, 2).images == ['c.jpg']
+
+
+def test_batch_update_casts_case_branches_to_jsonb_on_postgres(db):
+    captured = []
+
+    class PostgresSession:
+        def get_bind(self):
+            return type('Bind', (), {'dialect': postgresql.dialect()})()
+
+    original = slip_updates._execute
+    slip_updates._execute = lambda session, statement: captured.append(statement) or 1
+    try:
+        slip_updates.set_slip_images_batch(PostgresSession(), {1: ['a.jpg']})
+    finally:
+        slip_updates._execute = original
+    sql = str(captured[0].compile(dialect=postgresql.dialect()))
+    assert re.search(r'THEN CAST\(%\(param_\d+\)s AS JSONB\) END', sql)
@@ -0,0 +1,35 @@
+from datetime import datetime, timedelta
+import sync
+
+
+class FakePostgresSession:
+    """Answers the oldest-write-transaction query with a fixed start time"""
+
+    def __init__(self, oldest):
+        self.oldest = oldest
+
+    def get_bind(self):
+        dialect = type('Dialect', (), {'name': 'postgresql'})()
+        return type('Bind', (), {'dialect': dialect})()
+
+    def execute(self, statement):
+        assert statement is sync.OLDEST_WRITE_TRANSACTION
+        return type('Result', (), {'scalar': lambda result: self.oldest})()
+
+
+def test_settled_point_holds_back_before_the_oldest_write_transaction():
+    import_started = datetime.utcnow() - timedelta(minutes=5)
+    settled = sync.settled_point(FakePostgresSession(import_started))
+    assert settled == import_started - timedelta(seconds=sync.SYNC_SETTLE_SECONDS)
+
+
+def test_settled_point_without_open_writers_is_the_settle_window():
+    before = datetime.utcnow()
+    settled = sync.settled_point(FakePostgresSession(None))
+    assert before - timedelta(seconds=sync.SYNC_SETTLE_SECONDS + 1) < settled <= datetime.utcnow()
+
+
+def test_token_round_trip():
+    position = (datetime(2031, 1, 2, 3, 4, 5, 678), 42)
+    assert sync.decode_token(sync.encode_token(*position)) == position
+    assert sync.decode_token('0') is None